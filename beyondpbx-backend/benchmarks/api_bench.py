@@ -0,0 +1,305 @@
+# benchmarks/api_bench.py
+"""
+Benchmark de los endpoints GET de la API contra una base (p. ej. la generada
+con benchmarks.pbx_datagen).
+
+Llama a la app en el mismo proceso (TestClient, sin red) y para cada endpoint,
+y para cada período que acepte ('today', 'week', 'month'), mide:
+
+- latencia de cada petición (min, media, p50, p90, p99, max);
+- consultas SQL por petición y tiempo total dentro de MySQL, contando los
+  cursores de todos los engines (sync, async y réplicas).
+
+Una respuesta que no sea 2xx descarta el caso (se mediría la página de error)
+y se informa al final; con errores el proceso sale con código 1.
+
+Por defecto cada petición es "en frío": se vacía response_cache antes de
+cada una para medir el trabajo real y no la caché (--warm para medir con
+caché). Los procesos en segundo plano (rollups, tails) no arrancan salvo con
+--startup, para que las consultas contadas sean solo las de la petición.
+
+El resultado se guarda como JSON (benchmarks/results/ por defecto) junto con
+el commit, el tamaño del dataset y los parámetros; --compare muestra la
+diferencia contra una corrida anterior:
+
+    python -m benchmarks.api_bench --repeat 10
+    python -m benchmarks.api_bench --only dashboard --compare benchmarks/results/anterior.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+# Endpoints que no terminan (SSE) o que descargan todo el período; --include los agrega
+SKIPPED_PATHS = {
+    "/api/asternic/agents/realtime-stream",
+    "/api/calls/export",
+    "/api/dashboard/report/pdf",
+}
+DEFAULT_PERIODS = ["today", "week", "month"]
+
+
+class QueryCounter:
+    """Cuenta las consultas y el tiempo dentro de la base de todos los engines"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self._local = threading.local()
+
+    def install(self):
+        event.listen(Engine, "before_cursor_execute", self._before)
+        event.listen(Engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        self._local.started = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - getattr(self._local, "started", time.perf_counter())
+        with self._lock:
+            self.queries += 1
+            self.db_seconds += elapsed
+
+    def snapshot(self) -> Tuple[int, float]:
+        with self._lock:
+            return self.queries, self.db_seconds
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "min": round(min(values), 2),
+        "mean": round(statistics.fmean(values), 2),
+        "p50": round(percentile(values, 50), 2),
+        "p90": round(percentile(values, 90), 2),
+        "p99": round(percentile(values, 99), 2),
+        "max": round(max(values), 2),
+    }
+
+
+def sample_path_values() -> Dict[str, str]:
+    """Valores reales para los parámetros de ruta ({route_number}, {extension}...)"""
+    from database import SessionLocal
+    queries = {
+        # /incoming-routes/{route_number} busca por cidnum, no por DID
+        "route_number": "SELECT cidnum FROM asterisk.incoming WHERE cidnum != '' LIMIT 1",
+        "extension": "SELECT extension FROM asterisk.users LIMIT 1",
+        "agent_extension": "SELECT extension FROM asterisk.users LIMIT 1",
+        "queue_id": "SELECT name FROM asterisk.queues LIMIT 1",
+    }
+    values = {}
+    db = SessionLocal()
+    try:
+        for name, sql in queries.items():
+            try:
+                value = db.execute(text(sql)).scalar()
+            except Exception:
+                db.rollback()
+                value = None
+            if value:
+                values[name] = str(value)
+    finally:
+        db.close()
+    return values
+
+
+def dataset_info() -> Dict[str, Optional[int]]:
+    from database import SessionLocal
+    tables = ["asteriskcdrdb.cdr", "asteriskcdrdb.queuelog", "qstats.agent_activity", "qstats.sqlrealtime"]
+    info: Dict[str, Optional[int]] = {}
+    db = SessionLocal()
+    try:
+        for table in tables:
+            try:
+                info[table] = db.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+            except Exception:
+                db.rollback()
+                info[table] = None
+    finally:
+        db.close()
+    return info
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def build_cases(app, include: List[str], only: List[str]) -> List[Tuple[str, str, Dict[str, str]]]:
+    """(nombre, path, query params) por endpoint GET y período"""
+    from fastapi.routing import APIRoute
+
+    path_values = sample_path_values()
+    cases, seen = [], set()
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or "GET" not in route.methods:
+            continue
+        if route.path in seen or (route.path in SKIPPED_PATHS and route.path not in include):
+            continue
+        if only and not any(fragment in route.path for fragment in only):
+            continue
+        seen.add(route.path)
+
+        path = route.path
+        missing = False
+        for param in route.dependant.path_params:
+            if param.name not in path_values:
+                missing = True
+                break
+            path = path.replace("{" + param.name + "}", path_values[param.name])
+        if missing:
+            print(f"Se omite {route.path}: no hay valor de ejemplo para sus parámetros de ruta")
+            continue
+
+        period = next((p for p in route.dependant.query_params if p.name == "period"), None)
+        if period is None:
+            cases.append((route.path, path, {}))
+            continue
+        extra = period.field_info.json_schema_extra
+        periods = extra.get("enum") if isinstance(extra, dict) and extra.get("enum") else DEFAULT_PERIODS
+        for value in periods:
+            cases.append((f"{route.path}?period={value}", path, {"period": value}))
+    return cases
+
+
+def run(args) -> Dict[str, Any]:
+    counter = QueryCounter()
+    counter.install()
+
+    from fastapi.testclient import TestClient
+    from main import app
+    from services.response_cache import response_cache
+
+    client = TestClient(app, raise_server_exceptions=False)
+    if args.startup:
+        client.__enter__()
+        time.sleep(args.settle)
+
+    results, failed = [], []
+    try:
+        for name, path, params in build_cases(app, args.include, args.only):
+            latencies, queries, db_ms, statuses = [], [], [], {}
+            error = None
+            for i in range(args.warmup + args.repeat):
+                if not args.warm:
+                    response_cache.invalidate()
+                before_queries, before_db = counter.snapshot()
+                started = time.perf_counter()
+                response = client.get(path, params=params)
+                elapsed = (time.perf_counter() - started) * 1000
+                after_queries, after_db = counter.snapshot()
+                if not 200 <= response.status_code < 300:
+                    error = {"endpoint": name, "path": path, "params": params,
+                             "status": response.status_code, "body": response.text[:300]}
+                    break
+                if i < args.warmup:
+                    continue
+                latencies.append(elapsed)
+                queries.append(after_queries - before_queries)
+                db_ms.append((after_db - before_db) * 1000)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+            if error is not None:
+                failed.append(error)
+                print(f"{name:60} ERROR {error['status']}: {error['body']}", flush=True)
+                continue
+
+            entry = {
+                "endpoint": name,
+                "path": path,
+                "params": params,
+                "status": {str(code): count for code, count in sorted(statuses.items())},
+                "latency_ms": summarize(latencies),
+                "queries": {"mean": round(statistics.fmean(queries), 2), "max": max(queries)},
+                "db_ms": summarize(db_ms),
+            }
+            results.append(entry)
+            print(f"{name:60} {entry['latency_ms']['p50']:9.1f} ms p50 {entry['latency_ms']['p90']:9.1f} ms p90 "
+                  f"{entry['queries']['mean']:6.1f} consultas  {entry['status']}", flush=True)
+    finally:
+        if args.startup:
+            client.__exit__(None, None, None)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "repeat": args.repeat,
+            "warmup": args.warmup,
+            "cache": "warm" if args.warm else "cold",
+            "startup": args.startup,
+            "dataset": dataset_info(),
+        },
+        "results": results,
+        "failed": failed,
+    }
+
+
+def compare(current: Dict[str, Any], previous_path: str):
+    with open(previous_path, encoding="utf-8") as f:
+        previous = {r["endpoint"]: r for r in json.load(f)["results"]}
+    print(f"\nComparación contra {previous_path} (p50 / consultas):")
+    for result in current["results"]:
+        before = previous.get(result["endpoint"])
+        if before is None:
+            continue
+        old_p50, new_p50 = before["latency_ms"]["p50"], result["latency_ms"]["p50"]
+        change = (new_p50 - old_p50) / old_p50 * 100 if old_p50 else 0.0
+        print(f"{result['endpoint']:60} {old_p50:9.1f} -> {new_p50:9.1f} ms ({change:+6.1f}%)  "
+              f"{before['queries']['mean']:5.1f} -> {result['queries']['mean']:5.1f} consultas")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de los endpoints GET de la API")
+    parser.add_argument("--repeat", type=int, default=5, help="Peticiones medidas por caso")
+    parser.add_argument("--warmup", type=int, default=1, help="Peticiones previas que no se miden")
+    parser.add_argument("--warm", action="store_true", help="No vaciar response_cache entre peticiones")
+    parser.add_argument("--startup", action="store_true", help="Arrancar los procesos en segundo plano")
+    parser.add_argument("--settle", type=float, default=5.0, help="Segundos de espera tras --startup")
+    parser.add_argument("--only", action="append", default=[], help="Solo paths que contengan este texto")
+    parser.add_argument("--include", action="append", default=[], help="Incluir un path omitido por defecto")
+    parser.add_argument("--out", default=None, help="Archivo JSON de salida")
+    parser.add_argument("--compare", default=None, help="JSON de una corrida anterior")
+    args = parser.parse_args()
+
+    report = run(args)
+
+    out = args.out or os.path.join(
+        os.path.dirname(__file__), "results", f"api-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados en {out}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+    if report["failed"]:
+        print(f"\n{len(report['failed'])} casos con respuesta no 2xx (no medidos):")
+        for error in report["failed"]:
+            print(f"  {error['status']} {error['endpoint']} ({error['path']})")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
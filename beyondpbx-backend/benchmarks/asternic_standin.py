@@ -0,0 +1,155 @@
+# benchmarks/asternic_standin.py
+"""
+Servidor local que imita la API HTTP de Asternic (/api/agents, /api/queues,
+/api/agent-stats) con autenticación Basic y una latencia configurable.
+
+Sirve para levantar el backend sin acceso a Asternic:
+
+    python -m benchmarks.asternic_standin --port 8089 --latency 0.3
+    ASTERNIC_URL=http://127.0.0.1:8089 uvicorn main:app
+
+Con --check arranca el servidor en un hilo, llama al cliente compartido
+(services.asternic_client) y muestra el tiempo de las llamadas en serie
+contra el fan-out en paralelo y la reutilización de conexiones:
+
+    python -m benchmarks.asternic_standin --check --latency 0.3
+
+Los tests (tests/test_asternic_client.py) lo arrancan con start_server() en un
+puerto libre. Parámetros de la query para forzar casos concretos: ?delay=<s>
+cambia la latencia de esa petición y ?status=<código> responde ese código.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+AGENTS = [
+    {"extension": str(1000 + i), "name": f"Agente {i}",
+     "status": ("available", "busy", "paused", "offline")[i % 4]}
+    for i in range(20)
+]
+
+QUEUES = [
+    {"name": str(400 + i), "waiting": i % 3, "answered": 50 + i, "abandoned": i,
+     "agentsloggedin": 5, "agentsavailable": 2, "longestwait": 10 * i}
+    for i in range(5)
+]
+
+
+def make_handler(user: str, password: str, latency: float):
+    expected = "Basic " + base64.b64encode(f"{user}:{password}".encode()).decode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+        connections = set()
+        requests = 0
+        # Código que se responde a todas las peticiones autenticadas (p. ej. 503 para simular una caída)
+        fail_status = None
+
+        def do_GET(self):
+            Handler.connections.add(self.client_address)
+            Handler.requests += 1
+            if self.headers.get("Authorization") != expected:
+                return self._send(401, {"error": "unauthorized"})
+
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            time.sleep(float(query.get("delay", [latency])[0]))
+            status = int(query.get("status", [Handler.fail_status or 0])[0])
+            if status:
+                return self._send(status, {"error": f"status {status}"})
+            if url.path.endswith("/api/agents"):
+                return self._send(200, {"agents": AGENTS})
+            if url.path.endswith("/api/queues"):
+                return self._send(200, {"queues": QUEUES})
+            if url.path.endswith("/api/agent-stats"):
+                agent = query.get("agent", [""])[0]
+                return self._send(200, {"agent": agent, "calls": 12, "talk_time": 3600})
+            return self._send(404, {"error": "not found"})
+
+        def _send(self, status: int, body: dict):
+            payload = json.dumps(body).encode()
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            except (BrokenPipeError, ConnectionResetError):
+                # El cliente ya cortó (timeout por llamada); no hay a quién responder
+                self.close_connection = True
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(port: int = 0, latency: float = 0.0,
+                 user: str = "adminbeyond", password: str = "adminbeyond"):
+    """Arranca el servidor en un hilo; port=0 elige un puerto libre. Devuelve (server, Handler)"""
+    handler = make_handler(user, password, latency)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, handler
+
+
+async def run_check(port: int):
+    # La configuración del cliente se lee al importarlo
+    os.environ["ASTERNIC_URL"] = f"http://127.0.0.1:{port}"
+    from services import asternic_client
+
+    await asternic_client.get_json("/api/queues")  # Abre la conexión
+
+    start = time.perf_counter()
+    await asternic_client.get_json("/api/agents")
+    await asternic_client.get_json("/api/queues")
+    serial = time.perf_counter() - start
+
+    start = time.perf_counter()
+    agents, queues = await asternic_client.fetch_many("/api/agents", "/api/queues")
+    parallel = time.perf_counter() - start
+
+    print(f"En serie:   {serial * 1000:7.1f} ms")
+    print(f"En paralelo: {parallel * 1000:6.1f} ms  "
+          f"({len(agents['agents'])} agentes, {len(queues['queues'])} colas)")
+
+    try:
+        await asternic_client.get_json("/api/agents", timeout=0.01)
+    except asternic_client.AsternicError as e:
+        print(f"Timeout por llamada: {e}")
+
+    await asternic_client.close_asternic_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita la API de Asternic")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.2, help="Segundos de espera por petición")
+    parser.add_argument("--user", default=os.getenv("ASTERNIC_USER", "adminbeyond"))
+    parser.add_argument("--password", default=os.getenv("ASTERNIC_PASS", "adminbeyond"))
+    parser.add_argument("--check", action="store_true", help="Ejecuta el cliente contra el servidor y sale")
+    args = parser.parse_args()
+
+    if not args.check:
+        handler = make_handler(args.user, args.password, args.latency)
+        server = ThreadingHTTPServer(("127.0.0.1", args.port), handler)
+        print(f"Asternic local en http://127.0.0.1:{args.port} (latencia {args.latency}s)")
+        server.serve_forever()
+        return
+
+    server, handler = start_server(args.port, args.latency, args.user, args.password)
+    try:
+        asyncio.run(run_check(args.port))
+        print(f"Conexiones TCP usadas: {len(handler.connections)}")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,712 @@
+# benchmarks/pbx_datagen.py
+"""
+Generador de datos sintéticos de una central FreePBX + Asternic para medir el
+backend sin acceso a la central real.
+
+Llena, con una semilla fija (mismos parámetros = mismos datos):
+
+- asteriskcdrdb.cdr y asteriskcdrdb.queuelog;
+- qstats.agent_activity, agent_activity_session, agent_activity_pause,
+  agent_activity_deferpause y sqlrealtime;
+- catálogos: qstats.queuenames/agentnames/pauses/qevent/qname/qagent y
+  asterisk.users/sip/trunks/queues/queue_members/ivr_details/ivr_entries/incoming.
+
+Las llamadas siguen una curva diaria (picos de oficina, fines de semana más
+bajos) y una mezcla de entrantes a cola (algunas pasando por IVR), salientes e
+internas. Como en FreePBX, cada llamada deja una sola fila de cdr con su
+destino final; la opción marcada en un IVR no se registra. Las de cola generan la secuencia de eventos de Asterisk
+(ENTERQUEUE, RINGNOANSWER, CONNECT, COMPLETE*/TRANSFER, ABANDON,
+EXITWITHTIMEOUT) con esperas y conversaciones de distribución exponencial /
+lognormal. Los eventos se escriben en orden de tiempo, así que los ids crecen
+con el tiempo como en producción (lo necesitan las marcas de agua).
+
+Destino: una base MySQL/MariaDB local (--url, por defecto la de .env) o un
+archivo .sql / .sql.gz para cargarlo con `mysql < archivo`. Los esquemas usan
+SQL propio de MySQL (REGEXP, ON DUPLICATE KEY, esquemas cruzados), así que no
+hay un sustituto embebido tipo SQLite.
+
+Uso (desde beyondpbx-backend):
+
+    python -m benchmarks.pbx_datagen --calls 100000 --queues 8 --agents 40 --days 30 --reset
+    python -m benchmarks.pbx_datagen --calls 10000 --sql-out /tmp/pbx.sql.gz
+
+Para no tocar una central real, se niega a escribir en una base cuya tabla cdr
+ya tenga filas salvo con --reset (borra y recrea las tablas de arriba) o
+--append.
+"""
+import argparse
+import gzip
+import heapq
+import math
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import mysql
+from sqlalchemy.schema import CreateTable
+
+from models import (
+    AgentActivity, AgentActivityDeferPause, AgentActivityPause, AgentActivitySession, AgentName,
+    IVRDetail, IVREntry, Pause, QAgent, QEvent, QName, Queue, QueueLog, QueueMember,
+    QueueName, SIP, SQLRealtime, Trunk, User
+)
+
+# La tabla cdr del modelo solo declara las columnas que usa el ORM; los routers
+# consultan además dcontext, channel, lastapp... así que se crea con el DDL de FreePBX
+CDR_DDL = """
+CREATE TABLE IF NOT EXISTS asteriskcdrdb.cdr (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    calldate DATETIME NOT NULL,
+    clid VARCHAR(80) NOT NULL DEFAULT '',
+    src VARCHAR(80) NOT NULL DEFAULT '',
+    dst VARCHAR(80) NOT NULL DEFAULT '',
+    dcontext VARCHAR(80) NOT NULL DEFAULT '',
+    channel VARCHAR(80) NOT NULL DEFAULT '',
+    dstchannel VARCHAR(80) NOT NULL DEFAULT '',
+    lastapp VARCHAR(80) NOT NULL DEFAULT '',
+    lastdata VARCHAR(80) NOT NULL DEFAULT '',
+    duration INT NOT NULL DEFAULT 0,
+    billsec INT NOT NULL DEFAULT 0,
+    disposition VARCHAR(45) NOT NULL DEFAULT '',
+    amaflags INT NOT NULL DEFAULT 0,
+    accountcode VARCHAR(20) NOT NULL DEFAULT '',
+    uniqueid VARCHAR(32) NOT NULL DEFAULT '',
+    userfield VARCHAR(255) NOT NULL DEFAULT '',
+    did VARCHAR(50) NOT NULL DEFAULT '',
+    recordingfile VARCHAR(255) NOT NULL DEFAULT '',
+    cnum VARCHAR(80) NOT NULL DEFAULT '',
+    cnam VARCHAR(80) NOT NULL DEFAULT '',
+    outbound_cnum VARCHAR(80) NOT NULL DEFAULT '',
+    outbound_cnam VARCHAR(80) NOT NULL DEFAULT '',
+    dst_cnam VARCHAR(80) NOT NULL DEFAULT '',
+    linkedid VARCHAR(32) NOT NULL DEFAULT '',
+    peeraccount VARCHAR(80) NOT NULL DEFAULT '',
+    sequence INT NOT NULL DEFAULT 0,
+    KEY calldate (calldate),
+    KEY dst (dst),
+    KEY did (did),
+    KEY uniqueid (uniqueid),
+    KEY dcontext (dcontext)
+)
+"""
+
+# El modelo declara solo cidnum como llave; en FreePBX la llave es (cidnum, extension)
+# y las rutas sin CID (cidnum vacío) se repiten
+INCOMING_DDL = """
+CREATE TABLE IF NOT EXISTS asterisk.incoming (
+    cidnum VARCHAR(50) NOT NULL DEFAULT '',
+    extension VARCHAR(50) NOT NULL,
+    destination VARCHAR(255),
+    description VARCHAR(255),
+    alertinfo VARCHAR(255),
+    mohclass VARCHAR(80) NOT NULL DEFAULT 'default',
+    ringing VARCHAR(80),
+    delay_answer INT,
+    pricid INT,
+    rvolume VARCHAR(5),
+    PRIMARY KEY (cidnum, extension)
+)
+"""
+
+CDR_COLUMNS = ("calldate", "clid", "src", "dst", "dcontext", "channel", "dstchannel", "lastapp",
+               "duration", "billsec", "disposition", "uniqueid", "did", "recordingfile", "cnum",
+               "linkedid", "sequence")
+QUEUELOG_COLUMNS = ("time", "callid", "queuename", "serverid", "agent", "event",
+                    "data1", "data2", "data3", "data4", "data5")
+ACTIVITY_COLUMNS = ("datetime", "queue", "agent", "event", "data", "lastedforseconds",
+                    "uniqueid", "computed", "info1", "info2")
+
+# Tablas que genera (y que --reset borra), además de cdr e incoming
+MODEL_TABLES = [
+    QueueLog, AgentActivity, AgentActivitySession, AgentActivityPause, AgentActivityDeferPause,
+    SQLRealtime, QueueName, AgentName, Pause, QEvent, QName, QAgent,
+    User, SIP, Trunk, Queue, QueueMember, IVRDetail, IVREntry
+]
+
+QUEUE_EVENTS = ["ENTERQUEUE", "CONNECT", "COMPLETEAGENT", "COMPLETECALLER", "TRANSFER", "ABANDON",
+                "EXITWITHTIMEOUT", "EXITWITHKEY", "EXITEMPTY", "RINGNOANSWER", "RINGCANCELED",
+                "ADDMEMBER", "REMOVEMEMBER", "PAUSE", "UNPAUSE", "AGENTLOGIN", "AGENTLOGOFF"]
+PAUSE_REASONS = ["Almuerzo", "Baño", "Capacitación", "Reunión", "Backoffice"]
+FIRST_NAMES = ["Ana", "Luis", "María", "Jorge", "Sofía", "Carlos", "Lucía", "Pedro", "Elena", "Diego"]
+LAST_NAMES = ["García", "López", "Martínez", "Hernández", "Pérez", "Sánchez", "Ramírez", "Torres"]
+
+# Peso relativo de cada hora del día (pico de 10 a 13 y de 16 a 18)
+HOUR_WEIGHTS = [0.2, 0.1, 0.1, 0.1, 0.1, 0.2, 0.5, 1.5, 4, 6, 8, 8, 7, 5, 6, 7, 7, 6, 4, 2, 1.2, 0.8, 0.5, 0.3]
+WEEKDAY_WEIGHTS = [1.0, 1.0, 1.0, 1.0, 0.95, 0.45, 0.2]
+
+
+def php_serialize(data: Dict[str, Any]) -> str:
+    """Serialización PHP mínima (array de strings/enteros/floats) para sqlrealtime"""
+    parts = []
+    for key, value in data.items():
+        parts.append(f's:{len(key.encode())}:"{key}";')
+        if isinstance(value, float):
+            parts.append(f"d:{value};")
+        elif isinstance(value, int):
+            parts.append(f"i:{value};")
+        else:
+            value = str(value)
+            parts.append(f's:{len(value.encode())}:"{value}";')
+    return f"a:{len(data)}:{{{''.join(parts)}}}"
+
+
+class Sink:
+    """Destino de las filas: base de datos o archivo .sql"""
+
+    def execute(self, statement: str):
+        raise NotImplementedError
+
+    def insert(self, table: str, columns: Sequence[str], rows: List[Sequence[Any]]):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MySQLSink(Sink):
+    def __init__(self, url: str):
+        self.engine = create_engine(url, pool_pre_ping=True)
+        self.conn = self.engine.raw_connection()
+
+    def execute(self, statement: str):
+        cursor = self.conn.cursor()
+        cursor.execute(statement)
+        self.conn.commit()
+
+    def scalar(self, statement: str) -> Any:
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(statement)
+            row = cursor.fetchone()
+            return row[0] if row else None
+        except Exception:
+            self.conn.rollback()
+            return None
+
+    def insert(self, table: str, columns: Sequence[str], rows: List[Sequence[Any]]):
+        cursor = self.conn.cursor()
+        # pymysql convierte executemany de un INSERT ... VALUES en inserts multi-fila
+        cursor.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+            rows
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+        self.engine.dispose()
+
+
+class SQLFileSink(Sink):
+    def __init__(self, path: str):
+        import pymysql.converters
+        self._escape = pymysql.converters.escape_item
+        self.file = gzip.open(path, "wt", encoding="utf-8") if path.endswith(".gz") else open(path, "w", encoding="utf-8")
+
+    def execute(self, statement: str):
+        self.file.write(statement.strip().rstrip(";") + ";\n")
+
+    def insert(self, table: str, columns: Sequence[str], rows: List[Sequence[Any]]):
+        values = ",\n".join(
+            "(" + ", ".join(self._escape(value, "utf8mb4") for value in row) + ")" for row in rows
+        )
+        self.file.write(f"INSERT INTO {table} ({', '.join(columns)}) VALUES\n{values};\n")
+
+    def close(self):
+        self.file.close()
+
+
+class BufferedWriter:
+    """Acumula filas por tabla y las manda al destino en lotes"""
+
+    def __init__(self, sink: Sink, batch_size: int):
+        self.sink = sink
+        self.batch_size = batch_size
+        self._buffers: Dict[str, Tuple[Sequence[str], List[Sequence[Any]]]] = {}
+        self.counts: Dict[str, int] = {}
+
+    def add(self, table: str, columns: Sequence[str], row: Sequence[Any]):
+        buffer = self._buffers.setdefault(table, (columns, []))[1]
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self._flush(table)
+
+    def add_many(self, table: str, columns: Sequence[str], rows: Iterable[Sequence[Any]]):
+        for row in rows:
+            self.add(table, columns, row)
+
+    def _flush(self, table: str):
+        columns, rows = self._buffers[table]
+        if rows:
+            self.sink.insert(table, columns, rows)
+            self.counts[table] = self.counts.get(table, 0) + len(rows)
+            self._buffers[table] = (columns, [])
+
+    def flush(self):
+        for table in list(self._buffers):
+            self._flush(table)
+
+
+class PBXModel:
+    """Catálogo sintético: colas, agentes, DIDs, IVRs y troncales"""
+
+    def __init__(self, rng: random.Random, queues: int, agents: int, ivrs: int, dids: int):
+        self.queues = [str(400 + i) for i in range(queues)]
+        self.queue_names = {q: f"Cola {q}" for q in self.queues}
+        self.agents = [str(1000 + i) for i in range(agents)]
+        self.agent_names = {
+            ext: f"{FIRST_NAMES[i % len(FIRST_NAMES)]} {LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]} {ext}"
+            for i, ext in enumerate(self.agents)
+        }
+        # Cada agente atiende 1 a 3 colas
+        self.members: Dict[str, List[str]] = {q: [] for q in self.queues}
+        for i, ext in enumerate(self.agents):
+            for q in rng.sample(self.queues, k=min(len(self.queues), 1 + i % 3)):
+                self.members[q].append(ext)
+        for q in self.queues:
+            if not self.members[q]:
+                self.members[q].append(rng.choice(self.agents))
+
+        self.ivrs = list(range(1, ivrs + 1))
+        self.ivr_options: Dict[int, Dict[str, str]] = {}
+        for ivr_id in self.ivrs:
+            options = {}
+            for selection in ("1", "2", "3"):
+                options[selection] = f"ext-queues,{rng.choice(self.queues)},1"
+            options["9"] = f"from-did-direct,{rng.choice(self.agents)},1"
+            options["t"] = "app-blackhole,hangup,1"
+            self.ivr_options[ivr_id] = options
+
+        # Cada DID va a una cola o a un IVR
+        self.dids: Dict[str, str] = {}
+        for i in range(dids):
+            did = f"55{rng.randint(10000000, 99999999)}"
+            if self.ivrs and i % 3 == 0:
+                self.dids[did] = f"ivr-{self.ivrs[(i // 3) % len(self.ivrs)]},s,1"
+            else:
+                self.dids[did] = f"ext-queues,{self.queues[i % len(self.queues)]},1"
+        self.did_list = list(self.dids)
+        # Y una ruta por CID sobre un DID de cola (clientes preferentes a otra cola)
+        queue_did = next((did for did, dest in self.dids.items() if dest.startswith("ext-queues,")), None)
+        self.cid_routes: Dict[Tuple[str, str], str] = {}
+        if queue_did is not None:
+            self.cid_routes[("5215550001000", queue_did)] = f"ext-queues,{self.queues[-1]},1"
+        self.trunks = ["TelcoA", "TelcoB", "SIPProvider"]
+
+
+def catalog_rows(pbx: PBXModel, rng: random.Random) -> Dict[str, Tuple[Sequence[str], List[Sequence[Any]]]]:
+    pauses = [(str(i + 1), name) for i, name in enumerate(PAUSE_REASONS)]
+    return {
+        "qstats.queuenames": (("device", "queue"), [(q, pbx.queue_names[q]) for q in pbx.queues]),
+        "qstats.agentnames": (("device", "agent"), [(f"SIP/{ext}", pbx.agent_names[ext]) for ext in pbx.agents]),
+        "qstats.pauses": (("pause_id", "pause_name"), pauses),
+        "qstats.qevent": (("event_id", "event"), [(i + 1, e) for i, e in enumerate(QUEUE_EVENTS)]),
+        "qstats.qname": (("queue_id", "queue"), [(i + 1, q) for i, q in enumerate(pbx.queues)]),
+        "qstats.qagent": (("agent_id", "agent", "disabled"),
+                          [(i + 1, f"SIP/{ext}", 0) for i, ext in enumerate(pbx.agents)]),
+        "asterisk.users": (("extension", "name"), [(ext, pbx.agent_names[ext]) for ext in pbx.agents]),
+        "asterisk.sip": (("id", "keyword", "data", "flags"),
+                         [row for ext in pbx.agents for row in (
+                             (ext, "host", "dynamic", 0), (ext, "context", "from-internal", 0),
+                             (ext, "secret", f"s{rng.randint(100000, 999999)}", 0))]),
+        "asterisk.trunks": (("trunkid", "name", "tech", "channelid", "disabled"),
+                            [(i + 1, name, "pjsip", name.lower(), "off") for i, name in enumerate(pbx.trunks)]),
+        "asterisk.queues": (("name", "strategy", "timeout", "servicelevel", "maxlen", "wrapuptime",
+                             "musiconhold", "context", "retry", "weight"),
+                            [(q, rng.choice(["ringall", "rrmemory", "leastrecent"]), 15, 60, 0, 5,
+                              "default", "", 5, 0) for q in pbx.queues]),
+        "asterisk.queue_members": (("membername", "queue_name", "interface", "penalty", "paused", "state_interface"),
+                                   [(pbx.agent_names[ext], q, f"Local/{ext}@from-queue/n", 0, 0, f"PJSIP/{ext}")
+                                    for q in pbx.queues for ext in pbx.members[q]]),
+        "asterisk.ivr_details": (("id", "name", "description", "directdial", "timeout_time"),
+                                 [(ivr_id, f"IVR {ivr_id}", f"Menú principal {ivr_id}", "ext-local", 10)
+                                  for ivr_id in pbx.ivrs]),
+        "asterisk.ivr_entries": (("ivr_id", "selection", "dest", "ivr_ret"),
+                                 [(ivr_id, sel, dest, 0) for ivr_id, options in pbx.ivr_options.items()
+                                  for sel, dest in options.items()]),
+        "asterisk.incoming": (("cidnum", "extension", "destination", "description", "delay_answer"),
+                              [("", did, dest, f"DID {did}", 0) for did, dest in pbx.dids.items()]
+                              + [(cid, did, dest, f"DID {did} CID {cid}", 0)
+                                 for (cid, did), dest in pbx.cid_routes.items()]),
+    }
+
+
+class CallGenerator:
+    """Genera las filas de cdr, queuelog y agent_activity llamada por llamada"""
+
+    def __init__(self, pbx: PBXModel, rng: random.Random, mean_wait: float, mean_talk: float,
+                 abandon_rate: float):
+        self.pbx = pbx
+        self.rng = rng
+        self.mean_wait = mean_wait
+        self.mean_talk = mean_talk
+        self.abandon_rate = abandon_rate
+        self.seq = 0
+        # Eventos pendientes en orden de tiempo: (time, seq, tabla, fila)
+        self.pending: List[Tuple[datetime, int, str, Tuple]] = []
+
+    def _emit(self, when: datetime, table: str, row: Tuple):
+        self.seq += 1
+        heapq.heappush(self.pending, (when, self.seq, table, row))
+
+    def drain(self, until: Optional[datetime] = None) -> Iterable[Tuple[str, Tuple]]:
+        """Filas con tiempo < until (todas si until es None), en orden de tiempo"""
+        while self.pending and (until is None or self.pending[0][0] < until):
+            _, _, table, row = heapq.heappop(self.pending)
+            yield table, row
+
+    def _uniqueid(self, when: datetime) -> str:
+        self.seq += 1
+        return f"{int(when.timestamp())}.{self.seq}"
+
+    @staticmethod
+    def _seconds(start: datetime, end: datetime) -> int:
+        return int((end - start).total_seconds())
+
+    def _talk(self) -> int:
+        # Lognormal con media ~mean_talk
+        sigma = 0.8
+        mu = math.log(self.mean_talk) - sigma ** 2 / 2
+        return max(5, int(self.rng.lognormvariate(mu, sigma)))
+
+    def _cdr(self, start: datetime, end: datetime, **fields):
+        row = {"clid": "", "src": "", "dst": "", "dcontext": "", "channel": "", "dstchannel": "",
+               "lastapp": "", "duration": 0, "billsec": 0, "disposition": "ANSWERED", "uniqueid": "",
+               "did": "", "recordingfile": "", "cnum": "", "linkedid": "", "sequence": 0}
+        row.update(fields)
+        row["calldate"] = start
+        self._emit(end, "asteriskcdrdb.cdr", tuple(row[c] for c in CDR_COLUMNS))
+
+    def _queuelog(self, when: datetime, callid: str, queue: str, agent: str, event: str, *data: Any):
+        values = [str(v) for v in data] + [""] * (5 - len(data))
+        self._emit(when, "asteriskcdrdb.queuelog", (when, callid, queue, "", agent, event, *values))
+
+    def _activity(self, when: datetime, queue: str, agent: str, event: str, lasted: int,
+                  uniqueid: str = "", data: str = ""):
+        self._emit(when, "qstats.agent_activity", (when, queue, agent, event, data, lasted, uniqueid, 1, "", ""))
+
+    def call(self, start: datetime):
+        kind = self.rng.random()
+        if kind < 0.6:
+            self.inbound(start)
+        elif kind < 0.85:
+            self.outbound(start)
+        else:
+            self.internal(start)
+
+    def inbound(self, start: datetime):
+        rng, pbx = self.rng, self.pbx
+        did = rng.choice(pbx.did_list)
+        caller = f"55{rng.randint(10000000, 99999999)}"
+        uniqueid = self._uniqueid(start)
+        dest = pbx.dids[did]
+        at = start
+        # Como en FreePBX, cada llamada deja una sola fila de cdr con su destino final
+        # (dcontext/dst); la tecla marcada en el IVR no queda registrada
+        call = dict(clid=caller, src=caller, channel=f"PJSIP/trunk-{uniqueid}", uniqueid=uniqueid,
+                    did=did, cnum=caller, linkedid=uniqueid)
+
+        if dest.startswith("ivr-"):
+            ivr_id = int(dest.split(",")[0][4:])
+            ivr_time = rng.randint(5, 25)
+            at = start + timedelta(seconds=ivr_time)
+            if rng.random() < 0.08:
+                # Cuelga dentro del IVR sin marcar: la fila conserva el contexto del IVR
+                self._cdr(start, at, dst="s", dcontext=f"ivr-{ivr_id}", lastapp="BackGround",
+                          duration=ivr_time, billsec=ivr_time, **call)
+                return
+            dest = pbx.ivr_options[ivr_id][rng.choice(list(pbx.ivr_options[ivr_id]))]
+            context, exten, _ = dest.split(",")
+            if context == "from-did-direct":
+                talk = self._talk()
+                self._cdr(start, at + timedelta(seconds=talk), dst=exten, dcontext=context,
+                          dstchannel=f"PJSIP/{exten}-{self.seq:08x}", lastapp="Dial",
+                          duration=ivr_time + talk, billsec=ivr_time + talk, **call)
+                return
+            if context != "ext-queues":
+                self._cdr(start, at, dst=exten, dcontext=context, lastapp="Hangup",
+                          duration=ivr_time, billsec=ivr_time, **call)
+                return
+
+        queue = dest.split(",")[1]
+        position = rng.randint(1, 6)
+        self._queuelog(at, uniqueid, queue, "NONE", "ENTERQUEUE", "", caller, position)
+        wait = int(rng.expovariate(1 / self.mean_wait))
+        members = pbx.members[queue]
+
+        outcome = rng.random()
+        if outcome < self.abandon_rate:
+            end = at + timedelta(seconds=wait)
+            self._queuelog(end, uniqueid, queue, "NONE", "ABANDON", position, position, wait)
+            self._cdr(start, end, dst=queue, dcontext="ext-queues", lastapp="Queue",
+                      duration=self._seconds(start, end), billsec=self._seconds(start, end), **call)
+            return
+        if outcome < self.abandon_rate + 0.03:
+            wait = max(wait, 300)
+            end = at + timedelta(seconds=wait)
+            self._queuelog(end, uniqueid, queue, "NONE", "EXITWITHTIMEOUT", position, position, wait)
+            self._cdr(start, end, dst=queue, dcontext="ext-queues", lastapp="Queue",
+                      duration=self._seconds(start, end), billsec=self._seconds(start, end), **call)
+            return
+
+        # Timbres sin respuesta antes de que un agente conteste
+        for _ in range(rng.choice((0, 0, 0, 1, 1, 2))):
+            missed = rng.choice(members)
+            ring_ms = rng.randint(8000, 15000)
+            when = at + timedelta(seconds=rng.randint(0, max(wait, 1)))
+            self._queuelog(when, uniqueid, queue, f"SIP/{missed}", "RINGNOANSWER", ring_ms)
+            self._activity(when, queue, f"SIP/{missed}", "RINGNOANSWER", ring_ms // 1000, uniqueid)
+
+        agent = rng.choice(members)
+        ring = rng.randint(1, 8)
+        connect = at + timedelta(seconds=wait)
+        talk = self._talk()
+        end = connect + timedelta(seconds=talk)
+        self._queuelog(connect, uniqueid, queue, f"SIP/{agent}", "CONNECT", wait, self._uniqueid(connect), ring)
+        self._activity(connect, queue, f"SIP/{agent}", "CONNECT", wait, uniqueid)
+
+        close = rng.random()
+        if close < 0.04:
+            target = rng.choice(pbx.agents)
+            self._queuelog(end, uniqueid, queue, f"SIP/{agent}", "TRANSFER", target, "from-internal", wait, talk, position)
+            self._activity(end, queue, f"SIP/{agent}", "TRANSFER", talk, uniqueid)
+        else:
+            event = "COMPLETEAGENT" if close < 0.5 else "COMPLETECALLER"
+            self._queuelog(end, uniqueid, queue, f"SIP/{agent}", event, wait, talk, position)
+            self._activity(end, queue, f"SIP/{agent}", event, talk, uniqueid)
+
+        recording = f"q-{queue}-{caller}-{start:%Y%m%d-%H%M%S}-{uniqueid}.wav"
+        self._cdr(start, end, dst=queue, dcontext="ext-queues", dstchannel=f"PJSIP/{agent}-{self.seq:08x}",
+                  lastapp="Queue", duration=self._seconds(start, end), billsec=talk,
+                  recordingfile=recording, **call)
+
+    def outbound(self, start: datetime):
+        rng = self.rng
+        ext = rng.choice(self.pbx.agents)
+        uniqueid = self._uniqueid(start)
+        disposition = rng.choices(["ANSWERED", "NO ANSWER", "BUSY", "FAILED"], weights=[65, 20, 10, 5])[0]
+        ringing = rng.randint(3, 30)
+        billsec = self._talk() if disposition == "ANSWERED" else 0
+        trunk = rng.choice(self.pbx.trunks)
+        self._cdr(start, start + timedelta(seconds=ringing + billsec), clid=ext, src=ext,
+                  dst=f"55{rng.randint(10000000, 99999999)}", dcontext="from-internal",
+                  channel=f"PJSIP/{ext}-{self.seq:08x}", dstchannel=f"PJSIP/{trunk}-{self.seq:08x}",
+                  lastapp="Dial", duration=ringing + billsec, billsec=billsec, disposition=disposition,
+                  uniqueid=uniqueid, cnum=ext, linkedid=uniqueid,
+                  recordingfile=f"out-{ext}-{start:%Y%m%d-%H%M%S}-{uniqueid}.wav" if billsec else "")
+
+    def internal(self, start: datetime):
+        rng = self.rng
+        src, dst = rng.sample(self.pbx.agents, 2) if len(self.pbx.agents) > 1 else (self.pbx.agents[0],) * 2
+        uniqueid = self._uniqueid(start)
+        disposition = rng.choices(["ANSWERED", "NO ANSWER", "BUSY"], weights=[75, 20, 5])[0]
+        ringing = rng.randint(2, 20)
+        billsec = self._talk() // 2 if disposition == "ANSWERED" else 0
+        self._cdr(start, start + timedelta(seconds=ringing + billsec), clid=src, src=src, dst=dst,
+                  dcontext="from-internal", channel=f"PJSIP/{src}-{self.seq:08x}",
+                  dstchannel=f"PJSIP/{dst}-{self.seq:08x}", lastapp="Dial", duration=ringing + billsec,
+                  billsec=billsec, disposition=disposition, uniqueid=uniqueid, cnum=src, linkedid=uniqueid)
+
+    def agent_day(self, day: datetime):
+        """Turno de cada agente: ADDMEMBER, pausas y REMOVEMEMBER en agent_activity y queuelog"""
+        rng = self.rng
+        for ext in self.pbx.agents:
+            if day.weekday() >= 5 and rng.random() < 0.7:
+                continue
+            shift_start = day + timedelta(hours=rng.choice((7, 8, 9)), minutes=rng.randint(0, 30))
+            shift_end = shift_start + timedelta(hours=8, minutes=rng.randint(0, 45))
+            agent = f"SIP/{ext}"
+            queues = [q for q in self.pbx.queues if ext in self.pbx.members[q]]
+            for q in queues:
+                self._queuelog(shift_start, "NONE", q, agent, "ADDMEMBER")
+                self._activity(shift_start, q, agent, "ADDMEMBER", 0)
+            for _ in range(rng.randint(1, 3)):
+                pause_at = shift_start + timedelta(minutes=rng.randint(30, 420))
+                lasted = rng.randint(120, 1800)
+                reason = rng.choice(PAUSE_REASONS)
+                for q in queues:
+                    self._queuelog(pause_at, "NONE", q, agent, "PAUSE", reason)
+                    self._queuelog(pause_at + timedelta(seconds=lasted), "NONE", q, agent, "UNPAUSE", reason)
+                self._activity(pause_at, queues[0], agent, "PAUSE", lasted, data=reason)
+                self._activity(pause_at + timedelta(seconds=lasted), queues[0], agent, "UNPAUSE", 0, data=reason)
+            for q in queues:
+                self._queuelog(shift_end, "NONE", q, agent, "REMOVEMEMBER")
+                self._activity(shift_end, q, agent, "REMOVEMEMBER", int((shift_end - shift_start).total_seconds()))
+
+
+def day_counts(rng: random.Random, calls: int, days: List[datetime]) -> List[int]:
+    """Reparte las llamadas entre los días según el peso de cada día de la semana"""
+    weights = [WEEKDAY_WEIGHTS[d.weekday()] * rng.uniform(0.85, 1.15) for d in days]
+    total = sum(weights)
+    counts = [int(calls * w / total) for w in weights]
+    for i in range(calls - sum(counts)):
+        counts[i % len(counts)] += 1
+    return counts
+
+
+def call_times(rng: random.Random, day: datetime, count: int, until: datetime) -> List[datetime]:
+    hours = rng.choices(range(24), weights=HOUR_WEIGHTS, k=count)
+    times = [day + timedelta(hours=h, seconds=rng.randint(0, 3599)) for h in hours]
+    return sorted(t for t in times if t <= until)
+
+
+def realtime_rows(pbx: PBXModel, rng: random.Random, now: datetime):
+    """Estado actual: sesiones de agentes, pausas abiertas y una fila de sqlrealtime por cola"""
+    sessions, pauses, defer = [], [], []
+    for i, ext in enumerate(pbx.agents):
+        agent = f"SIP/{ext}"
+        queue = next(q for q in pbx.queues if ext in pbx.members[q])
+        if rng.random() < 0.8:
+            # Los routers consultan los dos estados ('START SESSION' y 'LOGGEDIN')
+            state = "START SESSION" if i % 2 == 0 else "LOGGEDIN"
+            since = now - timedelta(minutes=rng.randint(5, 480))
+            sessions.append((agent, since, state, queue, "", rng.randint(0, 1), i + 1, 1, 1))
+            if rng.random() < 0.2:
+                reason = rng.choice(PAUSE_REASONS)
+                pauses.append((agent, now - timedelta(seconds=rng.randint(30, 1800)), "START PAUSE", queue,
+                               reason, 1, PAUSE_REASONS.index(reason) + 1))
+            elif rng.random() < 0.05:
+                defer.append((agent, rng.choice(PAUSE_REASONS), now))
+        else:
+            sessions.append((agent, now - timedelta(hours=rng.randint(1, 12)), "END SESSION", queue, "", 0, i + 1, 1, 1))
+
+    realtime = []
+    for q in pbx.queues:
+        received = rng.randint(50, 800)
+        answered = int(received * rng.uniform(0.75, 0.95))
+        abandoned = received - answered
+        data = {
+            "QUEUE": q, "TOTAL_RECEIVED": received, "TOTAL_ANSWERED": answered,
+            "TOTAL_ANSWERED_SLA": int(answered * rng.uniform(0.6, 0.95)), "TOTAL_UNANSWERED": abandoned,
+            "TOTAL_UNANSWERED_SLA": abandoned // 2, "TOTAL_ABANDONED": abandoned,
+            "TOTAL_ABANDONED_SLA": abandoned // 3, "TOTAL_TRANSFERRED": answered // 25,
+            "TOTAL_WAIT": answered * 25, "TOTAL_TALK": answered * 180, "AVG_WAIT": 25.0, "AVG_TALK": 180.0,
+            "MAX_WAIT": rng.randint(120, 900), "SLA_THRESHOLD": 60,
+            "AGENTS_LOGGED_IN": len(pbx.members[q]), "AGENTS_AVAILABLE": rng.randint(0, len(pbx.members[q])),
+            "AGENTS_BUSY": rng.randint(0, len(pbx.members[q])), "AGENTS_PAUSED": rng.randint(0, 2),
+            "CALLS_WAITING": rng.randint(0, 5), "LONGEST_WAIT": rng.randint(0, 240),
+        }
+        realtime.append((f"queue-{q}", now - timedelta(seconds=rng.randint(0, 30)), php_serialize(data)))
+    return sessions, pauses, defer, realtime
+
+
+def table_ddl(model) -> str:
+    """CREATE TABLE IF NOT EXISTS del modelo con sus índices en línea (sirve igual para el archivo .sql)"""
+    table = model.__table__
+    ddl = str(CreateTable(table, if_not_exists=True).compile(dialect=mysql.dialect())).rstrip()
+    keys = [f"KEY {index.name} ({', '.join(c.name for c in index.columns)})" for index in table.indexes]
+    if keys:
+        ddl = ddl[:-1].rstrip() + ",\n\t" + ",\n\t".join(keys) + "\n)"
+    return ddl
+
+
+def create_schema(sink: Sink, reset: bool):
+    for schema in ("asteriskcdrdb", "asterisk", "qstats"):
+        sink.execute(f"CREATE DATABASE IF NOT EXISTS {schema}")
+    if reset:
+        sink.execute("DROP TABLE IF EXISTS asteriskcdrdb.cdr")
+        sink.execute("DROP TABLE IF EXISTS asterisk.incoming")
+        for model in MODEL_TABLES:
+            sink.execute(f"DROP TABLE IF EXISTS {model.__table__.schema}.{model.__tablename__}")
+    sink.execute(CDR_DDL)
+    sink.execute(INCOMING_DDL)
+    for model in MODEL_TABLES:
+        sink.execute(table_ddl(model))
+
+
+def generate(sink: Sink, args) -> Dict[str, int]:
+    rng = random.Random(args.seed)
+    now = datetime.now().replace(microsecond=0)
+    pbx = PBXModel(rng, args.queues, args.agents, args.ivrs, args.dids)
+    writer = BufferedWriter(sink, args.batch_size)
+
+    for table, (columns, rows) in catalog_rows(pbx, rng).items():
+        writer.add_many(table, columns, rows)
+    writer.flush()
+
+    generator = CallGenerator(pbx, rng, args.mean_wait, args.mean_talk, args.abandon_rate)
+    first_day = (now - timedelta(days=args.days - 1)).replace(hour=0, minute=0, second=0)
+    days = [first_day + timedelta(days=i) for i in range(args.days)]
+    columns = {
+        "asteriskcdrdb.cdr": CDR_COLUMNS,
+        "asteriskcdrdb.queuelog": QUEUELOG_COLUMNS,
+        "qstats.agent_activity": ACTIVITY_COLUMNS,
+    }
+
+    started = time.perf_counter()
+    generated = 0
+    for day, count in zip(days, day_counts(rng, args.calls, days)):
+        generator.agent_day(day)
+        for start in call_times(rng, day, count, now):
+            generator.call(start)
+        generated += count
+        # Los eventos que terminan después de medianoche se escriben con el día siguiente
+        for table, row in generator.drain(day + timedelta(days=1)):
+            writer.add(table, columns[table], row)
+        elapsed = time.perf_counter() - started
+        print(f"{day:%Y-%m-%d}: {generated:,} llamadas ({generated / max(elapsed, 1e-6):,.0f}/s)", flush=True)
+
+    # Lo que queda en el futuro (turnos de hoy aún abiertos) también representa el estado actual
+    for table, row in generator.drain():
+        writer.add(table, columns[table], row)
+
+    sessions, pauses, defer, realtime = realtime_rows(pbx, rng, now)
+    writer.add_many("qstats.agent_activity_session",
+                    ("agent", "datetime", "state", "queue", "data", "incall", "sessionid", "sessioncount", "computed"),
+                    sessions)
+    writer.add_many("qstats.agent_activity_pause",
+                    ("agent", "datetime", "state", "queue", "data", "computed", "pauseid"), pauses)
+    writer.add_many("qstats.agent_activity_deferpause", ("agent", "reason", "datetime"), defer)
+    writer.add_many("qstats.sqlrealtime", ("user", "lastupdate", "data"), realtime)
+    writer.flush()
+    return writer.counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera datos sintéticos de FreePBX/Asternic")
+    parser.add_argument("--calls", type=int, default=10000, help="Llamadas a generar (10k a 50M)")
+    parser.add_argument("--days", type=int, default=30, help="Días hacia atrás desde hoy")
+    parser.add_argument("--queues", type=int, default=8)
+    parser.add_argument("--agents", type=int, default=40)
+    parser.add_argument("--ivrs", type=int, default=3)
+    parser.add_argument("--dids", type=int, default=12)
+    parser.add_argument("--mean-wait", type=float, default=25.0, help="Espera media en cola (s)")
+    parser.add_argument("--mean-talk", type=float, default=180.0, help="Conversación media (s)")
+    parser.add_argument("--abandon-rate", type=float, default=0.12)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=5000, help="Filas por INSERT")
+    parser.add_argument("--url", default=None, help="URL SQLAlchemy de destino (por defecto la de .env)")
+    parser.add_argument("--sql-out", default=None, help="Escribe un .sql o .sql.gz en lugar de la base")
+    parser.add_argument("--reset", action="store_true", help="Borra y recrea las tablas generadas")
+    parser.add_argument("--append", action="store_true", help="Agrega a tablas que ya tienen datos")
+    args = parser.parse_args()
+
+    if args.sql_out:
+        sink: Sink = SQLFileSink(args.sql_out)
+    else:
+        url = args.url
+        if url is None:
+            from database import DATABASE_URL
+            url = DATABASE_URL
+        sink = MySQLSink(url)
+        existing = sink.scalar("SELECT COUNT(*) FROM (SELECT 1 FROM asteriskcdrdb.cdr LIMIT 1) t")
+        if existing and not (args.reset or args.append):
+            sink.close()
+            raise SystemExit("asteriskcdrdb.cdr ya tiene datos; usa --reset o --append si es una base de pruebas")
+
+    started = time.perf_counter()
+    try:
+        create_schema(sink, args.reset)
+        counts = generate(sink, args)
+    finally:
+        sink.close()
+
+    print(f"Listo en {time.perf_counter() - started:.1f}s")
+    for table, count in sorted(counts.items()):
+        print(f"  {table:40} {count:>12,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# benchmarks/php_parser_bench.py
+"""
+Benchmark del parser de datos PHP de qstats.sqlrealtime.
+
+Compara utils.php_parser.unserialize_php contra la implementación anterior
+basada en re.findall (copiada aquí tal cual) con payloads del tamaño de una
+fila de sqlrealtime y con uno grande con arrays anidados. Todas las medidas
+son en frío (sin caché). Se mide también el parser completo por offsets solo,
+que es el que usan los payloads que no son arrays planos.
+
+La columna "llaves" muestra lo que cada parser realmente recupera (la regex
+anterior pierde d:, b:, N; y mezcla el contenido de los arrays anidados en el
+primer nivel).
+
+Uso (desde beyondpbx-backend):
+
+    python -m benchmarks.php_parser_bench [--rows 200] [--repeat 5]
+"""
+import argparse
+import re
+import timeit
+from typing import Any, Dict
+
+from utils.php_parser import unserialize_php, unserialize_php_offsets
+
+
+def legacy_unserialize_php(data: str) -> Dict[str, Any]:
+    """Versión anterior: regex sobre todo el texto, solo pares s:/i: planos"""
+    if not data or not isinstance(data, str):
+        return {}
+    result = {}
+    pattern = r's:(\d+):"([^"]+)";(?:i:(\d+)|s:(\d+):"([^"]*)")'
+    for key_len, key, int_val, str_len, str_val in re.findall(pattern, data):
+        if len(key) != int(key_len):
+            continue
+        if int_val:
+            result[key] = int(int_val)
+        elif str_val is not None:
+            if str_len and len(str_val) != int(str_len):
+                continue
+            result[key] = str_val
+    return result
+
+
+def php_serialize(value: Any) -> str:
+    """Serializador mínimo para generar los payloads de prueba"""
+    if value is None:
+        return "N;"
+    if isinstance(value, bool):
+        return f"b:{int(value)};"
+    if isinstance(value, int):
+        return f"i:{value};"
+    if isinstance(value, float):
+        return f"d:{value!r};"
+    if isinstance(value, str):
+        return f's:{len(value.encode("utf-8"))}:"{value}";'
+    if isinstance(value, dict):
+        items = "".join(php_serialize(k) + php_serialize(v) for k, v in value.items())
+        return f"a:{len(value)}:{{{items}}}"
+    raise TypeError(type(value))
+
+
+def sample_row(queue: int) -> Dict[str, Any]:
+    """Métricas como las que escribe Asternic por cola"""
+    return {
+        "QUEUE": f"Cola {queue}",
+        "TOTAL_RECEIVED": 120 + queue,
+        "TOTAL_ANSWERED": 100 + queue,
+        "TOTAL_ANSWERED_SLA": 90,
+        "TOTAL_UNANSWERED": 20,
+        "TOTAL_UNANSWERED_SLA": 5,
+        "TOTAL_ABANDONED": 15,
+        "TOTAL_ABANDONED_SLA": 4,
+        "TOTAL_TRANSFERRED": 3,
+        "TOTAL_WAIT": 5400,
+        "TOTAL_TALK": 36000,
+        "AVG_WAIT": 45.5,
+        "AVG_TALK": 300.25,
+        "MAX_WAIT": 310,
+        "SLA_THRESHOLD": 60,
+        "AGENTS_LOGGED_IN": 12,
+        "AGENTS_AVAILABLE": 4,
+        "AGENTS_BUSY": 6,
+        "AGENTS_PAUSED": 2,
+        "CALLS_WAITING": 1,
+        "LONGEST_WAIT": 12,
+    }
+
+
+def nested_row(queue: int) -> Dict[str, Any]:
+    """Fila con el detalle por agente anidado (la versión anterior lo descartaba)"""
+    row = sample_row(queue)
+    row["AGENTS"] = {
+        i: {"name": f"Agente {i}", "paused": i % 3 == 0, "calls": i * 2, "last": None}
+        for i in range(40)
+    }
+    return row
+
+
+def run(label: str, payloads: list, repeat: int):
+    print(f"\n{label}: {len(payloads)} filas, {sum(len(p) for p in payloads) / 1024:.1f} KiB")
+    parsers = (
+        ("regex (anterior)", legacy_unserialize_php),
+        ("unserialize_php", unserialize_php),
+        ("solo offsets", unserialize_php_offsets),
+    )
+    for name, parser in parsers:
+        times = timeit.repeat(lambda: [parser(p) for p in payloads], number=10, repeat=repeat)
+        per_call = min(times) / 10 / len(payloads) * 1e6
+        keys = sum(len(parser(p)) for p in payloads)
+        print(f"  {name:<18} {per_call:8.2f} µs/fila   llaves de primer nivel: {keys}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    run("Filas planas", [php_serialize(sample_row(i)) for i in range(args.rows)], args.repeat)
+    run("Filas con arrays anidados", [php_serialize(nested_row(i)) for i in range(args.rows)], args.repeat)
+
+
+if __name__ == "__main__":
+    main()
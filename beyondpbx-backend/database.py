@@ -1,18 +1,119 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+import itertools
 import os
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
 from dotenv import load_dotenv
+from services.background import PeriodicTask, register_task
+from services.request_metrics import instrument_engine
 
 load_dotenv()
 
+# Configuración del pool de conexiones (aplica al engine sync y al async, cada uno con su pool)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Menor que wait_timeout de MySQL
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# Réplicas de solo lectura para los reportes (hosts o URLs completas separadas por comas)
+DB_REPLICA_HOSTS = [h.strip() for h in os.getenv("DB_REPLICA_HOSTS", "").split(",") if h.strip()]
+DB_REPLICA_MAX_LAG = os.getenv("DB_REPLICA_MAX_LAG")  # Segundos; vacío = sin verificar el retraso
+DB_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", "10"))
+
 DATABASE_URL = (
     f"mysql+pymysql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}"
     f"@{os.getenv('DB_HOST')}/{os.getenv('DB_NAME')}"
 )
 
-engine = create_engine(DATABASE_URL, echo=False)
+# Misma base de datos con driver async (aiomysql) para los endpoints async def:
+# no ocupan un hilo del threadpool mientras esperan a MySQL
+ASYNC_DATABASE_URL = (
+    f"mysql+aiomysql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}"
+    f"@{os.getenv('DB_HOST')}/{os.getenv('DB_NAME')}"
+)
+
+
+
+class PoolWaitStats:
+    """Tiempo que las peticiones esperan para obtener una conexión del pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def record(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.count += 1
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.count,
+                "avg_wait_ms": round(self.total_wait / self.count * 1000, 2) if self.count else 0,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+                "timeouts": self.timeouts
+            }
+
+
+class _WaitTimingPool:
+    """Mide la espera de cada checkout (incluye pre-ping y apertura de conexiones nuevas)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.wait_stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.wait_stats.record(time.perf_counter() - start)
+        return connection
+
+
+class InstrumentedQueuePool(_WaitTimingPool, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_WaitTimingPool, AsyncAdaptedQueuePool):
+    pass
+
+
+POOL_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+engine = create_engine(DATABASE_URL, echo=False, poolclass=InstrumentedQueuePool, **POOL_OPTIONS)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, echo=False, poolclass=InstrumentedAsyncQueuePool, **POOL_OPTIONS
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+# Consultas, tiempo en MySQL y filas por petición para /metrics
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
 Base = declarative_base()
 
 def get_db():
@@ -20,4 +121,141 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """
+    Sesión async. Los handlers reutilizan el código sync existente con
+    `await db.run_sync(funcion, ...)`: la función recibe una Session normal
+    y cada consulta se espera en el event loop sin bloquear un hilo.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# ============================================
+# RÉPLICAS DE LECTURA
+# ============================================
+
+class Replica:
+    """Réplica de solo lectura con sus engines sync/async y el último retraso medido"""
+
+    def __init__(self, host: str):
+        if "://" in host:
+            url = make_url(host)
+        else:
+            url = make_url(f"mysql+pymysql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}"
+                           f"@{host}/{os.getenv('DB_NAME')}")
+        self.name = url.host or host
+        self.engine = create_engine(
+            url.set(drivername="mysql+pymysql"), echo=False, poolclass=InstrumentedQueuePool, **POOL_OPTIONS
+        )
+        self.async_engine = create_async_engine(
+            url.set(drivername="mysql+aiomysql"), echo=False, poolclass=InstrumentedAsyncQueuePool, **POOL_OPTIONS
+        )
+        instrument_engine(self.engine)
+        instrument_engine(self.async_engine.sync_engine)
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.AsyncSessionLocal = async_sessionmaker(self.async_engine, autoflush=False, expire_on_commit=False)
+        # Con verificación de retraso, la réplica entra en rotación después del primer chequeo
+        self.healthy = not DB_REPLICA_MAX_LAG
+        self.lag: Optional[int] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[datetime] = None
+
+    def check_lag(self, max_lag: float):
+        """Lee Seconds_Behind_Master; si no se puede determinar la réplica queda fuera de rotación"""
+        try:
+            with self.engine.connect() as connection:
+                status = connection.execute(text("SHOW SLAVE STATUS")).mappings().first()
+            lag = None
+            if status is not None:
+                lag = status.get("Seconds_Behind_Master", status.get("Seconds_Behind_Source"))
+            self.lag = lag
+            self.error = None if lag is not None else "Replicación detenida o no configurada"
+            self.healthy = lag is not None and lag <= max_lag
+        except Exception as e:
+            print(f"Error verificando réplica {self.name}: {str(e)}")
+            self.lag = None
+            self.error = str(e)
+            self.healthy = False
+        self.checked_at = datetime.now()
+
+
+replicas: List[Replica] = [Replica(host) for host in DB_REPLICA_HOSTS]
+_replica_counter = itertools.count()
+
+
+def pick_replica() -> Optional[Replica]:
+    """Siguiente réplica sana (round-robin); None si no hay y se debe usar el primario"""
+    healthy = [replica for replica in replicas if replica.healthy]
+    if not healthy:
+        return None
+    return healthy[next(_replica_counter) % len(healthy)]
+
+
+def get_analytics_db():
+    """
+    Sesión para reportes de solo lectura: usa una réplica sana si hay alguna
+    configurada, si no el primario. No usar para escrituras ni datos en tiempo real.
+    """
+    replica = pick_replica()
+    db = (replica.SessionLocal if replica else SessionLocal)()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_analytics_db():
+    """Versión async de get_analytics_db"""
+    replica = pick_replica()
+    async with (replica.AsyncSessionLocal if replica else AsyncSessionLocal)() as db:
+        yield db
+
+
+def check_replicas():
+    if DB_REPLICA_MAX_LAG:
+        for replica in replicas:
+            replica.check_lag(float(DB_REPLICA_MAX_LAG))
+
+
+def init_replica_monitor():
+    """Registra la verificación periódica del retraso de las réplicas (se llama en el startup)"""
+    if replicas and DB_REPLICA_MAX_LAG:
+        register_task(PeriodicTask("replica-lag", DB_REPLICA_LAG_CHECK_INTERVAL, check_replicas))
+
+
+def replica_stats() -> list:
+    return [
+        {
+            "name": replica.name,
+            "healthy": replica.healthy,
+            "lag_seconds": replica.lag,
+            "error": replica.error,
+            "checked_at": replica.checked_at.isoformat() if replica.checked_at else None
+        }
+        for replica in replicas
+    ]
+
+
+def pool_stats() -> dict:
+    """Estado de los pools sync y async: conexiones en uso, overflow, saturación y esperas"""
+    stats = {}
+    pools = [("sync", engine.pool), ("async", async_engine.sync_engine.pool)]
+    for replica in replicas:
+        pools.append((f"replica:{replica.name}:sync", replica.engine.pool))
+        pools.append((f"replica:{replica.name}:async", replica.async_engine.sync_engine.pool))
+    for name, pool in pools:
+        capacity = pool.size() + max(DB_MAX_OVERFLOW, 0)
+        checked_out = pool.checkedout()
+        stats[name] = {
+            "size": pool.size(),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "checked_in": pool.checkedin(),
+            "checked_out": checked_out,
+            "overflow": max(pool.overflow(), 0),
+            "saturation": round(checked_out / capacity, 3) if capacity else 0,
+            "wait": pool.wait_stats.as_dict() if hasattr(pool, "wait_stats") else None
+        }
+    return stats
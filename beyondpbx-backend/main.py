@@ -1,11 +1,29 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import telephony, asternic, dashboard, queues
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import text
+from database import engine, pool_stats, init_replica_monitor
+from routers import telephony, asternic, dashboard, queues, system
+from services import background
+from services.cdr_rollups import init_cdr_rollups
+from services.cdr_heatmap import init_cdr_heatmap
+from services.queue_histograms import init_queue_histograms
+from services.queue_sketches import init_queue_sketches
+from services.queue_facts import init_queue_facts
+from services.queue_state import init_queue_state
+from services.agent_state import init_agent_state
+from services.snapshot_broadcast import init_broadcasters
+from services.asternic_client import close_asternic_client
+from services.request_metrics import MetricsMiddleware, init_request_metrics, render_metrics
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Saturación del pool (conexiones en uso / capacidad) a partir de la cual /health reporta "degraded"
+HEALTH_POOL_SATURATION_WARN = float(os.getenv("HEALTH_POOL_SATURATION_WARN", "0.9"))
+
 app = FastAPI(title="BeyondPBX")
 
 # Configuración de CORS desde variables de entorno
@@ -17,12 +35,40 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH"],  # Métodos específicos en lugar de "*"
     allow_headers=["Content-Type", "Authorization", "Accept"],  # Headers específicos
+    expose_headers=["Age", "X-Data-Stale"],  # Edad de los datos de Asternic servidos desde caché
 )
 
+# Latencia, consultas SQL y bytes por ruta para /metrics (fuera de CORS para medir la petición completa)
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(telephony.router)
 app.include_router(asternic.router)
 app.include_router(dashboard.router)
 app.include_router(queues.router)
+app.include_router(system.router)
+
+@app.on_event("startup")
+def start_background_tasks():
+    # Crea las tablas propias y arranca los procesos incrementales
+    init_cdr_rollups()
+    init_cdr_heatmap()
+    init_queue_histograms()
+    init_queue_sketches()
+    init_queue_facts()
+    init_queue_state()
+    init_agent_state()
+    init_broadcasters()
+    init_replica_monitor()
+    init_request_metrics()
+    background.start_all()
+
+@app.on_event("shutdown")
+def stop_background_tasks():
+    background.stop_all()
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    await close_asternic_client()
 
 @app.get("/")
 def read_root():
@@ -30,4 +76,33 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "service": "freepbx-api"}
\ No newline at end of file
+    # Latencia de ida y vuelta a MySQL (con un checkout del pool) y saturación de los pools
+    start = time.perf_counter()
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    except Exception as e:
+        print(f"Error en health_check: {str(e)}")
+        return JSONResponse(status_code=503, content={
+            "status": "unhealthy",
+            "service": "freepbx-api",
+            "database": {"ok": False, "error": str(e)}
+        })
+    latency_ms = round((time.perf_counter() - start) * 1000, 2)
+    
+    pools = pool_stats()
+    saturation = max(pool["saturation"] for pool in pools.values())
+    return {
+        "status": "degraded" if saturation >= HEALTH_POOL_SATURATION_WARN else "healthy",
+        "service": "freepbx-api",
+        "database": {"ok": True, "latency_ms": latency_ms},
+        "pool": {
+            name: {"checked_out": pool["checked_out"], "saturation": pool["saturation"]}
+            for name, pool in pools.items()
+        }
+    }
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    # Formato de texto de Prometheus; con METRICS_DIR incluye a todos los workers
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Float, BigInteger, TIMESTAMP
+from sqlalchemy import Column, Integer, String, DateTime, Date, Text, ForeignKey, Float, BigInteger, TIMESTAMP, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -391,3 +391,125 @@ class QueueRule(Base):
     
     def __repr__(self):
         return f"<QueueRule(rule_name={self.rule_name})>"
+
+
+# ============================================
+# TABLAS PROPIAS (esquema beyondpbx) - Agregados incrementales
+# ============================================
+
+# Marca de agua de cada proceso incremental (último id procesado de la tabla origen)
+class ProcessingWatermark(Base):
+    __tablename__ = "processing_watermarks"
+    __table_args__ = {'schema': 'beyondpbx'}
+    
+    name = Column(String(64), primary_key=True)
+    last_id = Column(BigInteger, nullable=False, default=0)
+    last_time = Column(DateTime)
+    updated_at = Column(DateTime)
+    
+    def __repr__(self):
+        return f"<ProcessingWatermark(name={self.name}, last_id={self.last_id})>"
+
+# Agregado por hora de asteriskcdrdb.cdr
+class CDRHourlyRollup(Base):
+    __tablename__ = "cdr_rollup_hourly"
+    __table_args__ = {'schema': 'beyondpbx'}
+    
+    bucket = Column(DateTime, primary_key=True)  # Inicio de la hora
+    total_calls = Column(Integer, nullable=False, default=0)
+    answered_calls = Column(Integer, nullable=False, default=0)
+    no_answer_calls = Column(Integer, nullable=False, default=0)
+    failed_calls = Column(Integer, nullable=False, default=0)
+    busy_calls = Column(Integer, nullable=False, default=0)
+    duration_sum = Column(BigInteger, nullable=False, default=0)
+    billsec_sum = Column(BigInteger, nullable=False, default=0)
+
+# Agregado por día de asteriskcdrdb.cdr
+class CDRDailyRollup(Base):
+    __tablename__ = "cdr_rollup_daily"
+    __table_args__ = {'schema': 'beyondpbx'}
+    
+    day = Column(Date, primary_key=True)
+    total_calls = Column(Integer, nullable=False, default=0)
+    answered_calls = Column(Integer, nullable=False, default=0)
+    no_answer_calls = Column(Integer, nullable=False, default=0)
+    failed_calls = Column(Integer, nullable=False, default=0)
+    busy_calls = Column(Integer, nullable=False, default=0)
+    duration_sum = Column(BigInteger, nullable=False, default=0)
+    billsec_sum = Column(BigInteger, nullable=False, default=0)
+
+# Agregado por día y destino (dst) de asteriskcdrdb.cdr
+class CDRDailyDstRollup(Base):
+    __tablename__ = "cdr_rollup_dst_daily"
+    __table_args__ = {'schema': 'beyondpbx'}
+    
+    day = Column(Date, primary_key=True)
+    dst = Column(String(80), primary_key=True)
+    total_calls = Column(Integer, nullable=False, default=0)
+    answered_calls = Column(Integer, nullable=False, default=0)
+
+# Cubo del heatmap: llamadas por hora, DID, cola y disposición
+class CDRHeatmapCube(Base):
+    __tablename__ = "cdr_heatmap_cube"
+    __table_args__ = (
+        Index("ix_cdr_heatmap_cube_did", "did", "bucket"),
+        Index("ix_cdr_heatmap_cube_queue", "queue", "bucket"),
+        {'schema': 'beyondpbx'}
+    )
+    
+    bucket = Column(DateTime, primary_key=True)  # Inicio de la hora
+    did = Column(String(50), primary_key=True, default="")
+    queue = Column(String(80), primary_key=True, default="")  # dst de las llamadas a ext-queues
+    disposition = Column(String(45), primary_key=True, default="")
+    calls = Column(Integer, nullable=False, default=0)
+
+# Histograma de tiempos de espera de queuelog por hora y cola (buckets de 1 segundo)
+class QueueWaitHistogram(Base):
+    __tablename__ = "queue_wait_histogram"
+    __table_args__ = {'schema': 'beyondpbx'}
+    
+    bucket = Column(DateTime, primary_key=True)  # Inicio de la hora
+    queuename = Column(String(128), primary_key=True)
+    kind = Column(String(10), primary_key=True)  # enter, connect o abandon
+    wait_seconds = Column(Integer, primary_key=True)  # El último bucket acumula todo lo que pasa del tope
+    calls = Column(Integer, nullable=False, default=0)
+    wait_sum = Column(BigInteger, nullable=False, default=0)
+
+# Sketches de cuantiles (DDSketch) de espera, conversación y timbrado por hora y cola
+class QueueTimeSketch(Base):
+    __tablename__ = "queue_time_sketch"
+    __table_args__ = {'schema': 'beyondpbx'}
+    
+    bucket = Column(DateTime, primary_key=True)  # Inicio de la hora
+    queuename = Column(String(128), primary_key=True)
+    metric = Column(String(10), primary_key=True)  # wait, talk o ring
+    samples = Column(Integer, nullable=False, default=0)
+    total = Column(BigInteger, nullable=False, default=0)  # Suma de segundos, para el promedio
+    max_value = Column(Integer, nullable=False, default=0)
+    sketch = Column(Text, nullable=False)  # DDSketch serializado (utils.ddsketch)
+
+# Tabla de hechos de llamadas en cola: una fila por callid y cola, materializada desde queuelog
+class QueueCallFact(Base):
+    __tablename__ = "queue_calls"
+    __table_args__ = (
+        Index("ix_queue_calls_enter", "enter_time", "queuename"),
+        Index("ix_queue_calls_queue", "queuename", "enter_time"),
+        {'schema': 'beyondpbx'}
+    )
+    
+    callid = Column(String(64), primary_key=True)
+    queuename = Column(String(128), primary_key=True)
+    entered = Column(Integer, nullable=False, default=0)  # 1 si se vio su ENTERQUEUE
+    enter_time = Column(DateTime)  # ENTERQUEUE, o el primer evento visto si no hubo
+    connect_time = Column(DateTime)
+    end_time = Column(DateTime)
+    agent = Column(String(128))
+    outcome = Column(String(12))  # answered, abandoned, timeout, exitkey, exitempty; NULL mientras espera
+    caller_id = Column(String(64))
+    position = Column(Integer)  # Posición al entrar a la cola
+    wait_seconds = Column(Integer)
+    talk_seconds = Column(Integer)
+    ring_seconds = Column(Integer)
+    transferred = Column(Integer, nullable=False, default=0)
+    transfer_to = Column(String(128))
+    last_event_id = Column(BigInteger)
@@ -1,9 +1,18 @@
 
 # routers/asternic.py 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text, func, desc, and_, case
-from database import get_db
+from fastapi.responses import StreamingResponse
+from database import get_db, get_async_db, SessionLocal
+from services.response_cache import cached
+from services.snapshot_broadcast import SnapshotBroadcaster, PUSH_ENABLED
+from services.queue_state import queue_calls, queue_state_ready
+from services.queue_facts import queue_call_totals
+from services.agent_state import agent_state, agent_state_ready
+from services.catalogs import catalogs
+from services.asternic_client import AsternicError, CachedResult, breaker, cached_get, cached_get_many
 import os
 from models import (
     AgentActivity, AgentActivityPause, AgentActivitySession, AgentActivityDeferPause,
@@ -14,18 +23,35 @@ from typing import List, Optional
 
 router = APIRouter(prefix="/api/asternic", tags=["Asternic"])
 
-# Configuración de Asternic
-ASTERNIC_URL = os.getenv("ASTERNIC_URL", "http://10.10.16.9/stats")
-ASTERNIC_USER = os.getenv("ASTERNIC_USER", "adminbeyond")
-ASTERNIC_PASS = os.getenv("ASTERNIC_PASS", "adminbeyond")
+# Segundos entre snapshots del canal push del monitor de agentes
+AGENTS_PUSH_INTERVAL = float(os.getenv("AGENTS_PUSH_INTERVAL", "2"))
 
-def get_asternic_auth():
-    """Retorna la autenticación para Asternic"""
-    return HTTPBasicAuth(ASTERNIC_USER, ASTERNIC_PASS)
+
+def asternic_http_error(e: AsternicError, detail: str) -> HTTPException:
+    """Error de Asternic como HTTPException: su código si respondió, 503 si no hubo respuesta"""
+    if e.status_code is not None:
+        return HTTPException(status_code=e.status_code, detail=detail)
+    if e.circuit_open:
+        return HTTPException(
+            status_code=503,
+            detail=f"Asternic no disponible: {str(e)}",
+            headers={"Retry-After": str(breaker.retry_after())}
+        )
+    return HTTPException(status_code=503, detail=f"No se pudo conectar con Asternic: {str(e)}")
+
+
+def set_freshness_headers(response: Response, *results: CachedResult):
+    """Age (segundos) y X-Data-Stale cuando se sirvió una respuesta guardada de Asternic"""
+    results = [r for r in results if isinstance(r, CachedResult)]
+    if not results:
+        return
+    response.headers["Age"] = str(int(max(r.age for r in results)))
+    response.headers["X-Data-Stale"] = "true" if any(r.stale for r in results) else "false"
 
 
 @router.get("/agents/realtime-status")
-def get_agents_realtime_status(db: Session = Depends(get_db)):
+@cached(ttl=3)
+async def get_agents_realtime_status(db: AsyncSession = Depends(get_async_db)):
     """
     Obtiene estado en tiempo real de todos los agentes usando las tablas correctas:
     - agent_activity_session: Para sesiones activas (login/logout)
@@ -33,6 +59,10 @@ def get_agents_realtime_status(db: Session = Depends(get_db)):
     - queuelog: Para eventos recientes de llamadas
     - pauses: Para nombres de pausas
     """
+    return await db.run_sync(load_agents_realtime_status)
+
+
+def load_agents_realtime_status(db: Session):
     try:
         # Query principal: obtener agentes con sesión activa
         query = text("""
@@ -43,7 +73,6 @@ def get_agents_realtime_status(db: Session = Depends(get_db)):
                 aas.datetime,
                 aas.incall,
                 aas.sessionid,
-                an.agent as agent_name,
                 TIMESTAMPDIFF(SECOND, aas.datetime, NOW()) as session_duration,
                 -- Información de pausa activa
                 aap.state as pause_state,
@@ -53,7 +82,6 @@ def get_agents_realtime_status(db: Session = Depends(get_db)):
                 -- Información de pausa diferida
                 aadp.reason as defer_pause_reason
             FROM qstats.agent_activity_session aas
-            LEFT JOIN qstats.agentnames an ON aas.agent = an.device
             LEFT JOIN qstats.agent_activity_pause aap ON aas.agent = aap.agent AND aap.state = 'START PAUSE'
             LEFT JOIN qstats.agent_activity_deferpause aadp ON aas.agent = aadp.agent
             WHERE aas.state = 'START SESSION'
@@ -66,9 +94,37 @@ def get_agents_realtime_status(db: Session = Depends(get_db)):
         queues_dict = {}
         agent_names = [row[0] for row in result]
         
-        # Obtener últimos eventos de llamada de queuelog (incluyendo CONNECT para llamadas activas)
+        # Nombres de agentes y colas desde el catálogo (sin JOIN ni consulta por agente)
+        agent_display_names = catalogs.get(db, "agentnames")
+        queue_names = catalogs.get(db, "queuenames")
+        
+        # Último evento de llamada y llamadas del día: desde la proyección en memoria
+        # si está al día, si no con las consultas sobre queuelog
         call_events_dict = {}
-        if agent_names:
+        calls_dict = {}
+        if agent_names and agent_state_ready():
+            now = datetime.now()
+            for agent in agent_names:
+                event_row = agent_state.last_call_event(agent, timedelta(hours=2))
+                if event_row:
+                    call_events_dict[agent] = {
+                        'event': event_row.event,
+                        'queuename': event_row.queuename,
+                        'callid': event_row.callid,
+                        'data1': event_row.data1,
+                        'data2': event_row.data2,
+                        'data3': event_row.data3,
+                        'data4': event_row.data4,
+                        'caller_id': event_row.data5 or event_row.callid,
+                        'time': event_row.time,
+                        'duration_seconds': int((now - event_row.time).total_seconds())
+                    }
+                call_count, last_call = agent_state.calls_today(agent)
+                if call_count:
+                    calls_dict[agent] = {'count': call_count, 'last_call': last_call}
+        
+        # Obtener últimos eventos de llamada de queuelog (incluyendo CONNECT para llamadas activas)
+        elif agent_names:
             events_query = text("""
                 SELECT 
                     ql.agent,
@@ -106,10 +162,8 @@ def get_agents_realtime_status(db: Session = Depends(get_db)):
                 'time': row[9],
                 'duration_seconds': row[10]
             } for row in events_result}
-        
-        # Obtener estadísticas de llamadas del día
-        calls_dict = {}
-        if agent_names:
+            
+            # Obtener estadísticas de llamadas del día
             calls_query = text("""
                 SELECT 
                     agent,
@@ -132,12 +186,12 @@ def get_agents_realtime_status(db: Session = Depends(get_db)):
             queues_str = row[2] or ''
             session_datetime = row[3]
             incall = row[4] or 0
-            pause_state = row[8]
-            pause_reason = row[9]
-            pause_datetime = row[10]
-            pause_duration = row[11] or 0
-            defer_pause = row[12]
-            session_duration = row[7] or 0
+            pause_state = row[7]
+            pause_reason = row[8]
+            pause_datetime = row[9]
+            pause_duration = row[10] or 0
+            defer_pause = row[11]
+            session_duration = row[6] or 0
             
             # Información de última llamada
             call_event = call_events_dict.get(agent_name, {})
@@ -190,15 +244,11 @@ def get_agents_realtime_status(db: Session = Depends(get_db)):
             primary_queue = queue_list[0] if queue_list else 'sin_cola'
             
             # Buscar nombre de cola
-            queue_name_result = db.execute(
-                text("SELECT queue FROM qstats.queuenames WHERE device = :device LIMIT 1"),
-                {"device": primary_queue}
-            ).fetchone()
-            queue_display_name = queue_name_result[0] if queue_name_result else 'Sin Cola'
+            queue_display_name = queue_names.get(primary_queue) or 'Sin Cola'
             
             agent_data = {
                 'extension': agent_name,
-                'name': row[6] or agent_name,
+                'name': agent_display_names.get(agent_name) or agent_name,
                 'queue': primary_queue,
                 'queueName': queue_display_name,
                 'status': status,
@@ -251,130 +301,126 @@ def get_agents_realtime_status(db: Session = Depends(get_db)):
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error al obtener agentes: {str(e)}")
+
+
+def compute_agents_snapshot() -> dict:
+    """Snapshot del monitor de agentes para el canal push (sin pasar por la caché de respuestas)"""
+    db = SessionLocal()
+    try:
+        return load_agents_realtime_status(db)
+    finally:
+        db.close()
+
+
+agents_broadcaster = SnapshotBroadcaster(
+    "agents-monitor",
+    AGENTS_PUSH_INTERVAL,
+    compute_agents_snapshot,
+    list_field="agents",
+    key_field="extension",
+    # Contadores que el frontend avanza por su cuenta con lastActivity
+    volatile_fields=("timeInState", "duration", "lastCallFormatted")
+)
+
+
+@router.get("/agents/realtime-stream")
+async def stream_agents_realtime_status():
+    """
+    Canal Server-Sent Events del monitor de agentes.
+    Envía un evento `snapshot` (misma forma que /agents/realtime-status) y después
+    eventos `delta` con los agentes que cambiaron de estado, los eliminados y el resumen.
+    """
+    if not PUSH_ENABLED:
+        raise HTTPException(status_code=503, detail="Canal push deshabilitado")
+    return StreamingResponse(
+        agents_broadcaster.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
     
 
 @router.get("/queues/status")
-def get_queues_real_time_status():
+async def get_queues_real_time_status(response: Response):
     """
     Obtiene el estado en tiempo real de todas las colas desde Asternic
+    (si Asternic no responde se sirve la última respuesta buena con su edad en Age)
     """
     try:
-        response = requests.get(
-            f"{ASTERNIC_URL}/api/queues",
-            auth=get_asternic_auth(),
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            queues = []
-            if isinstance(data, dict) and 'queues' in data:
-                for queue in data['queues']:
-                    queues.append({
-                        'name': queue.get('name'),
-                        'waiting': int(queue.get('waiting', 0)),
-                        'answered': int(queue.get('answered', 0)),
-                        'abandoned': int(queue.get('abandoned', 0)),
-                        'agentsLoggedIn': int(queue.get('agentsloggedin', 0)),
-                        'agentsAvailable': int(queue.get('agentsavailable', 0)),
-                        'longestWait': int(queue.get('longestwait', 0))
-                    })
-            
-            return {"queues": queues}
-        else:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail="Error al obtener datos de colas"
-            )
-            
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(
-            status_code=503,
-            detail=f"No se pudo conectar con Asternic: {str(e)}"
-        )
+        result = await cached_get("/api/queues")
+    except AsternicError as e:
+        raise asternic_http_error(e, "Error al obtener datos de colas")
+    set_freshness_headers(response, result)
+    data = result.data
+    
+    queues = []
+    if isinstance(data, dict) and 'queues' in data:
+        for queue in data['queues']:
+            queues.append({
+                'name': queue.get('name'),
+                'waiting': int(queue.get('waiting', 0)),
+                'answered': int(queue.get('answered', 0)),
+                'abandoned': int(queue.get('abandoned', 0)),
+                'agentsLoggedIn': int(queue.get('agentsloggedin', 0)),
+                'agentsAvailable': int(queue.get('agentsavailable', 0)),
+                'longestWait': int(queue.get('longestwait', 0))
+            })
+    
+    return {"queues": queues}
 
 @router.get("/agent/{extension}/stats")
-def get_agent_statistics(extension: str):
+async def get_agent_statistics(extension: str, response: Response):
     """
     Obtiene estadísticas detalladas de un agente específico
     """
     try:
-        response = requests.get(
-            f"{ASTERNIC_URL}/api/agent-stats",
-            auth=get_asternic_auth(),
-            params={'agent': extension},
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail="Error al obtener estadísticas del agente"
-            )
-            
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(
-            status_code=503,
-            detail=f"No se pudo conectar con Asternic: {str(e)}"
-        )
+        result = await cached_get("/api/agent-stats", params={'agent': extension})
+    except AsternicError as e:
+        raise asternic_http_error(e, "Error al obtener estadísticas del agente")
+    set_freshness_headers(response, result)
+    return result.data
 
 @router.get("/dashboard/summary")
-def get_realtime_dashboard_summary(db: Session = Depends(get_db)):
+async def get_realtime_dashboard_summary(response: Response):
     """
-    Combina datos de Asternic con datos de la base de datos
-    para crear un resumen completo en tiempo real
+    Combina datos de agentes y colas de Asternic en un resumen en tiempo real.
+    Las dos consultas se hacen en paralelo.
     """
-    try:
-        # Obtener datos de agentes en tiempo real
-        agents_response = requests.get(
-            f"{ASTERNIC_URL}/api/agents",
-            auth=get_asternic_auth(),
-            timeout=10
-        )
-        
-        # Obtener datos de colas en tiempo real
-        queues_response = requests.get(
-            f"{ASTERNIC_URL}/api/queues",
-            auth=get_asternic_auth(),
-            timeout=10
-        )
-        
-        agents_data = agents_response.json() if agents_response.status_code == 200 else {}
-        queues_data = queues_response.json() if queues_response.status_code == 200 else {}
-        
-        # Calcular métricas
-        agents = agents_data.get('agents', [])
-        total_agents = len(agents)
-        available = sum(1 for a in agents if 'available' in str(a.get('status', '')).lower())
-        busy = sum(1 for a in agents if 'busy' in str(a.get('status', '')).lower())
-        paused = sum(1 for a in agents if 'pause' in str(a.get('status', '')).lower())
-        
-        queues = queues_data.get('queues', [])
-        total_waiting = sum(int(q.get('waiting', 0)) for q in queues)
-        
-        return {
-            "agents": {
-                "total": total_agents,
-                "available": available,
-                "busy": busy,
-                "paused": paused,
-                "offline": total_agents - (available + busy + paused)
-            },
-            "queues": {
-                "total_waiting": total_waiting,
-                "queues": queues
-            },
-            "timestamp": "now"
-        }
-        
-    except requests.exceptions.RequestException as e:
-        raise HTTPException(
-            status_code=503,
-            detail=f"Error al obtener resumen: {str(e)}"
-        )
+    agents_result, queues_result = await cached_get_many("/api/agents", "/api/queues")
+    
+    # Sin conexión con Asternic no hay resumen; un error HTTP en una sola parte la deja vacía
+    for result in (agents_result, queues_result):
+        if isinstance(result, AsternicError) and result.status_code is None:
+            raise asternic_http_error(result, "Error al obtener resumen")
+    set_freshness_headers(response, agents_result, queues_result)
+    agents_data = agents_result.data if isinstance(agents_result, CachedResult) else {}
+    queues_data = queues_result.data if isinstance(queues_result, CachedResult) else {}
+    agents_data = agents_data if isinstance(agents_data, dict) else {}
+    queues_data = queues_data if isinstance(queues_data, dict) else {}
+    
+    # Calcular métricas
+    agents = agents_data.get('agents', [])
+    total_agents = len(agents)
+    available = sum(1 for a in agents if 'available' in str(a.get('status', '')).lower())
+    busy = sum(1 for a in agents if 'busy' in str(a.get('status', '')).lower())
+    paused = sum(1 for a in agents if 'pause' in str(a.get('status', '')).lower())
+    
+    queues = queues_data.get('queues', [])
+    total_waiting = sum(int(q.get('waiting', 0)) for q in queues)
+    
+    return {
+        "agents": {
+            "total": total_agents,
+            "available": available,
+            "busy": busy,
+            "paused": paused,
+            "offline": total_agents - (available + busy + paused)
+        },
+        "queues": {
+            "total_waiting": total_waiting,
+            "queues": queues
+        },
+        "timestamp": "now"
+    }
 
 def normalize_status(status: str) -> str:
     """
@@ -398,7 +444,7 @@ def normalize_status(status: str) -> str:
 # ============================================
 
 @router.get("/agents/realtime-status")
-def get_agents_realtime_status(db: Session = Depends(get_db)):
+def get_agents_realtime_status_legacy(db: Session = Depends(get_db)):
     """
     Obtiene estado en tiempo real de todos los agentes usando qstats.agent_activity
     Incluye nombres de agentes, pausas y colas desde qstats
@@ -423,8 +469,23 @@ def get_agents_realtime_status(db: Session = Depends(get_db)):
             ORDER BY aa.agent
         """)
         
-        result = db.execute(latest_activities).fetchall()
-        result = db.execute(latest_activities).fetchall()
+        # Con la proyección en memoria no hace falta recorrer el historial
+        if agent_state_ready():
+            now = datetime.now()
+            result = [
+                (
+                    record.agent,
+                    record.queue,
+                    record.event,
+                    record.data,
+                    record.since,
+                    record.lasted,
+                    int((now - record.since).total_seconds()) if record.since else 0
+                )
+                for record in agent_state.latest_activities()
+            ]
+        else:
+            result = db.execute(latest_activities).fetchall()
         
         agents = []
         for row in result:
@@ -616,14 +677,18 @@ def get_agent_details(agent_extension: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Error al obtener detalles del agente: {str(e)}")
 
 @router.get("/agents/sessions")
-def get_agents_sessions(db: Session = Depends(get_db)):
+@cached(ttl=5)
+async def get_agents_sessions(db: AsyncSession = Depends(get_async_db)):
     """
     Obtiene todas las sesiones activas de agentes
     """
+    return await db.run_sync(load_agents_sessions)
+
+
+def load_agents_sessions(db: Session):
     sessions_query = text("""
         SELECT 
             ases.agent,
-            u.name as agent_name,
             ases.state,
             ases.queue,
             ases.datetime,
@@ -631,24 +696,24 @@ def get_agents_sessions(db: Session = Depends(get_db)):
             ases.sessioncount,
             TIMESTAMPDIFF(SECOND, ases.datetime, NOW()) as session_duration
         FROM qstats.agent_activity_session ases
-        LEFT JOIN asterisk.users u ON ases.agent = u.extension
         WHERE ases.state = 'LOGGEDIN'
         ORDER BY ases.datetime DESC
     """)
     
     result = db.execute(sessions_query).fetchall()
+    user_names = catalogs.get(db, "users")
     
     sessions = []
     for row in result:
         sessions.append({
             'agent': row[0],
-            'name': row[1] or f"Agente {row[0]}",
-            'state': row[2],
-            'queue': row[3],
-            'loginTime': row[4].isoformat() if row[4] else None,
-            'inCall': bool(row[5]),
-            'sessionCount': row[6],
-            'sessionDuration': row[7] or 0
+            'name': user_names.get(row[0]) or f"Agente {row[0]}",
+            'state': row[1],
+            'queue': row[2],
+            'loginTime': row[3].isoformat() if row[3] else None,
+            'inCall': bool(row[4]),
+            'sessionCount': row[5],
+            'sessionDuration': row[6] or 0
         })
     
     return {
@@ -658,77 +723,117 @@ def get_agents_sessions(db: Session = Depends(get_db)):
     }
 
 @router.get("/queues/realtime-metrics")
-def get_queues_realtime_metrics(db: Session = Depends(get_db)):
+@cached(ttl=5)
+async def get_queues_realtime_metrics(db: AsyncSession = Depends(get_async_db)):
     """
     Obtiene métricas en tiempo real de todas las colas
     Usando queuelog y estadísticas de QStats
     """
+    return await db.run_sync(load_queues_realtime_metrics)
+
+
+def load_queues_realtime_metrics(db: Session):
     try:
-        metrics_query = text("""
-            SELECT 
-                qn.queue as queue_name,
-                qn.device as queue_id,
-                -- Llamadas en espera (últimos 5 minutos)
-                (SELECT COUNT(DISTINCT callid)
-                 FROM asteriskcdrdb.queuelog ql
-                 WHERE ql.queuename = qn.device
-                 AND ql.event = 'ENTERQUEUE'
-                 AND ql.time >= DATE_SUB(NOW(), INTERVAL 5 MINUTE)
-                 AND NOT EXISTS (
-                     SELECT 1 FROM asteriskcdrdb.queuelog ql2
-                     WHERE ql2.callid = ql.callid
-                     AND ql2.event IN ('CONNECT', 'ABANDON', 'EXITWITHTIMEOUT')
-                 )
-                ) as calls_waiting,
-                -- Agentes logueados
-                (SELECT COUNT(DISTINCT agent)
-                 FROM qstats.agent_activity_session
-                 WHERE queue = qn.device
-                 AND state = 'LOGGEDIN'
-                ) as agents_logged,
-                -- Agentes disponibles
-                (SELECT COUNT(DISTINCT aa.agent)
-                 FROM qstats.agent_activity aa
-                 INNER JOIN (
-                     SELECT agent, MAX(id) as max_id
-                     FROM qstats.agent_activity
-                     WHERE queue = qn.device
-                     GROUP BY agent
-                 ) latest ON aa.id = latest.max_id
-                 WHERE aa.event LIKE '%UNPAUSE%' OR aa.event LIKE '%ADDMEMBER%'
-                ) as agents_available,
-                -- Llamadas del día
-                (SELECT COUNT(*)
-                 FROM asteriskcdrdb.queuelog ql
-                 WHERE ql.queuename = qn.device
-                 AND ql.event = 'ENTERQUEUE'
-                 AND DATE(ql.time) = CURDATE()
-                ) as calls_today,
-                -- Llamadas contestadas hoy
-                (SELECT COUNT(DISTINCT callid)
-                 FROM asteriskcdrdb.queuelog ql
-                 WHERE ql.queuename = qn.device
-                 AND ql.event IN ('CONNECT', 'COMPLETEAGENT', 'COMPLETECALLER')
-                 AND DATE(ql.time) = CURDATE()
-                ) as answered_today
-            FROM qstats.queuenames qn
-            ORDER BY qn.queue
-        """)
+        # Llamadas en espera: desde el estado en memoria del tail de queuelog,
+        # o con la consulta de los últimos 5 minutos si el tail no está al día
+        if queue_state_ready():
+            waiting_by_queue = queue_calls.waiting_by_queue()
+        else:
+            waiting_by_queue = dict(db.execute(text("""
+                SELECT ql.queuename, COUNT(DISTINCT ql.callid)
+                FROM asteriskcdrdb.queuelog ql
+                WHERE ql.event = 'ENTERQUEUE'
+                AND ql.time >= DATE_SUB(NOW(), INTERVAL 5 MINUTE)
+                AND NOT EXISTS (
+                    SELECT 1 FROM asteriskcdrdb.queuelog ql2
+                    WHERE ql2.callid = ql.callid
+                    AND ql2.event IN ('CONNECT', 'ABANDON', 'EXITWITHTIMEOUT')
+                )
+                GROUP BY ql.queuename
+            """)).fetchall())
+        
+        # Agentes disponibles por cola: desde la proyección en memoria, o con el
+        # último evento de cada agente por cola si la proyección no está al día
+        if agent_state_ready():
+            available_by_queue = agent_state.available_by_queue()
+        else:
+            available_by_queue = dict(db.execute(text("""
+                SELECT aa.queue, COUNT(DISTINCT aa.agent)
+                FROM qstats.agent_activity aa
+                INNER JOIN (
+                    SELECT agent, queue, MAX(id) as max_id
+                    FROM qstats.agent_activity
+                    GROUP BY agent, queue
+                ) latest ON aa.id = latest.max_id
+                WHERE aa.event LIKE '%UNPAUSE%' OR aa.event LIKE '%ADDMEMBER%'
+                GROUP BY aa.queue
+            """)).fetchall())
         
-        result = db.execute(metrics_query).fetchall()
+        # Llamadas del día desde la tabla de hechos (con los eventos aún sin aplicar)
+        totals = queue_call_totals(db, datetime.now().replace(hour=0, minute=0, second=0, microsecond=0))
+        if totals is not None:
+            calls_by_queue = totals[0]
+            metrics_query = text("""
+                SELECT 
+                    qn.queue as queue_name,
+                    qn.device as queue_id,
+                    -- Agentes logueados
+                    (SELECT COUNT(DISTINCT agent)
+                     FROM qstats.agent_activity_session
+                     WHERE queue = qn.device
+                     AND state = 'LOGGEDIN'
+                    ) as agents_logged
+                FROM qstats.queuenames qn
+                ORDER BY qn.queue
+            """)
+            result = [
+                (row[0], row[1], row[2],
+                 calls_by_queue[row[1]].entered if row[1] in calls_by_queue else 0,
+                 calls_by_queue[row[1]].answered if row[1] in calls_by_queue else 0)
+                for row in db.execute(metrics_query).fetchall()
+            ]
+        else:
+            metrics_query = text("""
+                SELECT 
+                    qn.queue as queue_name,
+                    qn.device as queue_id,
+                    -- Agentes logueados
+                    (SELECT COUNT(DISTINCT agent)
+                     FROM qstats.agent_activity_session
+                     WHERE queue = qn.device
+                     AND state = 'LOGGEDIN'
+                    ) as agents_logged,
+                    -- Llamadas del día
+                    (SELECT COUNT(*)
+                     FROM asteriskcdrdb.queuelog ql
+                     WHERE ql.queuename = qn.device
+                     AND ql.event = 'ENTERQUEUE'
+                     AND DATE(ql.time) = CURDATE()
+                    ) as calls_today,
+                    -- Llamadas contestadas hoy
+                    (SELECT COUNT(DISTINCT callid)
+                     FROM asteriskcdrdb.queuelog ql
+                     WHERE ql.queuename = qn.device
+                     AND ql.event IN ('CONNECT', 'COMPLETEAGENT', 'COMPLETECALLER')
+                     AND DATE(ql.time) = CURDATE()
+                    ) as answered_today
+                FROM qstats.queuenames qn
+                ORDER BY qn.queue
+            """)
+            result = db.execute(metrics_query).fetchall()
         
         queues = []
         for row in result:
-            total_today = row[5] or 0
-            answered_today = row[6] or 0
+            total_today = row[3] or 0
+            answered_today = row[4] or 0
             answer_rate = round((answered_today / total_today * 100), 1) if total_today > 0 else 0
             
             queues.append({
                 "queueName": row[0],
                 "queueId": row[1],
-                "callsWaiting": row[2] or 0,
-                "agentsLogged": row[3] or 0,
-                "agentsAvailable": row[4] or 0,
+                "callsWaiting": waiting_by_queue.get(row[1], 0),
+                "agentsLogged": row[2] or 0,
+                "agentsAvailable": available_by_queue.get(row[1], 0),
                 "callsToday": total_today,
                 "answeredToday": answered_today,
                 "answerRate": answer_rate
@@ -750,53 +855,57 @@ def get_event_types(db: Session = Depends(get_db)):
     Obtiene todos los tipos de eventos disponibles en el sistema
     """
     try:
-        events = db.query(QEvent).order_by(QEvent.event_id).all()
+        events = catalogs.get(db, "qevent")
         
         return {
             "events": [
                 {
-                    "id": e.event_id,
-                    "name": e.event,
-                    "description": get_event_description(e.event)
+                    "id": event_id,
+                    "name": event,
+                    "description": get_event_description(event)
                 }
-                for e in events
+                for event_id, event in sorted(events.items())
             ]
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
     
 @router.get("/agents/pauses")
-def get_agents_pauses(db: Session = Depends(get_db)):
+@cached(ttl=5)
+async def get_agents_pauses(db: AsyncSession = Depends(get_async_db)):
     """
     Obtiene todos los agentes en pausa con sus motivos
     """
+    return await db.run_sync(load_agents_pauses)
+
+
+def load_agents_pauses(db: Session):
     pauses_query = text("""
         SELECT 
             ap.agent,
-            u.name as agent_name,
             ap.state,
             ap.queue,
             ap.data as pause_reason,
             ap.datetime,
             TIMESTAMPDIFF(SECOND, ap.datetime, NOW()) as pause_duration
         FROM qstats.agent_activity_pause ap
-        LEFT JOIN asterisk.users u ON ap.agent = u.extension
         WHERE ap.state = 'PAUSED'
         ORDER BY ap.datetime DESC
     """)
     
     result = db.execute(pauses_query).fetchall()
+    user_names = catalogs.get(db, "users")
     
     pauses = []
     for row in result:
         pauses.append({
             'agent': row[0],
-            'name': row[1] or f"Agente {row[0]}",
-            'state': row[2],
-            'queue': row[3],
-            'pauseReason': row[4] or 'Sin motivo',
-            'pauseStart': row[5].isoformat() if row[5] else None,
-            'pauseDuration': row[6] or 0
+            'name': user_names.get(row[0]) or f"Agente {row[0]}",
+            'state': row[1],
+            'queue': row[2],
+            'pauseReason': row[3] or 'Sin motivo',
+            'pauseStart': row[4].isoformat() if row[4] else None,
+            'pauseDuration': row[5] or 0
         })
     
     return {
@@ -829,7 +938,6 @@ def get_agents_activity_detailed(
                 aa.id,
                 aa.datetime,
                 aa.queue,
-                qn.queue as queue_name,
                 aa.agent,
                 aa.event as event_code,
                 aa.data,
@@ -837,7 +945,6 @@ def get_agents_activity_detailed(
                 aa.uniqueid,
                 aa.computed
             FROM qstats.agent_activity aa
-            LEFT JOIN qstats.queuenames qn ON aa.queue = qn.device
             WHERE aa.datetime >= :since
             """ + (" AND aa.agent = :agent" if agent else "") + """
             ORDER BY aa.datetime DESC
@@ -849,6 +956,7 @@ def get_agents_activity_detailed(
             params["agent"] = agent
         
         result = db.execute(query, params).fetchall()
+        queue_names = catalogs.get(db, "queuenames")
         
         activities = []
         for row in result:
@@ -856,14 +964,14 @@ def get_agents_activity_detailed(
                 "id": row[0],
                 "timestamp": row[1].isoformat() if row[1] else None,
                 "queue": row[2],
-                "queue_name": row[3] or row[2],
-                "agent": row[4],
-                "event": row[5],
-                "event_description": get_event_description(row[5]),
-                "data": row[6],
-                "duration": row[7],
-                "uniqueid": row[8],
-                "computed": row[9]
+                "queue_name": queue_names.get(row[2]) or row[2],
+                "agent": row[3],
+                "event": row[4],
+                "event_description": get_event_description(row[4]),
+                "data": row[5],
+                "duration": row[6],
+                "uniqueid": row[7],
+                "computed": row[8]
             })
         
         # Agrupar por agente para estadísticas
@@ -909,14 +1017,14 @@ def get_all_event_types(db: Session = Depends(get_db)):
     Obtiene todos los tipos de eventos registrados en qevent
     """
     try:
-        events = db.query(QEvent).order_by(QEvent.event_id).all()
+        events = catalogs.get(db, "qevent")
         
         event_list = []
-        for event in events:
+        for event_id, event in sorted(events.items()):
             event_list.append({
-                "id": event.event_id,
-                "code": event.event,
-                "description": get_event_description(event.event)
+                "id": event_id,
+                "code": event,
+                "description": get_event_description(event)
             })
         
         return {
@@ -1,13 +1,22 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text, func, and_, or_, case
-from database import get_db
+from database import get_db, get_async_db, get_analytics_db
+from services.response_cache import cached, response_cache
+from services.queue_facts import queue_call_totals
+from services.queue_histograms import HISTOGRAM_CACHE_TTL, HISTOGRAM_MAX_SECONDS, WaitHistogram, collect_wait_histograms, histograms_available, histograms_nbytes
+from services.queue_sketches import METRICS, SKETCH_CACHE_TTL, TimeSummary, collect_time_sketches, sketches_available, sketches_nbytes
+from services.queue_state import queue_calls, queue_state_ready
 from models import CDR, QueueLog, QueueStats, QueueStatsMV
 from schemas import CDRResponse
 from datetime import datetime, timedelta
+import math
 
 router = APIRouter(prefix="/api/dashboard", tags=["Dashboard"])
 
+DEFAULT_PERCENTILES = [50, 90, 99]
+
 @router.get("/calls")
 def get_recent_calls(db: Session = Depends(get_db)):
     calls = db.query(CDR).order_by(CDR.calldate.desc()).limit(20).all()
@@ -45,15 +54,23 @@ def get_dashboard_stats(db: Session = Depends(get_db)):
 # ============================================
 # ENDPOINTS NUEVOS PARA MÉTRICAS DE COLAS
 # ============================================
+# queue-metrics, queue-percentiles, queue-sla y queue-sla/curve son sync (threadpool): mezclan
+# sketches/histogramas en Python y pueden esperar el single-flight de
+# response_cache, dos cosas que con run_sync bloquearían el event loop
 
 @router.get("/queue-metrics")
+@cached(ttl=30)
 def get_queue_metrics(
     period: str = Query("today", enum=["today", "week", "month"]),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_analytics_db)
 ):
     """
     Obtiene métricas detalladas por cola usando queuelog
     """
+    return load_queue_metrics(db, period)
+
+
+def load_queue_metrics(db: Session, period: str):
     now = datetime.now()
     
     # Calcular fecha de inicio según período
@@ -64,24 +81,31 @@ def get_queue_metrics(
     else:  # month
         start_date = now - timedelta(days=30)
     
-    # Consulta usando queuelog (nombre correcto de tabla) con time como datetime
-    metrics_query = text("""
-        SELECT 
-            queuename,
-            COUNT(DISTINCT CASE WHEN event = 'ENTERQUEUE' THEN callid END) as total_calls,
-            COUNT(DISTINCT CASE WHEN event IN ('CONNECT', 'COMPLETEAGENT', 'COMPLETECALLER') THEN callid END) as answered_calls,
-            COUNT(DISTINCT CASE WHEN event IN ('ABANDON', 'EXITWITHTIMEOUT', 'EXITWITHKEY') THEN callid END) as abandoned_calls,
-            AVG(CASE WHEN event = 'CONNECT' AND data1 REGEXP '^[0-9]+$' THEN CAST(data1 AS DECIMAL(10,2)) END) as avg_wait_time,
-            AVG(CASE WHEN event IN ('COMPLETEAGENT', 'COMPLETECALLER') AND data2 REGEXP '^[0-9]+$' THEN CAST(data2 AS DECIMAL(10,2)) END) as avg_talk_time,
-            MAX(CASE WHEN event = 'CONNECT' AND data1 REGEXP '^[0-9]+$' THEN CAST(data1 AS DECIMAL(10,2)) END) as max_wait_time
-        FROM asteriskcdrdb.queuelog
-        WHERE time >= :start_date
-            AND queuename != 'NONE'
-        GROUP BY queuename
-        ORDER BY queuename
-    """)
-    
-    result = db.execute(metrics_query, {"start_date": start_date}).fetchall()
+    # Una fila por llamada con los tiempos ya tipados, más los eventos aún sin aplicar
+    totals = queue_call_totals(db, start_date)
+    if totals is not None:
+        result = [
+            (queue_name, calls.entered, calls.answered, calls.abandoned + calls.timeout + calls.exitkey,
+             calls.avg_wait, calls.avg_talk, calls.wait_max)
+            for queue_name, calls in sorted(totals[0].items())
+        ]
+    else:
+        metrics_query = text("""
+            SELECT 
+                queuename,
+                COUNT(DISTINCT CASE WHEN event = 'ENTERQUEUE' THEN callid END) as total_calls,
+                COUNT(DISTINCT CASE WHEN event IN ('CONNECT', 'COMPLETEAGENT', 'COMPLETECALLER') THEN callid END) as answered_calls,
+                COUNT(DISTINCT CASE WHEN event IN ('ABANDON', 'EXITWITHTIMEOUT', 'EXITWITHKEY') THEN callid END) as abandoned_calls,
+                AVG(CASE WHEN event = 'CONNECT' AND data1 REGEXP '^[0-9]+$' THEN CAST(data1 AS DECIMAL(10,2)) END) as avg_wait_time,
+                AVG(CASE WHEN event IN ('COMPLETEAGENT', 'COMPLETECALLER') AND data2 REGEXP '^[0-9]+$' THEN CAST(data2 AS DECIMAL(10,2)) END) as avg_talk_time,
+                MAX(CASE WHEN event = 'CONNECT' AND data1 REGEXP '^[0-9]+$' THEN CAST(data1 AS DECIMAL(10,2)) END) as max_wait_time
+            FROM asteriskcdrdb.queuelog
+            WHERE time >= :start_date
+                AND queuename != 'NONE'
+            GROUP BY queuename
+            ORDER BY queuename
+        """)
+        result = db.execute(metrics_query, {"start_date": start_date}).fetchall()
     
     queue_metrics = []
     for row in result:
@@ -103,56 +127,114 @@ def get_queue_metrics(
             "max_wait_time": round(row[6] or 0, 1)
         })
     
+    if sketches_available():
+        # Percentiles de los sketches por hora, mezclados para el período
+        sketches = load_time_sketches(db, period)
+        for metrics in queue_metrics:
+            queue_sketches = sketches.get(metrics["queue_name"], {})
+            for metric in METRICS:
+                summary = queue_sketches.get(metric) or TimeSummary()
+                metrics[f"{metric}_percentiles"] = summary.percentiles(DEFAULT_PERCENTILES)
+    
     return {
         "period": period,
         "queues": queue_metrics
     }
 
+
+def load_time_sketches(db: Session, period: str):
+    """Sketches de espera/conversación/timbrado del período, compartidos entre peticiones"""
+    return response_cache.get_or_load(
+        "queue_time_sketches", ("queue_time_sketches", period), SKETCH_CACHE_TTL,
+        lambda: collect_time_sketches(db, queue_period_start(period)),
+        size=sketches_nbytes
+    )
+
+
+@router.get("/queue-percentiles")
+@cached(ttl=30)
+def get_queue_percentiles(
+    period: str = Query("today", enum=["today", "week", "month"]),
+    percentiles: str = Query("50,90,99", description="Percentiles separados por comas, p. ej. 50,90,95,99"),
+    db: Session = Depends(get_analytics_db)
+):
+    """
+    Percentiles de espera, conversación y timbrado por cola y del total,
+    calculados mezclando los sketches por hora del período.
+    """
+    if not sketches_available():
+        raise HTTPException(status_code=503, detail="Los percentiles de colas no están disponibles")
+    try:
+        quantiles = sorted({float(value) for value in percentiles.split(",") if value.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Percentiles inválidos")
+    if not quantiles or any(not math.isfinite(q) or q < 0 or q > 100 for q in quantiles):
+        raise HTTPException(status_code=400, detail="Los percentiles deben estar entre 0 y 100")
+    return load_queue_percentiles(db, period, quantiles)
+
+
+def load_queue_percentiles(db: Session, period: str, quantiles: list):
+    sketches = load_time_sketches(db, period)
+
+    totals = {metric: TimeSummary() for metric in METRICS}
+    queues = []
+    for queue_name, queue_sketches in sorted(sketches.items()):
+        entry = {"queue_name": queue_name}
+        for metric in METRICS:
+            summary = queue_sketches.get(metric) or TimeSummary()
+            totals[metric].merge(summary)
+            entry[metric] = summary.describe(quantiles)
+        queues.append(entry)
+
+    return {
+        "period": period,
+        "percentiles": [f"p{q:g}" for q in quantiles],
+        "queues": queues,
+        "total": {metric: summary.describe(quantiles) for metric, summary in totals.items()}
+    }
+
 @router.get("/queue-sla")
+@cached(ttl=30)
 def get_queue_sla(
     period: str = Query("today", enum=["today", "week", "month"]),
     sla_threshold: int = Query(30, description="SLA threshold in seconds"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_analytics_db)
 ):
     """
     Calcula el nivel de servicio (SLA) por cola
     SLA = % de llamadas contestadas dentro del umbral definido
     """
+    return load_queue_sla(db, period, sla_threshold)
+
+
+def queue_period_start(period: str) -> datetime:
     now = datetime.now()
-    
     if period == "today":
-        start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    elif period == "week":
-        start_date = now - timedelta(days=7)
-    else:  # month
-        start_date = now - timedelta(days=30)
-    
-    # Calcular SLA usando queuelog (datetime, no timestamp)
-    sla_query = text("""
-        SELECT 
-            queuename,
-            COUNT(DISTINCT CASE WHEN event = 'ENTERQUEUE' THEN callid END) as total_calls,
-            COUNT(DISTINCT CASE 
-                WHEN event = 'CONNECT' 
-                AND data1 REGEXP '^[0-9]+$'
-                AND CAST(data1 AS DECIMAL(10,2)) <= :sla_threshold 
-                THEN callid 
-            END) as calls_within_sla,
-            AVG(CASE 
-                WHEN event = 'CONNECT' AND data1 REGEXP '^[0-9]+$'
-                THEN CAST(data1 AS DECIMAL(10,2)) 
-            END) as avg_answer_time
-        FROM asteriskcdrdb.queuelog
-        WHERE time >= :start_date
-            AND queuename != 'NONE'
-        GROUP BY queuename
-        ORDER BY queuename
-    """)
-    
-    result = db.execute(sla_query, {
-        "start_date": start_date,
-        "sla_threshold": sla_threshold
-    }).fetchall()
+        return now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "week":
+        return now - timedelta(days=7)
+    return now - timedelta(days=30)
+
+
+def load_wait_histograms(db: Session, period: str):
+    """Histogramas de espera del período, compartidos entre umbrales y peticiones"""
+    return response_cache.get_or_load(
+        "queue_wait_histograms", ("queue_wait_histograms", period), HISTOGRAM_CACHE_TTL,
+        lambda: collect_wait_histograms(db, queue_period_start(period)),
+        size=histograms_nbytes
+    )
+
+
+def load_queue_sla(db: Session, period: str, sla_threshold: int):
+    if histograms_available() and 0 <= sla_threshold < HISTOGRAM_MAX_SECONDS:
+        # Suma de prefijo sobre el histograma: cambiar el umbral no toca queuelog
+        result = [
+            (queue_name, hist.entered, hist.answered_within(sla_threshold),
+             hist.connect_sum / hist.answered if hist.answered else 0)
+            for queue_name, hist in sorted(load_wait_histograms(db, period).items())
+        ]
+    else:
+        result = load_queue_sla_rows(db, queue_period_start(period), sla_threshold)
     
     sla_data = []
     for row in result:
@@ -186,12 +268,128 @@ def get_queue_sla(
         "queues": sla_data
     }
 
+
+def load_queue_sla_rows(db: Session, start_date: datetime, sla_threshold: int):
+    """SLA directo, para umbrales fuera del histograma o si este no está disponible"""
+    totals = queue_call_totals(db, start_date, sla_threshold)
+    if totals is not None:
+        return [
+            (queue_name, calls.entered, calls.within_sla, calls.avg_wait)
+            for queue_name, calls in sorted(totals[0].items())
+        ]
+
+    sla_query = text("""
+        SELECT 
+            queuename,
+            COUNT(DISTINCT CASE WHEN event = 'ENTERQUEUE' THEN callid END) as total_calls,
+            COUNT(DISTINCT CASE 
+                WHEN event = 'CONNECT' 
+                AND data1 REGEXP '^[0-9]+$'
+                AND CAST(data1 AS DECIMAL(10,2)) <= :sla_threshold 
+                THEN callid 
+            END) as calls_within_sla,
+            AVG(CASE 
+                WHEN event = 'CONNECT' AND data1 REGEXP '^[0-9]+$'
+                THEN CAST(data1 AS DECIMAL(10,2)) 
+            END) as avg_answer_time
+        FROM asteriskcdrdb.queuelog
+        WHERE time >= :start_date
+            AND queuename != 'NONE'
+        GROUP BY queuename
+        ORDER BY queuename
+    """)
+    
+    return db.execute(sla_query, {
+        "start_date": start_date,
+        "sla_threshold": sla_threshold
+    }).fetchall()
+
+
+@router.get("/queue-sla/curve")
+@cached(ttl=30)
+def get_queue_sla_curve(
+    period: str = Query("today", enum=["today", "week", "month"]),
+    max_seconds: int = Query(120, ge=1, le=HISTOGRAM_MAX_SECONDS - 1, description="Último umbral de la curva"),
+    step: int = Query(5, ge=1, le=300, description="Segundos entre umbrales"),
+    db: Session = Depends(get_analytics_db)
+):
+    """
+    Curvas de nivel de servicio por cola: para cada umbral t (0, step, ... max_seconds)
+    el % de llamadas contestadas y abandonadas con espera <= t.
+    """
+    if not histograms_available():
+        raise HTTPException(status_code=503, detail="Los histogramas de espera no están disponibles")
+    return load_queue_sla_curve(db, period, max_seconds, step)
+
+
+def load_queue_sla_curve(db: Session, period: str, max_seconds: int, step: int):
+    histograms = load_wait_histograms(db, period)
+    thresholds = list(range(0, max_seconds + 1, step))
+
+    total = WaitHistogram()
+    queues = []
+    for queue_name, hist in sorted(histograms.items()):
+        total.merge(hist)
+        queues.append({"queue_name": queue_name, **sla_curve(hist, max_seconds, step)})
+
+    return {
+        "period": period,
+        "thresholds": thresholds,
+        "queues": queues,
+        "total": sla_curve(total, max_seconds, step)
+    }
+
+
+def sla_curve(hist: WaitHistogram, max_seconds: int, step: int):
+    entered = hist.entered
+
+    def percentages(counts):
+        return [round(count / entered * 100, 1) if entered > 0 else 0 for count in counts]
+
+    return {
+        "total_calls": entered,
+        "answered_calls": hist.answered,
+        "abandoned_calls": hist.abandoned,
+        "sla_percentage": percentages(hist.curve("connect", max_seconds, step)),
+        "abandon_percentage": percentages(hist.curve("abandon", max_seconds, step))
+    }
+
 @router.get("/active-calls")
-def get_active_calls(db: Session = Depends(get_db)):
+@cached(ttl=3)
+async def get_active_calls(db: AsyncSession = Depends(get_async_db)):
     """
     Obtiene llamadas activas en tiempo real usando queuelog
     Detecta llamadas que entraron (ENTERQUEUE) pero no han terminado
     """
+    return await db.run_sync(load_active_calls)
+
+
+def load_active_calls(db: Session):
+    # Si el tail de queuelog está al día, se responde desde el estado en memoria
+    if queue_state_ready():
+        now = datetime.now()
+        active_calls = [
+            {
+                "queue_name": call.queuename,
+                "call_id": call.callid,
+                "enter_time": call.enter_time.isoformat() if call.enter_time else None,
+                "agent": call.agent,
+                "connect_time": call.connect_time.isoformat() if call.connect_time else None,
+                "wait_duration": int((now - call.enter_time).total_seconds()) if call.enter_time else 0,
+                "status": call.status
+            }
+            for call in queue_calls.active_calls()[:100]
+        ]
+        waiting_calls = sum(1 for call in active_calls if call["status"] == "waiting")
+        
+        return {
+            "total_active": len(active_calls),
+            "waiting_calls": waiting_calls,
+            "calls_in_progress": len(active_calls) - waiting_calls,
+            "calls": active_calls,
+            "timestamp": now.isoformat()
+        }
+    
     # Buscar llamadas de las últimas 2 horas que aún no han finalizado
     two_hours_ago = datetime.now() - timedelta(hours=2)
     
@@ -252,29 +450,38 @@ def get_active_calls(db: Session = Depends(get_db)):
     }
 
 @router.get("/queue-summary")
-def get_queue_summary(db: Session = Depends(get_db)):
+@cached(ttl=10)
+async def get_queue_summary(db: AsyncSession = Depends(get_async_db)):
     """
     Resumen ejecutivo de todas las colas combinando métricas en tiempo real
     """
+    return await db.run_sync(load_queue_summary)
+
+
+def load_queue_summary(db: Session):
     # Métricas de hoy
     today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
     
-    summary_query = text("""
-        SELECT 
-            COUNT(DISTINCT queuename) as total_queues,
-            COUNT(DISTINCT CASE WHEN event = 'ENTERQUEUE' THEN callid END) as total_calls_today,
-            COUNT(DISTINCT CASE WHEN event IN ('CONNECT', 'COMPLETEAGENT', 'COMPLETECALLER') THEN callid END) as answered_today,
-            COUNT(DISTINCT CASE WHEN event IN ('ABANDON', 'EXITWITHTIMEOUT') THEN callid END) as abandoned_today,
-            AVG(CASE 
-                WHEN event = 'CONNECT' AND data1 REGEXP '^[0-9]+$'
-                THEN CAST(data1 AS DECIMAL(10,2)) 
-            END) as avg_wait_today
-        FROM asteriskcdrdb.queuelog
-        WHERE time >= :today_start
-            AND queuename != 'NONE'
-    """)
-    
-    result = db.execute(summary_query, {"today_start": today_start}).fetchone()
+    totals = queue_call_totals(db, today_start, overall=True)
+    if totals is not None:
+        by_queue, calls = totals
+        result = (len(by_queue), calls.entered, calls.answered, calls.abandoned + calls.timeout, calls.avg_wait)
+    else:
+        summary_query = text("""
+            SELECT 
+                COUNT(DISTINCT queuename) as total_queues,
+                COUNT(DISTINCT CASE WHEN event = 'ENTERQUEUE' THEN callid END) as total_calls_today,
+                COUNT(DISTINCT CASE WHEN event IN ('CONNECT', 'COMPLETEAGENT', 'COMPLETECALLER') THEN callid END) as answered_today,
+                COUNT(DISTINCT CASE WHEN event IN ('ABANDON', 'EXITWITHTIMEOUT') THEN callid END) as abandoned_today,
+                AVG(CASE 
+                    WHEN event = 'CONNECT' AND data1 REGEXP '^[0-9]+$'
+                    THEN CAST(data1 AS DECIMAL(10,2)) 
+                END) as avg_wait_today
+            FROM asteriskcdrdb.queuelog
+            WHERE time >= :today_start
+                AND queuename != 'NONE'
+        """)
+        result = db.execute(summary_query, {"today_start": today_start}).fetchone()
     
     total_calls = result[1] or 0
     answered = result[2] or 0
@@ -2,17 +2,19 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import text, func
-from database import get_db
-from models import QueueName, QueueStats, SQLRealtime, QEvent, QueueLog, Queue, QueueMember
+from database import get_db, get_analytics_db
+from models import QueueName, QueueStats, QEvent, QueueLog, Queue, QueueMember
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
 import sys
 import os
 
-# Agregar el directorio padre al path para importar utils
+# Agregar el directorio padre al path para importar services
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils.php_parser import parse_sqlrealtime_data
+from services.response_cache import cached
+from services.catalogs import catalogs
+from services.sqlrealtime_snapshot import sqlrealtime_snapshot
 
 router = APIRouter(prefix="/api/queues", tags=["queues"])
 
@@ -122,6 +124,7 @@ def create_queue(queue_data: QueueCreate, db: Session = Depends(get_db)):
         db.add(new_queue)
         db.commit()
         db.refresh(new_queue)
+        catalogs.invalidate("queuenames")
         
         print(f"✅ Cola creada exitosamente: {new_queue.device} - {new_queue.queue}")
         
@@ -167,6 +170,7 @@ def update_queue(queue_id: str, queue_data: QueueUpdate, db: Session = Depends(g
         
         db.commit()
         db.refresh(queue)
+        catalogs.invalidate("queuenames")
         
         return queue
     except HTTPException:
@@ -186,6 +190,7 @@ def delete_queue(queue_id: str, db: Session = Depends(get_db)):
         
         db.delete(queue)
         db.commit()
+        catalogs.invalidate("queuenames")
         
         return {"message": "Cola eliminada exitosamente", "id": queue_id}
     except HTTPException:
@@ -201,30 +206,16 @@ def delete_queue(queue_id: str, db: Session = Depends(get_db)):
 # ============================================================================
 
 @router.get("/stats/realtime")
+@cached(ttl=5)
 def get_queues_realtime_stats(db: Session = Depends(get_db)):
     """
     Obtiene estadísticas en tiempo real de todas las colas
     usando datos de sqlrealtime (datos parseados de PHP)
     """
     try:
-        # Obtener todos los registros de sqlrealtime
-        realtime_records = db.query(SQLRealtime).all()
-        
-        queues_stats = []
-        
-        for record in realtime_records:
-            # Parsear datos PHP serializados
-            metrics = parse_sqlrealtime_data(record.data)
-            
-            if metrics:
-                queues_stats.append({
-                    "session_id": record.user,
-                    "last_update": record.lastupdate.isoformat() if record.lastupdate else None,
-                    "metrics": metrics
-                })
-        
-        # Calcular totales globales
-        total_metrics = calculate_global_metrics(queues_stats)
+        # Solo se leen y parsean las filas cuyo lastupdate avanzó desde el último poll
+        sqlrealtime_snapshot.refresh(db)
+        queues_stats, total_metrics = sqlrealtime_snapshot.current()
         
         return {
             "queues": queues_stats,
@@ -240,9 +231,10 @@ def get_queues_realtime_stats(db: Session = Depends(get_db)):
 
 
 @router.get("/stats/summary")
+@cached(ttl=60)
 def get_queues_summary(
     hours: int = 24,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_analytics_db)
 ):
     """
     Obtiene resumen de estadísticas de colas usando queue_stats
@@ -252,24 +244,31 @@ def get_queues_summary(
     try:
         since = datetime.now() - timedelta(hours=hours)
         
+        # Los ids de evento salen del catálogo de qevent, así no se une qevent por fila
+        event_ids = catalogs.inverse(db, "qevent")
+        
         # Query para obtener estadísticas desde queue_stats
         query = text("""
             SELECT 
                 DATE(qs.datetime) as date,
                 COUNT(DISTINCT qs.uniqued) as total_calls,
-                COUNT(CASE WHEN qe.event = 'CONNECT' THEN 1 END) as answered_calls,
-                COUNT(CASE WHEN qe.event = 'ABANDON' THEN 1 END) as abandoned_calls,
-                COUNT(CASE WHEN qe.event = 'EXITWITHTIMEOUT' THEN 1 END) as timeout_calls,
-                AVG(CASE WHEN qe.event = 'CONNECT' THEN CAST(qs.info1 AS UNSIGNED) END) as avg_wait_time,
-                MAX(CASE WHEN qe.event = 'CONNECT' THEN CAST(qs.info1 AS UNSIGNED) END) as max_wait_time
+                COUNT(CASE WHEN qs.gevent = :connect_id THEN 1 END) as answered_calls,
+                COUNT(CASE WHEN qs.gevent = :abandon_id THEN 1 END) as abandoned_calls,
+                COUNT(CASE WHEN qs.gevent = :timeout_id THEN 1 END) as timeout_calls,
+                AVG(CASE WHEN qs.gevent = :connect_id THEN CAST(qs.info1 AS UNSIGNED) END) as avg_wait_time,
+                MAX(CASE WHEN qs.gevent = :connect_id THEN CAST(qs.info1 AS UNSIGNED) END) as max_wait_time
             FROM qstats.queue_stats qs
-            LEFT JOIN qstats.qevent qe ON qs.gevent = qe.event_id
             WHERE qs.datetime >= :since
             GROUP BY DATE(qs.datetime)
             ORDER BY date DESC
         """)
         
-        result = db.execute(query, {"since": since}).fetchall()
+        result = db.execute(query, {
+            "since": since,
+            "connect_id": event_ids.get('CONNECT'),
+            "abandon_id": event_ids.get('ABANDON'),
+            "timeout_id": event_ids.get('EXITWITHTIMEOUT')
+        }).fetchall()
         
         daily_stats = []
         for row in result:
@@ -314,14 +313,12 @@ def get_queue_events(
                 ql.time,
                 ql.callid,
                 ql.queuename,
-                qn.queue as queue_display_name,
                 ql.agent,
                 ql.event,
                 ql.data1,
                 ql.data2,
                 ql.data3
             FROM asteriskcdrdb.queuelog ql
-            LEFT JOIN qstats.queuenames qn ON ql.queuename = qn.device
             WHERE 1=1
             """ + (f" AND ql.event = :event_type" if event_type else "") + """
             ORDER BY ql.time DESC
@@ -333,6 +330,7 @@ def get_queue_events(
             params["event_type"] = event_type
         
         result = db.execute(query, params).fetchall()
+        queue_names = catalogs.get(db, "queuenames")
         
         events = []
         for row in result:
@@ -340,13 +338,13 @@ def get_queue_events(
                 "timestamp": row[0].isoformat() if row[0] else None,
                 "call_id": row[1],
                 "queue": row[2],
-                "queue_name": row[3] or row[2],
-                "agent": row[4],
-                "event": row[5],
+                "queue_name": queue_names.get(row[2]) or row[2],
+                "agent": row[3],
+                "event": row[4],
                 "data": {
-                    "data1": row[6],
-                    "data2": row[7],
-                    "data3": row[8]
+                    "data1": row[5],
+                    "data2": row[6],
+                    "data3": row[7]
                 }
             })
         
@@ -410,14 +408,14 @@ def get_event_types(db: Session = Depends(get_db)):
     Obtiene catálogo de tipos de eventos disponibles
     """
     try:
-        events = db.query(QEvent).order_by(QEvent.event_id).all()
+        events = catalogs.get(db, "qevent")
         
         event_list = []
-        for event in events:
+        for event_id, event in sorted(events.items()):
             event_list.append({
-                "id": event.event_id,
-                "name": event.event,
-                "description": get_event_description(event.event)
+                "id": event_id,
+                "name": event,
+                "description": get_event_description(event)
             })
         
         return {
@@ -434,48 +432,6 @@ def get_event_types(db: Session = Depends(get_db)):
 # FUNCIONES AUXILIARES
 # ============================================================================
 
-def calculate_global_metrics(queues_stats: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """
-    Calcula métricas globales sumando todas las colas
-    """
-    totals = {
-        "calls": {
-            "received": 0,
-            "answered": 0,
-            "abandoned": 0,
-            "unanswered": 0
-        },
-        "times": {
-            "avg_wait": 0,
-            "avg_talk": 0
-        },
-        "sla": {
-            "percentage": 0
-        }
-    }
-    
-    total_received = 0
-    total_answered_sla = 0
-    
-    for queue in queues_stats:
-        metrics = queue.get("metrics", {})
-        calls = metrics.get("calls", {})
-        
-        totals["calls"]["received"] += calls.get("received", 0)
-        totals["calls"]["answered"] += calls.get("answered", 0)
-        totals["calls"]["abandoned"] += calls.get("abandoned", 0)
-        totals["calls"]["unanswered"] += calls.get("unanswered", 0)
-        
-        total_received += calls.get("received", 0)
-        total_answered_sla += calls.get("answered_sla", 0)
-    
-    # Calcular SLA global
-    if total_received > 0:
-        totals["sla"]["percentage"] = round((total_answered_sla / total_received) * 100, 2)
-    
-    return totals
-
-
 def get_event_description(event_name: Optional[str]) -> str:
     """
     Retorna descripción legible de un evento
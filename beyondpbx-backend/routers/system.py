@@ -0,0 +1,105 @@
+# routers/system.py
+from fastapi import APIRouter
+from services.response_cache import response_cache
+from services.catalogs import catalogs
+from services.snapshot_broadcast import broadcaster_stats
+from services.sqlrealtime_snapshot import sqlrealtime_snapshot
+from services.asternic_client import asternic_stats
+from services.queue_facts import queue_facts_stats
+from database import pool_stats, replica_stats
+from datetime import datetime
+
+router = APIRouter(prefix="/api/system", tags=["System"])
+
+
+@router.get("/cache")
+def get_cache_stats():
+    """
+    Estadísticas de la caché de respuestas (aciertos, fallos, peticiones
+    coalescidas por single-flight y uso de memoria por endpoint)
+    """
+    return {
+        "cache": response_cache.stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@router.get("/catalogs")
+def get_catalog_stats():
+    """
+    Estado de la caché de catálogos (entradas y número de recargas por tabla)
+    """
+    return {
+        "catalogs": catalogs.stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@router.get("/push")
+def get_push_stats():
+    """
+    Canales push (SSE): suscriptores conectados y deltas enviados por canal
+    """
+    return {
+        "channels": broadcaster_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@router.get("/sqlrealtime")
+def get_sqlrealtime_stats():
+    """
+    Snapshot incremental de sqlrealtime: filas en memoria, marca de agua,
+    blobs parseados y barridos de filas borradas
+    """
+    return {
+        "sqlrealtime": sqlrealtime_snapshot.stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@router.get("/asternic")
+def get_asternic_stats():
+    """
+    Conexión con Asternic: estado del circuit breaker, respuestas guardadas
+    y cuántas veces se sirvió una respuesta vencida
+    """
+    return {
+        "asternic": asternic_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@router.get("/queue-calls")
+def get_queue_calls_stats():
+    """
+    Tabla de hechos queue_calls: eventos de queuelog aún sin aplicar, antigüedad
+    del más viejo y si los endpoints de colas volvieron a queuelog por atraso
+    """
+    return {
+        "queue_calls": queue_facts_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@router.get("/pool")
+def get_pool_stats():
+    """
+    Pools de conexiones (sync y async): conexiones en uso, overflow, saturación
+    y tiempo de espera por checkout, para dimensionar workers y pool_size
+    """
+    return {
+        "pools": pool_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@router.get("/replicas")
+def get_replica_stats():
+    """
+    Réplicas de lectura configuradas: si están en rotación y su último retraso medido
+    """
+    return {
+        "replicas": replica_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
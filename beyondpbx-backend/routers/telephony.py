@@ -1,9 +1,23 @@
 from fastapi import APIRouter, Depends, HTTPException, Query 
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text, func, case
-from database import get_db
-from models import CDR, User, SIP, Trunk, IVRDetail, IVREntry, IncomingRoute
-from datetime import datetime, timedelta
+from database import get_db, get_async_db, get_analytics_db, get_async_analytics_db
+from models import CDR, User, SIP, Trunk, IVRDetail, IncomingRoute
+from datetime import date, datetime, timedelta
+from typing import Optional
+from collections import defaultdict
+from services.cdr_rollups import CDRCounters, DISPOSITION_FIELDS, rollups_available, collect_cdr_buckets, collect_dst_counts
+from services.cdr_heatmap import build_heatmap
+from services.ivr_stats import ivr_options, ivr_option_counts
+from services.cdr_aggregation import CDRPanelAccumulator, aggregate_cdr_range
+from services.response_cache import cached
+from services.catalogs import catalogs
+from services.cdr_counts import count_cdr_since
+from services.cdr_export import stream_cdr_export, export_filename, export_media_type
+from utils.cdr_utils import encode_cdr_cursor, decode_cdr_cursor
+from utils.destinations import parse_route_destination
 
 # Definición del router
 router = APIRouter(prefix="/api", tags=["Telephony"])
@@ -48,12 +62,26 @@ def get_extensions(db: Session = Depends(get_db)):
     ]
 # Endpoint para Obtener lista de llamadas detalladas
 @router.get("/calls/detailed")
-def get_detailed_calls(
+async def get_detailed_calls(
     period: str = Query("month", enum=["today", "week", "month", "year"]),
-    page: int = Query(1, ge=1),
+    cursor: Optional[str] = Query(None, description="Cursor opaco (next_cursor / prev_cursor de la respuesta anterior)"),
+    page: Optional[int] = Query(None, ge=1, description="Paginación por número de página (compatibilidad, usa OFFSET)"),
     size: int = Query(50, ge=1, le=200),  # máximo 200 por página
-    db: Session = Depends(get_db)
+    approximate: bool = Query(False, description="Total estimado (sin conteo en vivo en cada petición)"),
+    db: AsyncSession = Depends(get_async_db)
 ):
+    """
+    Lista de llamadas, las más recientes primero.
+    Por defecto pagina con cursor sobre (calldate, id): cada página busca por
+    rango en el índice, así la página 1000 cuesta lo mismo que la primera.
+    Si se manda `page` se usa el modo anterior con LIMIT/OFFSET.
+    Con approximate=true el total es una estimación (total_is_approximate).
+    """
+    return await db.run_sync(load_detailed_calls, period, cursor, page, size, approximate)
+
+
+def load_detailed_calls(db: Session, period: str, cursor: Optional[str], page: Optional[int],
+                        size: int, approximate: bool):
     now = datetime.now()
     
     if period == "today":
@@ -65,15 +93,110 @@ def get_detailed_calls(
     else:
         start_date = now - timedelta(days=365)
 
-    offset = (page - 1) * size
+    # Contar total: días cerrados desde la caché por día + conteo en vivo de la parte abierta
+    total, total_is_approximate = count_cdr_since(db, start_date, approximate)
 
-    # Contar total
-    count_query = text("""
-        SELECT COUNT(*)
+    if page is not None:
+        response = get_detailed_calls_page(db, start_date, page, size, total)
+        response["total_is_approximate"] = total_is_approximate
+        return response
+
+    # Modo cursor: seek por (calldate, id) en lugar de OFFSET
+    direction = "next"
+    seek_filter = ""
+    params = {"start_date": start_date, "limit": size + 1}
+    if cursor:
+        try:
+            cursor_time, cursor_id, direction = decode_cdr_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        params.update({"cursor_time": cursor_time, "cursor_id": cursor_id})
+        if direction == "next":
+            seek_filter = "AND c.calldate <= :cursor_time AND (c.calldate < :cursor_time OR c.id < :cursor_id)"
+        else:
+            seek_filter = "AND c.calldate >= :cursor_time AND (c.calldate > :cursor_time OR c.id > :cursor_id)"
+    order = "DESC" if direction == "next" else "ASC"
+
+    data_query = text(f"""
+        SELECT 
+            c.calldate,
+            c.src,
+            c.dst,
+            c.disposition,
+            c.billsec,
+            c.duration,
+            c.uniqueid,
+            c.recordingfile,
+            c.did,
+            c.id
         FROM asteriskcdrdb.cdr c
         WHERE c.calldate >= :start_date
+        {seek_filter}
+        ORDER BY c.calldate {order}, c.id {order}
+        LIMIT :limit
     """)
-    total = db.execute(count_query, {"start_date": start_date}).scalar()
+    
+    result = db.execute(data_query, params).fetchall()
+    
+    # Se pide una fila de más para saber si hay otra página en esa dirección
+    has_more = len(result) > size
+    result = result[:size]
+    if direction == "prev":
+        result.reverse()
+        has_newer, has_older = has_more, True
+    else:
+        has_newer, has_older = cursor is not None, has_more
+    
+    next_cursor = None
+    prev_cursor = None
+    if result:
+        if has_older:
+            next_cursor = encode_cdr_cursor(result[-1][0], result[-1][9], "next")
+        if has_newer:
+            prev_cursor = encode_cdr_cursor(result[0][0], result[0][9], "prev")
+    
+    user_names = catalogs.get(db, "users")
+    
+    return {
+        "items": [format_detailed_call(row, user_names) for row in result],
+        "total": total,
+        "total_is_approximate": total_is_approximate,
+        "size": size,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor
+    }
+
+
+@router.get("/calls/export")
+def export_calls(
+    start_date: datetime = Query(..., description="Inicio del rango (incluido)"),
+    end_date: Optional[datetime] = Query(None, description="Fin del rango (excluido); por defecto ahora"),
+    format: str = Query("csv", enum=["csv", "ndjson"]),
+    gzip: bool = Query(False, description="Comprimir la descarga con gzip"),
+    db: Session = Depends(get_db)
+):
+    """
+    Exporta las llamadas de un rango arbitrario en CSV o NDJSON.
+    El cuerpo se envía en streaming con memoria constante, sin importar el tamaño del rango.
+    """
+    end_date = end_date or datetime.now()
+    if end_date <= start_date:
+        raise HTTPException(status_code=400, detail="end_date debe ser posterior a start_date")
+    
+    # Los nombres de agente salen del catálogo en lugar de unir asterisk.users por fila
+    user_names = catalogs.get(db, "users")
+    filename = export_filename(format, start_date, end_date, gzip)
+    
+    return StreamingResponse(
+        stream_cdr_export(start_date, end_date, format, gzip, user_names),
+        media_type=export_media_type(format, gzip),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+def get_detailed_calls_page(db: Session, start_date: datetime, page: int, size: int, total: int) -> dict:
+    """Modo por número de página (LIMIT/OFFSET), conservado para compatibilidad"""
+    offset = (page - 1) * size
 
     # Obtener datos detallados con paginación
     data_query = text("""
@@ -86,10 +209,8 @@ def get_detailed_calls(
             c.duration,
             c.uniqueid,
             c.recordingfile,
-            c.did,
-            u.name as agent_name
+            c.did
         FROM asteriskcdrdb.cdr c
-        LEFT JOIN asterisk.users u ON c.dst = u.extension
         WHERE c.calldate >= :start_date
         ORDER BY c.calldate DESC
         LIMIT :size OFFSET :offset
@@ -100,31 +221,32 @@ def get_detailed_calls(
         "size": size,
         "offset": offset
     }).fetchall()
-    
-    calls = []
-    for row in result:
-        calls.append({
-            "fecha": row[0],
-            "numero": row[1],
-            "numero_agente": row[2],
-            "agente": row[9] or row[2],
-            "evento": row[3],
-            "tiempo_llamada": row[4] or 0,
-            "tiempo_espera": max(0, (row[5] or 0) - (row[4] or 0)),
-            "uniqueid": row[6],
-            "grabacion": row[7],
-            "did": row[8],
-            "cola": "Sí" if row[2] and not row[2].isdigit() and len(row[2]) > 3 else "No"
-        })
+    user_names = catalogs.get(db, "users")
     
     return {
-        "items": calls,
+        "items": [format_detailed_call(row, user_names) for row in result],
         "total": total,
         "page": page,
         "size": size,
         "pages": (total + size - 1) // size  # redondeo hacia arriba
     }
 
+
+def format_detailed_call(row, user_names: dict) -> dict:
+    return {
+        "fecha": row[0],
+        "numero": row[1],
+        "numero_agente": row[2],
+        "agente": user_names.get(row[2]) or row[2],
+        "evento": row[3],
+        "tiempo_llamada": row[4] or 0,
+        "tiempo_espera": max(0, (row[5] or 0) - (row[4] or 0)),
+        "uniqueid": row[6],
+        "grabacion": row[7],
+        "did": row[8],
+        "cola": "Sí" if row[2] and not row[2].isdigit() and len(row[2]) > 3 else "No"
+    }
+
 # Endpoint para Obtener lista de troncales
 @router.get("/trunks")
 def get_trunks(db: Session = Depends(get_db)):
@@ -146,11 +268,17 @@ def get_trunks(db: Session = Depends(get_db)):
     ]
 
 # Endpoint para Obtener estadísticas avanzadas para el dashboard CON FILTROS
+# Sync (threadpool): sin rollups recorre todo el período de cdr y lo agrega en Python
 @router.get("/dashboard/advanced-stats")
+@cached(ttl=60)
 def get_advanced_dashboard_stats(
     period: str = Query("week", enum=["today", "week", "month", "year"]),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_analytics_db)
 ):
+    return load_advanced_dashboard_stats(db, period)
+
+
+def load_advanced_dashboard_stats(db: Session, period: str):
     now = datetime.now()
     
     # Calcular fechas según el período seleccionado
@@ -169,127 +297,6 @@ def get_advanced_dashboard_stats(
     
     end_date = now
     
-    # 1. Métricas generales del período seleccionado
-    general_stats = db.execute(text("""
-        SELECT 
-            COUNT(*) as total_calls,
-            AVG(duration) as avg_duration,
-            SUM(CASE WHEN disposition = 'ANSWERED' THEN 1 ELSE 0 END) as answered_calls,
-            SUM(CASE WHEN disposition = 'NO ANSWER' THEN 1 ELSE 0 END) as no_answer_calls,
-            SUM(CASE WHEN disposition = 'FAILED' THEN 1 ELSE 0 END) as failed_calls,
-            AVG(billsec) as avg_billsec
-        FROM asteriskcdrdb.cdr 
-        WHERE calldate >= :start_date AND calldate <= :end_date
-    """), {"start_date": start_date, "end_date": end_date}).fetchone()
-    
-    total_calls = general_stats[0] or 0
-    answered = general_stats[2] or 0
-    answer_rate = round((answered / total_calls * 100), 1) if total_calls > 0 else 0
-    
-    # 2. Estado de llamadas (para gráfica de dona) del período seleccionado
-    call_status = db.execute(text("""
-        SELECT 
-            SUM(CASE WHEN disposition = 'ANSWERED' THEN 1 ELSE 0 END) as answered,
-            SUM(CASE WHEN disposition = 'NO ANSWER' THEN 1 ELSE 0 END) as no_answer,
-            SUM(CASE WHEN disposition = 'FAILED' THEN 1 ELSE 0 END) as failed,
-            SUM(CASE WHEN disposition = 'BUSY' THEN 1 ELSE 0 END) as busy
-        FROM asteriskcdrdb.cdr
-        WHERE calldate >= :start_date AND calldate <= :end_date
-    """), {"start_date": start_date, "end_date": end_date}).fetchone()
-    
-    # 3. Tendencia diaria (ajustada al período)
-    daily_trend = db.execute(text("""
-        SELECT 
-            DATE(calldate) as date,
-            COUNT(*) as total,
-            SUM(CASE WHEN disposition = 'ANSWERED' THEN 1 ELSE 0 END) as answered
-        FROM asteriskcdrdb.cdr
-        WHERE calldate >= :start_date AND calldate <= :end_date
-        GROUP BY DATE(calldate)
-        ORDER BY date
-    """), {"start_date": start_date, "end_date": end_date}).fetchall()
-    
-    daily_data = [
-        {
-            "date": r[0].strftime('%Y-%m-%d'),
-            "total": r[1],
-            "answered": r[2] or 0
-        }
-        for r in daily_trend
-    ]
-    
-    # 4. Top agentes del período seleccionado
-    agent_stats = db.execute(text("""
-        SELECT 
-            dst as extension,
-            u.name as agent_name,
-            COUNT(*) as total_calls,
-            SUM(CASE WHEN disposition = 'ANSWERED' THEN 1 ELSE 0 END) as answered_calls
-        FROM asteriskcdrdb.cdr c
-        LEFT JOIN asterisk.users u ON c.dst = u.extension
-        WHERE calldate >= :start_date AND calldate <= :end_date
-        GROUP BY dst
-        HAVING answered_calls > 0
-        ORDER BY answered_calls DESC
-        LIMIT 10
-    """), {"start_date": start_date, "end_date": end_date}).fetchall()
-    
-    agent_data = [
-        {
-            "extension": r[0],
-            "name": r[1] or r[0],
-            "total_calls": r[2],
-            "answered_calls": r[3]
-        }
-        for r in agent_stats
-    ]
-    
-    # 5. Distribución por tipo de destino del período seleccionado
-    dest_distribution = db.execute(text("""
-        SELECT 
-            CASE 
-                WHEN dst REGEXP '^[0-9]{3,4}$' THEN 'Extensión'
-                WHEN dst LIKE '%queue%' THEN 'Cola'
-                WHEN dst LIKE '%ivr%' THEN 'IVR'
-                WHEN dst LIKE '%s%' THEN 'Entrada'
-                ELSE 'Otro'
-            END as destination_type,
-            COUNT(*) as calls
-        FROM asteriskcdrdb.cdr
-        WHERE calldate >= :start_date AND calldate <= :end_date
-        GROUP BY destination_type
-        ORDER BY calls DESC
-    """), {"start_date": start_date, "end_date": end_date}).fetchall()
-    
-    dest_data = [
-        {
-            "type": r[0],
-            "calls": r[1]
-        }
-        for r in dest_distribution
-    ]
-    
-    # 6. Distribución por hora del día (para nuevo gráfico) del período seleccionado
-    hourly_distribution = db.execute(text("""
-        SELECT 
-            HOUR(calldate) as hour,
-            COUNT(*) as calls,
-            SUM(CASE WHEN disposition = 'ANSWERED' THEN 1 ELSE 0 END) as answered
-        FROM asteriskcdrdb.cdr
-        WHERE calldate >= :start_date AND calldate <= :end_date
-        GROUP BY HOUR(calldate)
-        ORDER BY hour
-    """), {"start_date": start_date, "end_date": end_date}).fetchall()
-    
-    hourly_data = [
-        {
-            "hour": r[0],
-            "calls": r[1],
-            "answered": r[2]
-        }
-        for r in hourly_distribution
-    ]
-    
     # Extensiones activas (esto no depende del período)
     active_extensions = db.execute(text("""
         SELECT COUNT(*)
@@ -300,35 +307,102 @@ def get_advanced_dashboard_stats(
           AND (s_host.data = 'dynamic' OR s_host.data REGEXP '^[0-9]{1,3}\\\\.[0-9]{1,3}\\\\.[0-9]{1,3}\\\\.[0-9]{1,3}$')
     """)).fetchone()
     
+    # Con rollups disponibles todas las gráficas salen de los agregados por hora/destino;
+    # si no, el rango se recorre una sola vez plegando cada fila en todos los paneles
+    if rollups_available():
+        accumulator = CDRPanelAccumulator()
+        for bucket, counters in collect_cdr_buckets(db, start_date, end_date, "hour").items():
+            accumulator.add_bucket(bucket, counters)
+        for dst, counts in collect_dst_counts(db, start_date, end_date).items():
+            accumulator.add_dst(dst, counts[0], counts[1])
+    else:
+        accumulator = aggregate_cdr_range(db, start_date, end_date)
+    
+    return build_advanced_stats(db, accumulator, active_extensions[0] or 0)
+
+
+def build_advanced_stats(db: Session, accumulator: CDRPanelAccumulator, active_extensions: int) -> dict:
+    """
+    Arma la respuesta de /dashboard/advanced-stats a partir de los acumuladores
+    (ya sea plegados desde rollups o desde una pasada sobre cdr)
+    """
+    totals = accumulator.totals
+    total_calls = totals.total_calls
+    answered = totals.answered_calls
+    answer_rate = round((answered / total_calls * 100), 1) if total_calls > 0 else 0
+    avg_duration = (totals.duration_sum / total_calls) if total_calls > 0 else 0
+    
+    # Top 10 destinos por llamadas contestadas, con nombre del agente
+    top_dsts = accumulator.top_destinations(10)
+    
+    agent_names = catalogs.get(db, "users")
+    
     return {
         "general": {
-            "calls_today": total_calls if period == "today" else general_stats[0],
-            "calls_this_week": total_calls if period == "week" else general_stats[0],
-            "calls_this_month": total_calls if period == "month" else general_stats[0],
-            "avg_duration": round(general_stats[1] or 0, 1),
-            "answered_calls_today": answered if period == "today" else answered,
-            "no_answer_calls_today": general_stats[3] or 0,
-            "failed_calls_today": general_stats[4] or 0,
+            "calls_today": total_calls,
+            "calls_this_week": total_calls,
+            "calls_this_month": total_calls,
+            "avg_duration": round(avg_duration, 1),
+            "answered_calls_today": answered,
+            "no_answer_calls_today": totals.no_answer_calls,
+            "failed_calls_today": totals.failed_calls,
             "answer_rate": answer_rate,
-            "active_extensions": active_extensions[0] or 0
+            "active_extensions": active_extensions
         },
         "call_status": {
-            "answered": call_status[0] or 0,
-            "no_answer": call_status[1] or 0,
-            "failed": call_status[2] or 0,
-            "busy": call_status[3] or 0
+            "answered": totals.answered_calls,
+            "no_answer": totals.no_answer_calls,
+            "failed": totals.failed_calls,
+            "busy": totals.busy_calls
         },
-        "daily_trends": daily_data,
-        "top_agents": agent_data,
-        "destination_distribution": dest_data,
-        "hourly_distribution": hourly_data
+        "daily_trends": [
+            {
+                "date": day.strftime('%Y-%m-%d'),
+                "total": counts[0],
+                "answered": counts[1]
+            }
+            for day, counts in sorted(accumulator.daily.items())
+        ],
+        "top_agents": [
+            {
+                "extension": dst,
+                "name": agent_names.get(dst) or dst,
+                "total_calls": counts[0],
+                "answered_calls": counts[1]
+            }
+            for dst, counts in top_dsts
+        ],
+        "destination_distribution": [
+            {
+                "type": dest_type,
+                "calls": calls
+            }
+            for dest_type, calls in accumulator.destination_distribution()
+        ],
+        "hourly_distribution": [
+            {
+                "hour": hour,
+                "calls": counts[0],
+                "answered": counts[1]
+            }
+            for hour, counts in sorted(accumulator.hourly.items())
+        ]
     }
 
 # Endpoint para Obtener datos para gráficos avanzados del dashboard
 @router.get("/dashboard/advanced-charts")
-def get_advanced_charts_data(db: Session = Depends(get_db)):
+@cached(ttl=300)
+async def get_advanced_charts_data(db: AsyncSession = Depends(get_async_analytics_db)):
+    return await db.run_sync(load_advanced_charts_data)
+
+
+def load_advanced_charts_data(db: Session):
     now = datetime.now()
     
+    # Con rollups disponibles el heatmap y la comparativa mensual salen de los agregados
+    if rollups_available():
+        return build_advanced_charts(db, now)
+    
     # 1. Heatmap: llamadas por hora y día de la semana
     heatmap_query = text("""
         SELECT 
@@ -345,21 +419,17 @@ def get_advanced_charts_data(db: Session = Depends(get_db)):
     hours = list(range(24))  # 0-23
     days = [ 'Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb', 'Dom']
     
-    # Crear matriz de datos
-    matrix_data = []
-    for hour in hours:
-        for day_idx, day_name in enumerate(days):
-            # Buscar si hay datos para esta combinación
-            value = 0
-            for row in heatmap_data:
-                if row[0] == hour and row[1] == (day_idx + 1):  # DAYOFWEEK es 1-7
-                    value = row[2]
-                    break
-            matrix_data.append({
-                'x': hour, 
-                'y': day_name, 
-                'v': value  
-            }) 
+    # Crear matriz de datos indexando por (hora, DAYOFWEEK 1-7)
+    heatmap_counts = {(row[0], row[1]): row[2] for row in heatmap_data}
+    matrix_data = [
+        {
+            'x': hour,
+            'y': day_name,
+            'v': heatmap_counts.get((hour, day_idx + 1), 0)
+        }
+        for hour in hours
+        for day_idx, day_name in enumerate(days)
+    ]
     
     # 2. Comparativas mes vs mes (últimos 6 meses)
     #esta grafica muestra la comparación mensual de llamadas en los últimos 6 meses
@@ -391,6 +461,76 @@ def get_advanced_charts_data(db: Session = Depends(get_db)):
     }
 
 
+def _months_ago(value: datetime, months: int) -> datetime:
+    """Equivalente a DATE_SUB(value, INTERVAL n MONTH) de MySQL"""
+    month_index = value.year * 12 + (value.month - 1) - months
+    year, month = divmod(month_index, 12)
+    month += 1
+    next_month = datetime(year + (month // 12), month % 12 + 1, 1)
+    last_day = (next_month - timedelta(days=1)).day
+    return value.replace(year=year, month=month, day=min(value.day, last_day))
+
+
+def build_advanced_charts(db: Session, now: datetime) -> dict:
+    """Heatmap (30 días) y comparativa mensual (6 meses) desde los rollups"""
+    # 1. Heatmap: llamadas por hora y DAYOFWEEK (1=domingo ... 7=sábado, como MySQL)
+    hourly = collect_cdr_buckets(db, now - timedelta(days=30), now, "hour")
+    heatmap_counts = defaultdict(int)
+    for bucket, counters in hourly.items():
+        day_of_week = bucket.isoweekday() % 7 + 1
+        heatmap_counts[(bucket.hour, day_of_week)] += counters.total_calls
+    
+    days = ['Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb', 'Dom']
+    matrix_data = [
+        {
+            'x': hour,
+            'y': day_name,
+            'v': heatmap_counts.get((hour, day_idx + 1), 0)
+        }
+        for hour in range(24)
+        for day_idx, day_name in enumerate(days)
+    ]
+    
+    # 2. Comparativa mensual (últimos 6 meses) desde el rollup diario
+    daily = collect_cdr_buckets(db, _months_ago(now, 6), now, "day")
+    monthly = defaultdict(CDRCounters)
+    for day, counters in daily.items():
+        monthly[day.strftime('%Y-%m')].merge(counters)
+    
+    monthly_data = [
+        {
+            "month": month,
+            "total_calls": counters.total_calls,
+            "answered_calls": counters.answered_calls,
+            "avg_duration": round(counters.duration_sum / counters.total_calls, 1) if counters.total_calls else 0
+        }
+        for month, counters in sorted(monthly.items())
+    ]
+    
+    return {
+        "heatmap": matrix_data,
+        "monthly_comparison": monthly_data
+    }
+
+# Endpoint para el heatmap hora × día de la semana con rango y filtros
+@router.get("/dashboard/heatmap")
+@cached(ttl=300)
+async def get_calls_heatmap(
+    start_date: Optional[date] = Query(None, description="Fecha inicial (incluida); por defecto hace 29 días"),
+    end_date: Optional[date] = Query(None, description="Fecha final (incluida); por defecto hoy"),
+    queue: Optional[str] = Query(None, description="Número de cola (dst de las llamadas a ext-queues)"),
+    did: Optional[str] = Query(None, description="DID de entrada"),
+    disposition: Optional[str] = Query(None, description="ANSWERED, NO ANSWER, BUSY o FAILED"),
+    db: AsyncSession = Depends(get_async_analytics_db)
+):
+    end_date = end_date or date.today()
+    start_date = start_date or end_date - timedelta(days=29)
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date debe ser anterior o igual a end_date")
+    if disposition is not None and disposition not in DISPOSITION_FIELDS:
+        raise HTTPException(status_code=400, detail=f"disposition inválida: {disposition}")
+    return await db.run_sync(build_heatmap, start_date, end_date, queue, did, disposition)
+
 # Endpoint para Obtener lista de IVRs con sus opciones y estadísticas
 @router.get("/ivrs")
 def get_ivrs_with_stats(db: Session = Depends(get_db)):
@@ -398,81 +538,22 @@ def get_ivrs_with_stats(db: Session = Depends(get_db)):
         # Usar ORM para obtener IVRs
         ivrs = db.query(IVRDetail).order_by(IVRDetail.name).all()
         
-        result = []
+        # Opciones de todos los IVRs (catálogo) y llamadas por opción (una consulta agrupada)
+        options_by_ivr = ivr_options(db)
+        calls_by_ivr = ivr_option_counts(db)
         
+        result = []
         for ivr in ivrs:
-            try:
-                ivr_name = ivr.name or f"IVR_{ivr.id}"
-                
-                # Obtener opciones del IVR usando ORM
-                options = (
-                    db.query(IVREntry)
-                    .filter(IVREntry.ivr_id == ivr.id)
-                    .order_by(IVREntry.selection)
-                    .all()
-                )
-                
-                options_list = []
-                for opt in options:
-                    try:
-                        selection = opt.selection
-                        dest = opt.dest
-                        
-                        # Parsear el destino (FreePBX guarda como JSON-like string)
-                        dest_label = "Desconocido"
-                        dest_type = "unknown"
-                        
-                        if dest:
-                            try:
-                                # FreePBX usa formato: ["type","data"]
-                                if dest.startswith('["') and dest.endswith('"]'):
-                                    parts = dest.strip('[]').replace('"', '').split(',', 1)
-                                    if len(parts) == 2:
-                                        dest_type_raw = parts[0]
-                                        dest_data = parts[1]
-                                        
-                                        # Mapear tipos comunes
-                                        if dest_type_raw == "extension":
-                                            dest_label = f"Extensión → {dest_data}"
-                                            dest_type = "extension"
-                                        elif dest_type_raw == "queue":
-                                            dest_label = f"Cola → {dest_data}"
-                                            dest_type = "queue"
-                                        elif dest_type_raw == "ivr":
-                                            dest_label = f"IVR → {dest_data}"
-                                            dest_type = "ivr"
-                                        elif dest_type_raw == "hangup":
-                                            dest_label = "Colgar"
-                                            dest_type = "hangup"
-                                        else:
-                                            dest_label = f"{dest_type_raw} → {dest_data}"
-                                            dest_type = dest_type_raw
-                                    else:
-                                        dest_label = dest
-                                else:
-                                    dest_label = dest
-                            except Exception as e:
-                                dest_label = f"Error: {str(e)}"
-                        
-                        options_list.append({
-                            "option": selection,
-                            "dest_type": dest_type,
-                            "dest_label": dest_label,
-                            "calls_last_30_days": 0
-                        })
-                    except Exception as opt_error:
-                        print(f"Error procesando opción: {opt_error}")
-                        continue
-                
-                result.append({
-                    "id": ivr.id,
-                    "name": ivr_name,
-                    "announcement_id": ivr.announcement,
-                    "options": options_list
-                })
-            except Exception as ivr_error:
-                print(f"Error procesando IVR {ivr.id}: {ivr_error}")
-                continue
+            calls = calls_by_ivr.get(ivr.id, {})
+            result.append({
+                "id": ivr.id,
+                "name": ivr.name or f"IVR_{ivr.id}",
+                "announcement_id": ivr.announcement,
+                "options": [
+                    {**option, "calls_last_30_days": calls.get(option["option"], 0)}
+                    for option in options_by_ivr.get(ivr.id, [])
+                ]
+            })
         
         return result
     except Exception as e:
@@ -491,42 +572,97 @@ def list_incoming_routes(db: Session = Depends(get_db)):
         .all()
     )
 
-    routes = []
-    for route in routes_query:
-        destination = route.destination or ""
-        
-        dest_type = "desconocido"
-        dest_data = destination
-        dest_label = destination
-
-        if destination:
-            parts = destination.split('/', 1)
-            if len(parts) == 2:
-                dest_type = parts[0]
-                dest_data = parts[1]
-
-                if dest_type == "from-did-direct":
-                    dest_label = f"Extensión → {dest_data}"
-                elif dest_type == "app-ivr":
-                    dest_label = f"IVR → {dest_data}"
-                elif dest_type == "app-queue":
-                    dest_label = f"Cola → {dest_data}"
-                else:
-                    dest_label = f"{dest_type} → {dest_data}"
-
-        routes.append(
-            {
-                "numero": route.cidnum,
-                "extension": route.extension,
-                "destino_tipo": dest_type,
-                "destino_dato": dest_data,
-                "destino_label": dest_label,
-                "descripcion": route.description,
-                "alertinfo": route.alertinfo,
-            }
-        )
+    return [format_incoming_route(route) for route in routes_query]
+
 
-    return routes
+def format_incoming_route(route: IncomingRoute) -> dict:
+    dest_type, dest_data, dest_label = parse_route_destination(route.destination)
+    return {
+        "numero": route.cidnum,
+        "extension": route.extension,
+        "destino_tipo": dest_type,
+        "destino_dato": dest_data,
+        "destino_label": dest_label,
+        "descripcion": route.description,
+        "alertinfo": route.alertinfo,
+    }
+
+
+# Endpoint para Obtener estadísticas de todas las rutas entrantes en una sola pasada
+# (declarado antes de /incoming-routes/{route_number} para que "stats" no se tome como número)
+@router.get("/incoming-routes/stats")
+@cached(ttl=300)
+def get_incoming_routes_stats(
+    days: int = Query(30, ge=1, le=365, description="Días de la ventana de estadísticas"),
+    daily_days: int = Query(7, ge=0, le=90, description="Días del detalle diario"),
+    db: Session = Depends(get_db)
+):
+    """
+    Estadísticas de todas las rutas entrantes con dos consultas agrupadas sobre cdr
+    (totales por DID y detalle diario por DID), unidas en memoria a las rutas
+    por su DID (columna extension de la ruta).
+    """
+    routes = db.query(IncomingRoute).order_by(IncomingRoute.cidnum).all()
+    now = datetime.now()
+    
+    totals_rows = db.execute(text("""
+        SELECT
+            did,
+            COUNT(*) as total_calls,
+            SUM(CASE WHEN disposition = 'ANSWERED' THEN 1 ELSE 0 END) as answered_calls,
+            AVG(billsec) as avg_duration,
+            MIN(calldate) as first_call,
+            MAX(calldate) as last_call
+        FROM asteriskcdrdb.cdr
+        WHERE calldate >= :start_date AND did IS NOT NULL AND did <> ''
+        GROUP BY did
+    """), {"start_date": now - timedelta(days=days)}).fetchall()
+    totals_by_did = {row[0]: row for row in totals_rows}
+    
+    daily_by_did = defaultdict(list)
+    if daily_days:
+        daily_rows = db.execute(text("""
+            SELECT
+                did,
+                DATE(calldate) as day,
+                COUNT(*) as calls,
+                SUM(CASE WHEN disposition = 'ANSWERED' THEN 1 ELSE 0 END) as answered
+            FROM asteriskcdrdb.cdr
+            WHERE calldate >= :start_date AND did IS NOT NULL AND did <> ''
+            GROUP BY did, DATE(calldate)
+            ORDER BY day DESC
+        """), {"start_date": now - timedelta(days=daily_days)}).fetchall()
+        for row in daily_rows:
+            daily_by_did[row[0]].append({
+                "date": row[1].strftime('%Y-%m-%d'),
+                "calls": row[2],
+                "answered": int(row[3] or 0)
+            })
+    
+    result = []
+    for route in routes:
+        stats = totals_by_did.get(route.extension) if route.extension else None
+        total_calls = stats[1] if stats else 0
+        answered_calls = int(stats[2] or 0) if stats else 0
+        result.append({
+            **format_incoming_route(route),
+            "estadisticas": {
+                "total_llamadas": total_calls,
+                "llamadas_contestadas": answered_calls,
+                "tasa_respuesta": round((answered_calls / total_calls * 100), 1) if total_calls > 0 else 0,
+                "duracion_promedio_seg": round(stats[3] or 0, 1) if stats else 0,
+                "primera_llamada": stats[4] if stats else None,
+                "ultima_llamada": stats[5] if stats else None
+            },
+            "detalle_diario": daily_by_did.get(route.extension, []) if route.extension else []
+        })
+    
+    return {
+        "routes": result,
+        "days": days,
+        "daily_days": daily_days,
+        "timestamp": now.isoformat()
+    }
 
 # Endpoint para Obtener detalle de una ruta entrante específica
 @router.get("/incoming-routes/{route_number}")
@@ -541,26 +677,8 @@ def get_incoming_route_detail(route_number: str, db: Session = Depends(get_db)):
     if not route:
         raise HTTPException(status_code=404, detail="Ruta no encontrada")
     
-    # Parsear destino (como hicimos antes)
     destination = route.destination or ""
-    dest_type = "desconocido"
-    dest_data = destination
-    dest_label = destination
-    
-    if destination:
-        parts = destination.split('/', 1)
-        if len(parts) == 2:
-            dest_type = parts[0]
-            dest_data = parts[1]
-            
-            if dest_type == "from-did-direct":
-                dest_label = f"Extensión → {dest_data}"
-            elif dest_type == "app-ivr":
-                dest_label = f"IVR → {dest_data}"
-            elif dest_type == "app-queue":
-                dest_label = f"Cola → {dest_data}"
-            else:
-                dest_label = f"{dest_type} → {dest_data}"
+    dest_type, dest_data, dest_label = parse_route_destination(destination)
     
     # Estadísticas de las últimas 30 llamadas usando ORM
     thirty_days_ago = datetime.now() - timedelta(days=30)
@@ -0,0 +1,2 @@
+# services/__init__.py
+# Subsistemas con estado (rollups, tareas en segundo plano) usados por los routers
@@ -0,0 +1,258 @@
+# services/agent_state.py
+"""
+Proyección en memoria del estado de cada agente.
+
+En lugar de buscar en cada petición el último registro de cada agente con
+`MAX(id) GROUP BY agent` sobre todo el historial de qstats.agent_activity,
+se mantiene por agente el último evento, su cola, desde cuándo está en ese
+estado y el motivo de pausa. Se actualiza de forma incremental con:
+- las filas nuevas de qstats.agent_activity (id > último visto), y
+- los eventos de llamada de queuelog que entrega el tail de queue_state.
+
+Las consultas pasan a costar O(agentes) en lugar de O(historial).
+"""
+import os
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from services.background import PeriodicTask, register_task
+from services.queue_state import queuelog_tail, queue_state_ready
+
+AGENT_STATE_ENABLED = os.getenv("AGENT_STATE_ENABLED", "true").lower() == "true"
+AGENT_STATE_INTERVAL = float(os.getenv("AGENT_STATE_INTERVAL", "2"))
+AGENT_STATE_BATCH_SIZE = int(os.getenv("AGENT_STATE_BATCH_SIZE", "5000"))
+
+CALL_EVENTS = {'CONNECT', 'COMPLETEAGENT', 'COMPLETECALLER', 'RINGNOANSWER', 'RINGCANCELED'}
+
+
+class AgentRecord:
+    """Último evento de agent_activity de un agente"""
+    __slots__ = ("activity_id", "agent", "queue", "event", "data", "since", "lasted")
+
+    def __init__(self, row: Any):
+        self.activity_id = row.id
+        self.agent = row.agent
+        self.queue = row.queue
+        self.event = row.event
+        self.data = row.data
+        self.since = row.datetime
+        self.lasted = row.lastedforseconds
+
+    @property
+    def pause_reason(self) -> Optional[str]:
+        return self.data if self.event and 'PAUSE' in self.event else None
+
+
+class AgentStateProjection:
+    """Estado actual por agente (y por agente/cola) mantenido de forma incremental"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._agents: Dict[str, AgentRecord] = {}
+        self._queue_events: Dict[Tuple[str, str], Tuple[int, str]] = {}
+        self._last_call_events: Dict[str, Any] = {}
+        self._calls_today: Dict[str, List] = {}
+        self._calls_day: date = date.today()
+        self._calls_baseline_id: Optional[int] = None
+        self._pending_connects: List[Any] = []
+        self.last_activity_id = 0
+        self.ready = False
+        self.last_poll: Optional[datetime] = None
+
+    # ----------------------------------------
+    # agent_activity
+    # ----------------------------------------
+
+    def _apply_activity(self, row: Any):
+        record = self._agents.get(row.agent)
+        if record is None or row.id > record.activity_id:
+            self._agents[row.agent] = AgentRecord(row)
+
+        key = (row.agent, row.queue)
+        previous = self._queue_events.get(key)
+        if previous is None or row.id > previous[0]:
+            self._queue_events[key] = (row.id, row.event or '')
+
+    def bootstrap(self, db: Session):
+        """Carga inicial: el último evento por agente y cola (una sola vez al arrancar)"""
+        max_activity_id = db.execute(text("SELECT MAX(id) FROM qstats.agent_activity")).scalar() or 0
+        latest = db.execute(text("""
+            SELECT aa.id, aa.datetime, aa.queue, aa.agent, aa.event, aa.data, aa.lastedforseconds
+            FROM qstats.agent_activity aa
+            INNER JOIN (
+                SELECT agent, queue, MAX(id) as max_id
+                FROM qstats.agent_activity
+                WHERE id <= :max_id
+                GROUP BY agent, queue
+            ) latest ON aa.id = latest.max_id
+        """), {"max_id": max_activity_id}).fetchall()
+
+        # Llamadas del día y último evento de llamada hasta el id base de queuelog;
+        # lo que venga después lo cuenta el tail
+        baseline_id = db.execute(text("SELECT MAX(id) FROM asteriskcdrdb.queuelog")).scalar() or 0
+        calls_today = db.execute(text("""
+            SELECT agent, COUNT(*) as call_count, MAX(time) as last_call
+            FROM asteriskcdrdb.queuelog
+            WHERE event = 'CONNECT'
+            AND time >= CURDATE()
+            AND id <= :baseline_id
+            GROUP BY agent
+        """), {"baseline_id": baseline_id}).fetchall()
+        call_events = db.execute(text("""
+            SELECT ql.id, ql.time, ql.callid, ql.queuename, ql.agent, ql.event,
+                   ql.data1, ql.data2, ql.data3, ql.data4, ql.data5
+            FROM asteriskcdrdb.queuelog ql
+            INNER JOIN (
+                SELECT agent, MAX(id) as max_id
+                FROM asteriskcdrdb.queuelog
+                WHERE event IN ('CONNECT', 'COMPLETEAGENT', 'COMPLETECALLER', 'RINGNOANSWER', 'RINGCANCELED')
+                AND time >= DATE_SUB(NOW(), INTERVAL 2 HOUR)
+                AND id <= :baseline_id
+                GROUP BY agent
+            ) latest ON ql.agent = latest.agent AND ql.id = latest.max_id
+        """), {"baseline_id": baseline_id}).fetchall()
+
+        with self._lock:
+            for row in latest:
+                self._apply_activity(row)
+            self.last_activity_id = max_activity_id
+
+            self._calls_day = date.today()
+            self._calls_today = {row[0]: [row[1], row[2]] for row in calls_today}
+            for row in call_events:
+                self._apply_call_event(row)
+            self._calls_baseline_id = baseline_id
+            pending, self._pending_connects = self._pending_connects, []
+            for row in pending:
+                self._count_connect(row)
+
+        self.last_poll = datetime.now()
+        self.ready = True
+
+    def poll(self, db: Session) -> int:
+        total = 0
+        while True:
+            rows = db.execute(text("""
+                SELECT id, datetime, queue, agent, event, data, lastedforseconds
+                FROM qstats.agent_activity
+                WHERE id > :last_id
+                ORDER BY id
+                LIMIT :limit
+            """), {"last_id": self.last_activity_id, "limit": AGENT_STATE_BATCH_SIZE}).fetchall()
+            if rows:
+                with self._lock:
+                    for row in rows:
+                        self._apply_activity(row)
+                    self.last_activity_id = rows[-1].id
+                total += len(rows)
+            if len(rows) < AGENT_STATE_BATCH_SIZE:
+                break
+        self.last_poll = datetime.now()
+        return total
+
+    def run_once(self):
+        db = SessionLocal()
+        try:
+            if not self.ready:
+                self.bootstrap(db)
+            else:
+                self.poll(db)
+        finally:
+            db.close()
+
+    # ----------------------------------------
+    # queuelog (suscriptor del tail de queue_state)
+    # ----------------------------------------
+
+    def _apply_call_event(self, row: Any):
+        if not row.agent:
+            return
+        previous = self._last_call_events.get(row.agent)
+        if previous is None or row.id > previous.id:
+            self._last_call_events[row.agent] = row
+
+    def _count_connect(self, row: Any):
+        if self._calls_baseline_id is None:
+            self._pending_connects.append(row)
+            return
+        if row.id <= self._calls_baseline_id or not row.time:
+            return
+        today = date.today()
+        if today != self._calls_day:
+            self._calls_day = today
+            self._calls_today = {}
+        if row.time.date() != today:
+            return
+        entry = self._calls_today.setdefault(row.agent, [0, None])
+        entry[0] += 1
+        if entry[1] is None or row.time > entry[1]:
+            entry[1] = row.time
+
+    def apply_queuelog(self, rows: List[Any]):
+        with self._lock:
+            for row in rows:
+                if row.event in CALL_EVENTS:
+                    self._apply_call_event(row)
+                    if row.event == 'CONNECT':
+                        self._count_connect(row)
+
+    # ----------------------------------------
+    # Lectura
+    # ----------------------------------------
+
+    def latest_activities(self) -> List[AgentRecord]:
+        with self._lock:
+            records = list(self._agents.values())
+        records.sort(key=lambda record: record.agent or '')
+        return records
+
+    def latest_activity(self, agent: str) -> Optional[AgentRecord]:
+        with self._lock:
+            return self._agents.get(agent)
+
+    def available_by_queue(self) -> Dict[str, int]:
+        """Agentes cuyo último evento en cada cola es UNPAUSE o ADDMEMBER"""
+        available: Dict[str, int] = {}
+        with self._lock:
+            for (agent, queue), (_, event) in self._queue_events.items():
+                if 'UNPAUSE' in event or 'ADDMEMBER' in event:
+                    available[queue] = available.get(queue, 0) + 1
+        return available
+
+    def last_call_event(self, agent: str, max_age: timedelta) -> Optional[Any]:
+        """Último evento de llamada (CONNECT, COMPLETE*, RING*) si es más reciente que max_age"""
+        with self._lock:
+            row = self._last_call_events.get(agent)
+        if row is None or row.time is None or row.time < datetime.now() - max_age:
+            return None
+        return row
+
+    def calls_today(self, agent: str) -> Tuple[int, Optional[datetime]]:
+        """Llamadas conectadas hoy y hora de la última"""
+        with self._lock:
+            if self._calls_day != date.today():
+                return 0, None
+            entry = self._calls_today.get(agent)
+        return (entry[0], entry[1]) if entry else (0, None)
+
+
+agent_state = AgentStateProjection()
+
+
+def agent_state_ready() -> bool:
+    """True cuando la proyección está cargada y al día (incluido el tail de queuelog)"""
+    if not agent_state.ready or agent_state.last_poll is None or not queue_state_ready():
+        return False
+    return datetime.now() - agent_state.last_poll < timedelta(seconds=max(AGENT_STATE_INTERVAL * 10, 30))
+
+
+def init_agent_state():
+    """Registra el proceso incremental de agent_activity (se llama en el startup)"""
+    if AGENT_STATE_ENABLED:
+        queuelog_tail.subscribe(agent_state.apply_queuelog)
+        register_task(PeriodicTask("agent-state", AGENT_STATE_INTERVAL, agent_state.run_once))
@@ -0,0 +1,299 @@
+# services/asternic_client.py
+"""
+Cliente HTTP async compartido para la API de Asternic.
+
+Un solo httpx.AsyncClient por proceso mantiene las conexiones abiertas
+(keep-alive) entre peticiones, con autenticación Basic de ASTERNIC_USER/PASS.
+Las llamadas no bloquean un hilo del threadpool mientras Asternic responde, y
+fetch_many() / cached_get_many() hacen varias peticiones a la vez: el tiempo
+total es el de la más lenta y no la suma.
+
+Resiliencia ante caídas o lentitud de Asternic:
+
+- circuit breaker: tras ASTERNIC_CIRCUIT_FAILURES fallos seguidos (sin respuesta
+  o 5xx) las llamadas fallan de inmediato durante ASTERNIC_CIRCUIT_RESET
+  segundos; después se deja pasar una sola petición de prueba (half-open);
+- stale-while-revalidate (cached_get): cada endpoint tiene un presupuesto de
+  frescura; pasado ese tiempo se sirve la última respuesta buena (con su edad)
+  mientras se refresca en segundo plano, hasta un máximo de antigüedad.
+
+Uso:
+
+    result = await cached_get("/api/queues")
+    result.data, result.age, result.stale
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set
+
+import httpx
+
+ASTERNIC_URL = os.getenv("ASTERNIC_URL", "http://10.10.16.9/stats")
+ASTERNIC_USER = os.getenv("ASTERNIC_USER", "adminbeyond")
+ASTERNIC_PASS = os.getenv("ASTERNIC_PASS", "adminbeyond")
+ASTERNIC_TIMEOUT = float(os.getenv("ASTERNIC_TIMEOUT", "10"))
+ASTERNIC_CONNECT_TIMEOUT = float(os.getenv("ASTERNIC_CONNECT_TIMEOUT", "3"))
+ASTERNIC_MAX_CONNECTIONS = int(os.getenv("ASTERNIC_MAX_CONNECTIONS", "10"))
+ASTERNIC_CIRCUIT_FAILURES = int(os.getenv("ASTERNIC_CIRCUIT_FAILURES", "3"))
+ASTERNIC_CIRCUIT_RESET = float(os.getenv("ASTERNIC_CIRCUIT_RESET", "30"))
+ASTERNIC_MAX_STALE = float(os.getenv("ASTERNIC_MAX_STALE", "300"))
+ASTERNIC_CACHE_ENTRIES = int(os.getenv("ASTERNIC_CACHE_ENTRIES", "500"))
+
+# Segundos que una respuesta se considera fresca, por endpoint de Asternic
+FRESHNESS_BUDGETS = {
+    "/api/queues": 5,
+    "/api/agents": 5,
+    "/api/agent-stats": 60,
+}
+DEFAULT_FRESHNESS = 10
+
+
+class AsternicError(Exception):
+    """
+    Fallo al consultar Asternic.
+    status_code es el código HTTP de Asternic, o None si no hubo respuesta
+    (conexión rechazada, timeout, DNS...).
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None, circuit_open: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.circuit_open = circuit_open
+
+
+class CircuitBreaker:
+    """
+    closed -> open tras `failures` fallos seguidos; open -> half-open pasado `reset_after`;
+    en half-open una sola petición de prueba decide si se cierra o se vuelve a abrir.
+    Solo se usa desde el event loop, no necesita lock.
+    """
+
+    def __init__(self, failures: int = ASTERNIC_CIRCUIT_FAILURES, reset_after: float = ASTERNIC_CIRCUIT_RESET):
+        self.failure_threshold = failures
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_at = 0.0
+        self.rejected = 0
+
+    def retry_after(self) -> int:
+        return max(1, int(self.opened_at + self.reset_after - time.time()))
+
+    def allow(self) -> bool:
+        now = time.time()
+        if self.state == "open":
+            if now - self.opened_at < self.reset_after:
+                self.rejected += 1
+                return False
+            self.state = "half-open"
+            self.trial_at = 0.0
+        if self.state == "half-open":
+            # Una prueba a la vez; si la anterior quedó colgada se permite otra tras el timeout
+            if self.trial_at and now - self.trial_at < ASTERNIC_TIMEOUT:
+                self.rejected += 1
+                return False
+            self.trial_at = now
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half-open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                print(f"Asternic: circuito abierto tras {self.failures} fallos")
+            self.state = "open"
+            self.opened_at = time.time()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_after": self.retry_after() if self.state == "open" else None,
+            "rejected": self.rejected
+        }
+
+
+breaker = CircuitBreaker()
+
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Cliente compartido; se crea en la primera petición"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=ASTERNIC_URL.rstrip("/"),
+            auth=httpx.BasicAuth(ASTERNIC_USER, ASTERNIC_PASS),
+            timeout=httpx.Timeout(ASTERNIC_TIMEOUT, connect=ASTERNIC_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=ASTERNIC_MAX_CONNECTIONS,
+                max_keepalive_connections=ASTERNIC_MAX_CONNECTIONS
+            )
+        )
+    return _client
+
+
+async def close_asternic_client():
+    """Cierra las conexiones abiertas (se llama en el shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def get_json(path: str, params: Optional[Dict[str, Any]] = None,
+                   timeout: Optional[float] = None) -> Any:
+    """
+    GET a la API de Asternic y devuelve el JSON.
+    timeout sobrescribe ASTERNIC_TIMEOUT solo para esta llamada.
+    Con el circuito abierto falla de inmediato sin tocar la red.
+    """
+    if not breaker.allow():
+        raise AsternicError(
+            f"Circuito abierto, reintento en {breaker.retry_after()}s", circuit_open=True
+        )
+    try:
+        response = await get_client().get(
+            path,
+            params=params,
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+        )
+    except httpx.HTTPError as e:
+        breaker.record_failure()
+        raise AsternicError(f"{type(e).__name__}: {str(e) or path}") from e
+
+    # Un 4xx (p. ej. agente inexistente) no indica que Asternic esté caído
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+    if response.status_code != 200:
+        raise AsternicError(f"Asternic respondió {response.status_code} en {path}", response.status_code)
+    try:
+        return response.json()
+    except ValueError as e:
+        raise AsternicError(f"Respuesta no válida de Asternic en {path}: {str(e)}", response.status_code) from e
+
+
+async def fetch_many(*paths: str, timeout: Optional[float] = None) -> list:
+    """
+    Hace los GET en paralelo (sin caché) y devuelve los resultados en el mismo orden.
+    Cada elemento es el JSON o la AsternicError de esa llamada, para que el
+    llamador decida si un fallo parcial es aceptable.
+    """
+    return await asyncio.gather(
+        *(get_json(path, timeout=timeout) for path in paths),
+        return_exceptions=True
+    )
+
+
+class CachedResult:
+    """Respuesta de cached_get: el JSON, su edad en segundos y si ya pasó su presupuesto de frescura"""
+    __slots__ = ("data", "age", "stale")
+
+    def __init__(self, data: Any, age: float, stale: bool):
+        self.data = data
+        self.age = age
+        self.stale = stale
+
+
+class _CacheEntry:
+    __slots__ = ("data", "fetched_at")
+
+    def __init__(self, data: Any, fetched_at: float):
+        self.data = data
+        self.fetched_at = fetched_at
+
+
+_cache: "OrderedDict[Hashable, _CacheEntry]" = OrderedDict()
+_inflight: Dict[Hashable, "asyncio.Task"] = {}
+_background: Set["asyncio.Task"] = set()
+_stale_served = 0
+
+
+def _cache_key(path: str, params: Optional[Dict[str, Any]]) -> Hashable:
+    return path, tuple(sorted((params or {}).items()))
+
+
+def _refresh(key: Hashable, path: str, params: Optional[Dict[str, Any]]) -> "asyncio.Task":
+    """Petición a Asternic compartida por todos los que esperan la misma llave (single-flight)"""
+    task = _inflight.get(key)
+    if task is not None:
+        return task
+
+    async def load():
+        try:
+            data = await get_json(path, params)
+            _cache[key] = _CacheEntry(data, time.time())
+            _cache.move_to_end(key)
+            while len(_cache) > ASTERNIC_CACHE_ENTRIES:
+                _cache.popitem(last=False)
+            return data
+        finally:
+            _inflight.pop(key, None)
+
+    task = asyncio.ensure_future(load())
+    _inflight[key] = task
+    return task
+
+
+def _refresh_in_background(key: Hashable, path: str, params: Optional[Dict[str, Any]]):
+    task = _refresh(key, path, params)
+    if task not in _background:
+        _background.add(task)
+        # El error ya quedó registrado en el breaker; solo se consume para que no se reporte
+        task.add_done_callback(lambda t: (_background.discard(t), t.cancelled() or t.exception()))
+
+
+async def cached_get(path: str, params: Optional[Dict[str, Any]] = None,
+                     fresh_for: Optional[float] = None, max_stale: float = ASTERNIC_MAX_STALE) -> CachedResult:
+    """
+    GET con stale-while-revalidate:
+    - dentro del presupuesto de frescura se responde de la caché;
+    - después, hasta max_stale, se responde la última respuesta buena y se refresca en segundo plano;
+    - sin respuesta utilizable se espera a Asternic (o falla rápido si el circuito está abierto).
+    """
+    global _stale_served
+    if fresh_for is None:
+        fresh_for = FRESHNESS_BUDGETS.get(path, DEFAULT_FRESHNESS)
+    key = _cache_key(path, params)
+    entry = _cache.get(key)
+
+    if entry is not None:
+        age = time.time() - entry.fetched_at
+        if age < fresh_for:
+            return CachedResult(entry.data, age, False)
+        if age < max_stale:
+            _refresh_in_background(key, path, params)
+            _stale_served += 1
+            return CachedResult(entry.data, age, True)
+
+    data = await asyncio.shield(_refresh(key, path, params))
+    return CachedResult(data, 0.0, False)
+
+
+async def cached_get_many(*paths: str) -> list:
+    """
+    cached_get de varios endpoints en paralelo, en el mismo orden.
+    Cada elemento es un CachedResult o la AsternicError de esa llamada, para que
+    el llamador decida si un fallo parcial es aceptable.
+    """
+    return await asyncio.gather(*(cached_get(path) for path in paths), return_exceptions=True)
+
+
+def asternic_stats() -> Dict[str, Any]:
+    return {
+        "circuit": breaker.stats(),
+        "cache_entries": len(_cache),
+        "refreshing": len(_inflight),
+        "stale_served": _stale_served
+    }
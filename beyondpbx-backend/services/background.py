@@ -0,0 +1,61 @@
+# services/background.py
+"""
+Tareas periódicas en segundo plano (hilos daemon) para los procesos incrementales
+"""
+import threading
+import traceback
+from typing import Callable, Dict, Optional
+
+
+class PeriodicTask:
+    """
+    Ejecuta una función cada `interval` segundos en un hilo daemon.
+    Los errores se registran y la tarea sigue corriendo en el siguiente ciclo.
+    """
+
+    def __init__(self, name: str, interval: float, func: Callable[[], None]):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.func()
+            except Exception as e:
+                print(f"Error en tarea {self.name}: {str(e)}")
+                traceback.print_exc()
+            self._stop_event.wait(self.interval)
+
+
+_tasks: Dict[str, PeriodicTask] = {}
+
+
+def register_task(task: PeriodicTask) -> PeriodicTask:
+    """Registra una tarea para que arranque/pare junto con la aplicación"""
+    _tasks[task.name] = task
+    return task
+
+
+def start_all():
+    for task in _tasks.values():
+        task.start()
+
+
+def stop_all():
+    for task in _tasks.values():
+        task.stop()
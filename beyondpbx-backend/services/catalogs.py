@@ -0,0 +1,151 @@
+# services/catalogs.py
+"""
+Caché de catálogos (tablas de dimensión pequeñas) compartida por todo el proceso.
+
+Las tablas queuenames, agentnames, users, pauses, qevent, qname, qagent e
+ivr_entries cambian muy poco pero se unían en casi todas las consultas (o se consultaban
+una vez por agente dentro de un bucle). Aquí se cargan completas en diccionarios
+y los routers resuelven los nombres en Python.
+
+Detección de cambios: cada CATALOG_CHECK_INTERVAL segundos se compara
+`COUNT(*)` + `BIT_XOR(CRC32(...))` de la tabla contra la última carga; solo si
+cambia se vuelve a leer. Las escrituras propias (CRUD de colas) invalidan el
+catálogo de inmediato.
+
+Uso:
+
+    queue_names = catalogs.get(db, "queuenames")
+    name = queue_names.get(device, device)
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import AgentName, IVREntry, Pause, QAgent, QEvent, QName, QueueName, User
+
+CATALOG_CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", "30"))
+
+
+class Catalog:
+    """Una tabla de dimensión cargada como {llave: valor}"""
+
+    def __init__(self, name: str, key_column: Any, value_column: Any):
+        self.name = name
+        self.key_column = key_column
+        self.value_column = value_column
+        self.values: Dict[Any, Any] = {}
+        self.inverse: Dict[Any, Any] = {}
+        self.signature: Optional[Tuple[int, int]] = None
+        self.checked_at = 0.0
+        self.loaded_at = 0.0
+        self.loads = 0
+        # lock solo protege el cambio de versión (sin I/O); refreshing marca una verificación en curso
+        self.lock = threading.Lock()
+        self.refreshing = threading.Lock()
+
+    def fetch_signature(self, db: Session) -> Tuple[int, int]:
+        """Número de filas y checksum de llave/valor (cambia con cualquier insert/update/delete)"""
+        row = db.query(
+            func.count(),
+            func.coalesce(func.bit_xor(func.crc32(func.concat_ws('|', self.key_column, self.value_column))), 0)
+        ).one()
+        return int(row[0] or 0), int(row[1] or 0)
+
+    def fetch(self, db: Session) -> Tuple[Dict[Any, Any], Dict[Any, Any]]:
+        """(valores, inverso) leídos de la tabla"""
+        rows = db.query(self.key_column, self.value_column).all()
+        return {row[0]: row[1] for row in rows}, {row[1]: row[0] for row in rows if row[1] is not None}
+
+    def swap(self, values: Dict[Any, Any], inverse: Dict[Any, Any], signature: Tuple[int, int]):
+        """Reemplaza el contenido de una vez; los lectores ven la versión anterior o la nueva completa"""
+        with self.lock:
+            self.values = values
+            self.inverse = inverse
+            self.signature = signature
+            self.loaded_at = time.time()
+            self.loads += 1
+
+
+class CatalogService:
+    """Registro de catálogos con verificación de cambios perezosa"""
+
+    def __init__(self, check_interval: float = CATALOG_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._catalogs: Dict[str, Catalog] = {}
+
+    def register(self, name: str, key_column: Any, value_column: Any):
+        self._catalogs[name] = Catalog(name, key_column, value_column)
+
+    def _refresh(self, db: Session, catalog: Catalog) -> Catalog:
+        now = time.time()
+        if catalog.signature is not None and now - catalog.checked_at < self.check_interval:
+            return catalog
+
+        # Nunca se espera a otra verificación: con run_sync varias peticiones comparten
+        # el hilo del event loop y esperar un lock tomado por otra la bloquearía para siempre
+        if not catalog.refreshing.acquire(blocking=False):
+            if catalog.signature is not None:
+                return catalog  # Se sirve la versión actual mientras la otra petición verifica
+            self._reload(db, catalog)  # Primera carga: sin datos que servir, se lee por cuenta propia
+            return catalog
+
+        try:
+            self._reload(db, catalog)
+        finally:
+            catalog.refreshing.release()
+        return catalog
+
+    def _reload(self, db: Session, catalog: Catalog):
+        """Consulta fuera de cualquier lock; solo el cambio de versión queda bajo catalog.lock"""
+        signature = catalog.fetch_signature(db)
+        if signature != catalog.signature:
+            values, inverse = catalog.fetch(db)
+            catalog.swap(values, inverse, signature)
+        catalog.checked_at = time.time()
+
+    def get(self, db: Session, name: str) -> Dict[Any, Any]:
+        """Diccionario {llave: valor} del catálogo (no modificar)"""
+        return self._refresh(db, self._catalogs[name]).values
+
+    def inverse(self, db: Session, name: str) -> Dict[Any, Any]:
+        """Diccionario {valor: llave}, p. ej. nombre de evento -> event_id"""
+        return self._refresh(db, self._catalogs[name]).inverse
+
+    def versioned(self, db: Session, name: str) -> Tuple[Dict[Any, Any], Optional[Tuple[int, int]]]:
+        """(valores, firma): la firma cambia con cada cambio en la tabla y sirve como versión"""
+        catalog = self._refresh(db, self._catalogs[name])
+        with catalog.lock:
+            return catalog.values, catalog.signature
+
+    def invalidate(self, name: Optional[str] = None):
+        """Fuerza la verificación en la próxima lectura (todas o solo un catálogo)"""
+        for catalog in self._catalogs.values():
+            if name is None or catalog.name == name:
+                catalog.checked_at = 0.0
+                catalog.signature = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "entries": len(catalog.values),
+                "loads": catalog.loads,
+                "loaded_at": catalog.loaded_at or None
+            }
+            for name, catalog in sorted(self._catalogs.items())
+        }
+
+
+catalogs = CatalogService()
+catalogs.register("queuenames", QueueName.device, QueueName.queue)
+catalogs.register("agentnames", AgentName.device, AgentName.agent)
+catalogs.register("users", User.extension, User.name)
+catalogs.register("pauses", Pause.pause_id, Pause.pause_name)
+catalogs.register("qevent", QEvent.event_id, QEvent.event)
+catalogs.register("qname", QName.queue_id, QName.queue)
+catalogs.register("qagent", QAgent.agent_id, QAgent.agent)
+# Llave compuesta "ivr_id|selection" -> dest
+catalogs.register("ivr_entries", func.concat_ws('|', IVREntry.ivr_id, IVREntry.selection), IVREntry.dest)
@@ -0,0 +1,112 @@
+# services/cdr_aggregation.py
+"""
+Motor de agregación de una sola pasada para los paneles de advanced-stats.
+
+Cada fila de cdr se "pliega" al mismo tiempo en todos los acumuladores
+(disposiciones, por día, por hora, por destino y tipo de destino), así el
+rango se lee una sola vez con un cursor del lado del servidor en lugar de
+lanzar una consulta por panel. Los rollups alimentan el mismo acumulador
+con buckets ya agregados.
+"""
+import heapq
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from services.cdr_rollups import CDRCounters
+from utils.cdr_utils import classify_destination
+
+STREAM_BATCH_SIZE = int(os.getenv("CDR_STREAM_BATCH_SIZE", "5000"))
+
+
+class CDRPanelAccumulator:
+    """Acumuladores de todos los paneles del dashboard avanzado"""
+
+    def __init__(self):
+        self.totals = CDRCounters()
+        self.daily: Dict = defaultdict(lambda: [0, 0])
+        self.hourly: Dict[int, List[int]] = defaultdict(lambda: [0, 0])
+        self.per_dst: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+
+    def add_row(self, calldate: datetime, disposition: Optional[str], duration: Optional[int],
+                billsec: Optional[int], dst: Optional[str]):
+        """Pliega una fila cruda de cdr"""
+        answered = 1 if disposition == 'ANSWERED' else 0
+        self.totals.add(disposition, 1, duration, billsec)
+
+        day = self.daily[calldate.date()]
+        day[0] += 1
+        day[1] += answered
+
+        hour = self.hourly[calldate.hour]
+        hour[0] += 1
+        hour[1] += answered
+
+        dst_counts = self.per_dst[dst or ""]
+        dst_counts[0] += 1
+        dst_counts[1] += answered
+
+    def add_bucket(self, bucket: datetime, counters: CDRCounters):
+        """Pliega un bucket horario ya agregado (rollups)"""
+        self.totals.merge(counters)
+
+        day = self.daily[bucket.date()]
+        day[0] += counters.total_calls
+        day[1] += counters.answered_calls
+
+        hour = self.hourly[bucket.hour]
+        hour[0] += counters.total_calls
+        hour[1] += counters.answered_calls
+
+    def add_dst(self, dst: Optional[str], total_calls: int, answered_calls: int):
+        """Pliega conteos ya agregados de un destino (rollups)"""
+        dst_counts = self.per_dst[dst or ""]
+        dst_counts[0] += total_calls
+        dst_counts[1] += answered_calls
+
+    def destination_distribution(self) -> List[Tuple[str, int]]:
+        """Llamadas por tipo de destino, clasificando cada dst distinto una sola vez"""
+        dest_types: Dict[str, int] = defaultdict(int)
+        for dst, counts in self.per_dst.items():
+            dest_types[classify_destination(dst)] += counts[0]
+        return sorted(dest_types.items(), key=lambda item: item[1], reverse=True)
+
+    def top_destinations(self, k: int = 10) -> List[Tuple[str, List[int]]]:
+        """Top-K destinos por llamadas contestadas (solo los que tienen alguna)"""
+        return heapq.nlargest(
+            k,
+            ((dst, counts) for dst, counts in self.per_dst.items() if counts[1] > 0),
+            key=lambda item: item[1][1]
+        )
+
+
+def aggregate_cdr_range(db: Session, start_date: datetime, end_date: datetime,
+                        batch_size: int = STREAM_BATCH_SIZE) -> CDRPanelAccumulator:
+    """
+    Recorre cdr una sola vez con un cursor sin buffer (SSCursor) y pliega cada
+    fila en todos los acumuladores. La memoria usada es proporcional al número
+    de días/horas/destinos distintos, no al de filas.
+    """
+    accumulator = CDRPanelAccumulator()
+
+    result = db.execute(
+        text("""
+            SELECT calldate, disposition, duration, billsec, dst
+            FROM asteriskcdrdb.cdr
+            WHERE calldate >= :start_date AND calldate <= :end_date
+        """),
+        {"start_date": start_date, "end_date": end_date},
+        execution_options={"stream_results": True, "yield_per": batch_size}
+    )
+    try:
+        for row in result:
+            if row[0] is not None:
+                accumulator.add_row(row[0], row[1], row[2], row[3], row[4])
+    finally:
+        result.close()
+
+    return accumulator
@@ -0,0 +1,146 @@
+# services/cdr_counts.py
+"""
+Conteo total de registros de cdr para los listados paginados.
+
+`SELECT COUNT(*) ... WHERE calldate >= :start` recorría todo el rango en cada
+página. Aquí el total se arma con:
+- conteos por día cacheados en memoria para los días ya cerrados (no cambian),
+- el tramo parcial del primer día (el rango suele empezar a media jornada), y
+- un conteo en vivo solo de la parte abierta (hoy, o desde ayer durante el margen
+  de gracia en que aún pueden llegar llamadas largas que empezaron antes de las 00:00).
+
+Con approximate=True no se toca la parte en vivo en cada petición: se usa el
+último conteo (con TTL corto) y el primer día se prorratea.
+"""
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+CLOSE_GRACE = timedelta(minutes=int(os.getenv("CDR_COUNT_CLOSE_GRACE_MINUTES", "120")))
+LIVE_COUNT_TTL = float(os.getenv("CDR_COUNT_LIVE_TTL", "30"))
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, datetime.min.time())
+
+
+class CDRDayCountCache:
+    """Conteos por día de asteriskcdrdb.cdr, solo para días cerrados"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._days: Dict[date, int] = {}
+        self._live: Dict[datetime, Tuple[float, int]] = {}
+
+    def is_closed(self, day: date, now: datetime) -> bool:
+        return _day_start(day) + timedelta(days=1) + CLOSE_GRACE <= now
+
+    def first_open_day(self, now: datetime) -> date:
+        day = now.date()
+        while not self.is_closed(day - timedelta(days=1), now):
+            day -= timedelta(days=1)
+        return day
+
+    def day_counts(self, db: Session, first_day: date, last_day: date) -> Dict[date, int]:
+        """Conteos de [first_day, last_day]; los que faltan se cargan en una sola consulta agrupada"""
+        with self._lock:
+            missing = [
+                first_day + timedelta(days=i)
+                for i in range((last_day - first_day).days + 1)
+                if first_day + timedelta(days=i) not in self._days
+            ]
+
+        if missing:
+            rows = db.execute(text("""
+                SELECT DATE(calldate) as day, COUNT(*) as total
+                FROM asteriskcdrdb.cdr
+                WHERE calldate >= :start_date AND calldate < :end_date
+                GROUP BY DATE(calldate)
+            """), {
+                "start_date": _day_start(missing[0]),
+                "end_date": _day_start(missing[-1] + timedelta(days=1))
+            }).fetchall()
+            loaded = {day: 0 for day in missing}
+            loaded.update({row[0]: row[1] for row in rows if row[0] in loaded})
+            with self._lock:
+                self._days.update(loaded)
+
+        with self._lock:
+            return {
+                first_day + timedelta(days=i): self._days.get(first_day + timedelta(days=i), 0)
+                for i in range((last_day - first_day).days + 1)
+            }
+
+    def live_count(self, db: Session, start_date: datetime, max_age: Optional[float] = None) -> int:
+        """Conteo desde start_date hasta ahora; con max_age se reutiliza el último conteo si es reciente"""
+        now = time.time()
+        if max_age is not None:
+            with self._lock:
+                cached = self._live.get(start_date)
+            if cached and now - cached[0] < max_age:
+                return cached[1]
+
+        total = db.execute(text("""
+            SELECT COUNT(*)
+            FROM asteriskcdrdb.cdr
+            WHERE calldate >= :start_date
+        """), {"start_date": start_date}).scalar() or 0
+
+        with self._lock:
+            # Solo interesa el último tramo abierto; se descartan llaves viejas
+            self._live = {k: v for k, v in self._live.items() if k >= start_date}
+            self._live[start_date] = (now, total)
+        return total
+
+    def count_between(self, db: Session, start_date: datetime, end_date: datetime) -> int:
+        return db.execute(text("""
+            SELECT COUNT(*)
+            FROM asteriskcdrdb.cdr
+            WHERE calldate >= :start_date AND calldate < :end_date
+        """), {"start_date": start_date, "end_date": end_date}).scalar() or 0
+
+    def clear(self):
+        with self._lock:
+            self._days.clear()
+            self._live.clear()
+
+
+cdr_day_counts = CDRDayCountCache()
+
+
+def count_cdr_since(db: Session, start_date: datetime, approximate: bool = False) -> Tuple[int, bool]:
+    """
+    Total de cdr con calldate >= start_date.
+    Devuelve (total, es_aproximado).
+    """
+    now = datetime.now()
+    open_day = cdr_day_counts.first_open_day(now)
+    open_start = _day_start(open_day)
+
+    # Todo el rango cae en la parte abierta: solo hay conteo en vivo
+    if start_date >= open_start:
+        if approximate:
+            return cdr_day_counts.live_count(db, start_date, LIVE_COUNT_TTL), True
+        return cdr_day_counts.live_count(db, start_date), False
+
+    first_day = start_date.date()
+    counts = cdr_day_counts.day_counts(db, first_day, open_day - timedelta(days=1))
+    total = sum(counts.values())
+
+    # Primer día parcial: se resta lo que quedó antes de start_date
+    first_day_start = _day_start(first_day)
+    if start_date > first_day_start:
+        if approximate:
+            covered = 1 - (start_date - first_day_start).total_seconds() / 86400
+            total -= counts[first_day] - int(round(counts[first_day] * covered))
+        else:
+            total -= cdr_day_counts.count_between(db, first_day_start, start_date)
+
+    if approximate:
+        return total + cdr_day_counts.live_count(db, open_start, LIVE_COUNT_TTL), True
+    return total + cdr_day_counts.live_count(db, open_start), False
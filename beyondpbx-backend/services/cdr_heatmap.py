@@ -0,0 +1,213 @@
+# services/cdr_heatmap.py
+"""
+Heatmap hora × día de la semana para rangos arbitrarios.
+
+El cubo beyondpbx.cdr_heatmap_cube guarda llamadas por (hora, DID, cola,
+disposición). Se llena con un proceso incremental igual al de los rollups, con
+su propia marca de agua para que al crearse rellene todo el histórico.
+
+Lectura:
+- sin filtros de DID/cola se usa cdr_rollup_hourly (una fila por hora, también
+  separa por disposición), así varios años son ~26,000 filas agregadas en MySQL;
+- con filtros se usa el cubo, que tiene índices (did, bucket) y (queue, bucket);
+- en ambos casos se suma la cola de cdr todavía no procesada (id > marca de agua).
+
+MySQL devuelve a lo más 24 × 7 filas ya agrupadas por WEEKDAY/HOUR y la matriz
+se arma indexando directo, sin recorrer los resultados por cada celda.
+"""
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import CDRHeatmapCube
+from services.background import PeriodicTask, register_task
+from services.cdr_rollups import (
+    DISPOSITION_FIELDS, ROLLUP_BATCH_SIZE, ROLLUP_INTERVAL, ROLLUP_MAX_BATCHES,
+    WATERMARK_NAME as ROLLUP_WATERMARK_NAME, rollups_available
+)
+from services.watermarks import STATS_SCHEMA, ensure_tables, get_watermark, lock_watermark, set_watermark
+
+HEATMAP_CUBE_ENABLED = os.getenv("CDR_HEATMAP_CUBE_ENABLED", "true").lower() == "true"
+
+WATERMARK_NAME = "cdr_heatmap_cube"
+
+# WEEKDAY() de MySQL: 0 = lunes ... 6 = domingo
+WEEKDAY_LABELS = ['Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb', 'Dom']
+
+# Llamadas que entran a una cola en FreePBX
+QUEUE_CONTEXT = "ext-queues"
+
+_available = False
+
+
+def heatmap_cube_available() -> bool:
+    return _available
+
+
+def init_cdr_heatmap():
+    """Crea la tabla del cubo y registra su proceso incremental (se llama en el startup)"""
+    global _available
+    if not HEATMAP_CUBE_ENABLED:
+        return
+    try:
+        ensure_tables([CDRHeatmapCube])
+    except Exception as e:
+        print(f"Cubo del heatmap deshabilitado, no se pudo crear la tabla: {str(e)}")
+        return
+    _available = True
+    register_task(PeriodicTask("cdr-heatmap-cube", ROLLUP_INTERVAL, run_cdr_heatmap_job))
+
+
+def run_cdr_heatmap_job():
+    db = SessionLocal()
+    try:
+        processed = refresh_cdr_heatmap_cube(db)
+        if processed:
+            print(f"Cubo del heatmap: {processed} filas nuevas agregadas")
+    finally:
+        db.close()
+
+
+def refresh_cdr_heatmap_cube(db: Session, batch_size: int = ROLLUP_BATCH_SIZE,
+                             max_batches: int = ROLLUP_MAX_BATCHES) -> int:
+    """Agrega lotes de cdr por id al cubo, cada lote en la misma transacción que la marca"""
+    processed = 0
+    for _ in range(max_batches):
+        try:
+            last_id, _ = lock_watermark(db, WATERMARK_NAME)
+            rows = db.execute(text("""
+                SELECT id, calldate, did, dst, dcontext, disposition
+                FROM asteriskcdrdb.cdr
+                WHERE id > :last_id
+                ORDER BY id
+                LIMIT :limit
+            """), {"last_id": last_id, "limit": batch_size}).fetchall()
+
+            if not rows:
+                db.rollback()
+                break
+
+            cells: Dict[Tuple[datetime, str, str, str], int] = defaultdict(int)
+            for row in rows:
+                calldate = row[1]
+                if calldate is None:
+                    continue
+                queue = (row[3] or "") if row[4] == QUEUE_CONTEXT else ""
+                bucket = calldate.replace(minute=0, second=0, microsecond=0)
+                cells[(bucket, row[2] or "", queue, row[5] or "")] += 1
+
+            if cells:
+                db.execute(text(f"""
+                    INSERT INTO {STATS_SCHEMA}.cdr_heatmap_cube (bucket, did, queue, disposition, calls)
+                    VALUES (:bucket, :did, :queue, :disposition, :calls)
+                    ON DUPLICATE KEY UPDATE calls = calls + VALUES(calls)
+                """), [
+                    {"bucket": key[0], "did": key[1], "queue": key[2], "disposition": key[3], "calls": calls}
+                    for key, calls in cells.items()
+                ])
+
+            set_watermark(db, WATERMARK_NAME, rows[-1][0], rows[-1][1])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        processed += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    return processed
+
+
+# ============================================
+# LECTURA
+# ============================================
+
+def _filters(queue: Optional[str], did: Optional[str], disposition: Optional[str],
+             from_cube: bool) -> Tuple[str, Dict[str, Any]]:
+    """Condiciones extra del WHERE para el cubo o para cdr crudo"""
+    clauses, params = [], {}
+    if did is not None:
+        clauses.append("did = :did")
+        params["did"] = did
+    if queue is not None:
+        if from_cube:
+            clauses.append("queue = :queue")
+        else:
+            clauses.append("dst = :queue AND dcontext = :queue_context")
+            params["queue_context"] = QUEUE_CONTEXT
+        params["queue"] = queue
+    if disposition is not None:
+        clauses.append("disposition = :disposition")
+        params["disposition"] = disposition
+    return "".join(f" AND {clause}" for clause in clauses), params
+
+
+def _heatmap_rows(db: Session, start: datetime, end: datetime, queue: Optional[str],
+                  did: Optional[str], disposition: Optional[str]) -> List[Any]:
+    """Filas (weekday, hour, calls) del rango [start, end), ya agrupadas"""
+    raw_filter, raw_params = _filters(queue, did, disposition, from_cube=False)
+
+    if queue is None and did is None and rollups_available():
+        # Sin filtros de dimensión basta el rollup por hora
+        last_id, _ = get_watermark(db, ROLLUP_WATERMARK_NAME)
+        column = DISPOSITION_FIELDS[disposition] if disposition else "total_calls"
+        rollup_rows = db.execute(text(f"""
+            SELECT WEEKDAY(bucket), HOUR(bucket), SUM({column})
+            FROM {STATS_SCHEMA}.cdr_rollup_hourly
+            WHERE bucket >= :start AND bucket < :end
+            GROUP BY WEEKDAY(bucket), HOUR(bucket)
+        """), {"start": start, "end": end}).fetchall()
+    elif heatmap_cube_available():
+        last_id, _ = get_watermark(db, WATERMARK_NAME)
+        cube_filter, cube_params = _filters(queue, did, disposition, from_cube=True)
+        rollup_rows = db.execute(text(f"""
+            SELECT WEEKDAY(bucket), HOUR(bucket), SUM(calls)
+            FROM {STATS_SCHEMA}.cdr_heatmap_cube
+            WHERE bucket >= :start AND bucket < :end{cube_filter}
+            GROUP BY WEEKDAY(bucket), HOUR(bucket)
+        """), {"start": start, "end": end, **cube_params}).fetchall()
+    else:
+        # Sin agregados: todo el rango desde cdr
+        last_id, rollup_rows = 0, []
+
+    # Cola de cdr todavía no agregada (con last_id = 0 es el rango completo)
+    raw_rows = db.execute(text(f"""
+        SELECT WEEKDAY(calldate), HOUR(calldate), COUNT(*)
+        FROM asteriskcdrdb.cdr
+        WHERE calldate >= :start AND calldate < :end AND id > :last_id{raw_filter}
+        GROUP BY WEEKDAY(calldate), HOUR(calldate)
+    """), {"start": start, "end": end, "last_id": last_id, **raw_params}).fetchall()
+
+    return list(rollup_rows) + list(raw_rows)
+
+
+def build_heatmap(db: Session, start_date: date, end_date: date, queue: Optional[str] = None,
+                  did: Optional[str] = None, disposition: Optional[str] = None) -> Dict[str, Any]:
+    """Heatmap de start_date a end_date (ambos incluidos)"""
+    start = datetime.combine(start_date, datetime.min.time())
+    end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+
+    # matrix[hora][weekday]
+    matrix = [[0] * 7 for _ in range(24)]
+    for weekday, hour, calls in _heatmap_rows(db, start, end, queue, did, disposition):
+        matrix[hour][weekday] += int(calls or 0)
+
+    return {
+        "heatmap": [
+            {'x': hour, 'y': WEEKDAY_LABELS[weekday], 'v': matrix[hour][weekday]}
+            for hour in range(24)
+            for weekday in range(7)
+        ],
+        "matrix": matrix,
+        "days": WEEKDAY_LABELS,
+        "total_calls": sum(map(sum, matrix)),
+        "filters": {"queue": queue, "did": did, "disposition": disposition},
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat()
+    }
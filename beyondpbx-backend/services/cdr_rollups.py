@@ -0,0 +1,289 @@
+# services/cdr_rollups.py
+"""
+Rollups incrementales de asteriskcdrdb.cdr (por hora, por día y por destino).
+
+Un proceso en segundo plano lee las filas nuevas de cdr (id > marca de agua),
+las agrega y suma los resultados a las tablas beyondpbx.cdr_rollup_*.
+Las consultas de lectura combinan:
+- los buckets completos del rollup, y
+- las filas crudas del borde inicial (bucket parcial) y de la "cola"
+  todavía no procesada (id > marca de agua),
+por lo que el resultado es exacto y un período de un año cuesta ~8,760 filas.
+"""
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import CDRHourlyRollup, CDRDailyRollup, CDRDailyDstRollup
+from services.background import PeriodicTask, register_task
+from services.watermarks import STATS_SCHEMA, ensure_tables, get_watermark, lock_watermark, set_watermark
+
+ROLLUP_ENABLED = os.getenv("CDR_ROLLUP_ENABLED", "true").lower() == "true"
+ROLLUP_INTERVAL = int(os.getenv("CDR_ROLLUP_INTERVAL", "60"))
+ROLLUP_BATCH_SIZE = int(os.getenv("CDR_ROLLUP_BATCH_SIZE", "20000"))
+ROLLUP_MAX_BATCHES = int(os.getenv("CDR_ROLLUP_MAX_BATCHES", "50"))
+
+WATERMARK_NAME = "cdr_rollups"
+
+COUNTER_FIELDS = (
+    "total_calls", "answered_calls", "no_answer_calls", "failed_calls",
+    "busy_calls", "duration_sum", "billsec_sum"
+)
+
+DISPOSITION_FIELDS = {
+    "ANSWERED": "answered_calls",
+    "NO ANSWER": "no_answer_calls",
+    "FAILED": "failed_calls",
+    "BUSY": "busy_calls",
+}
+
+_available = False
+
+
+class CDRCounters:
+    """Contadores de un bucket (hora o día)"""
+    __slots__ = COUNTER_FIELDS
+
+    def __init__(self):
+        for field in COUNTER_FIELDS:
+            setattr(self, field, 0)
+
+    def add(self, disposition: str, calls: int = 1, duration: int = 0, billsec: int = 0):
+        self.total_calls += calls
+        field = DISPOSITION_FIELDS.get(disposition)
+        if field:
+            setattr(self, field, getattr(self, field) + calls)
+        self.duration_sum += int(duration or 0)
+        self.billsec_sum += int(billsec or 0)
+
+    def merge(self, other: "CDRCounters"):
+        for field in COUNTER_FIELDS:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+
+    def as_params(self) -> Dict[str, int]:
+        return {field: getattr(self, field) for field in COUNTER_FIELDS}
+
+
+def rollups_available() -> bool:
+    """True si las tablas de rollup existen y el proceso está habilitado"""
+    return _available
+
+
+def init_cdr_rollups():
+    """Crea las tablas y registra el proceso incremental (se llama en el startup)"""
+    global _available
+    if not ROLLUP_ENABLED:
+        return
+    try:
+        ensure_tables([CDRHourlyRollup, CDRDailyRollup, CDRDailyDstRollup])
+    except Exception as e:
+        print(f"Rollups de CDR deshabilitados, no se pudieron crear las tablas: {str(e)}")
+        return
+    _available = True
+    register_task(PeriodicTask("cdr-rollups", ROLLUP_INTERVAL, run_cdr_rollup_job))
+
+
+def run_cdr_rollup_job():
+    db = SessionLocal()
+    try:
+        processed = refresh_cdr_rollups(db)
+        if processed:
+            print(f"Rollups de CDR: {processed} filas nuevas agregadas")
+    finally:
+        db.close()
+
+
+# ============================================
+# PROCESO INCREMENTAL
+# ============================================
+
+def refresh_cdr_rollups(db: Session, batch_size: int = ROLLUP_BATCH_SIZE,
+                        max_batches: int = ROLLUP_MAX_BATCHES) -> int:
+    """
+    Avanza la marca de agua procesando lotes de cdr por id.
+    Cada lote se agrega y se confirma en una sola transacción junto con la marca.
+    """
+    processed = 0
+    for _ in range(max_batches):
+        try:
+            last_id, _ = lock_watermark(db, WATERMARK_NAME)
+            rows = db.execute(text("""
+                SELECT id, calldate, disposition, duration, billsec, dst
+                FROM asteriskcdrdb.cdr
+                WHERE id > :last_id
+                ORDER BY id
+                LIMIT :limit
+            """), {"last_id": last_id, "limit": batch_size}).fetchall()
+
+            if not rows:
+                db.rollback()
+                break
+
+            hourly: Dict[datetime, CDRCounters] = defaultdict(CDRCounters)
+            daily: Dict[date, CDRCounters] = defaultdict(CDRCounters)
+            per_dst: Dict[Tuple[date, str], List[int]] = defaultdict(lambda: [0, 0])
+
+            for row in rows:
+                calldate = row[1]
+                if calldate is None:
+                    continue
+                hour = calldate.replace(minute=0, second=0, microsecond=0)
+                hourly[hour].add(row[2], 1, row[3], row[4])
+                daily[calldate.date()].add(row[2], 1, row[3], row[4])
+                dst_counts = per_dst[(calldate.date(), row[5] or "")]
+                dst_counts[0] += 1
+                if row[2] == "ANSWERED":
+                    dst_counts[1] += 1
+
+            _upsert_counters(db, "cdr_rollup_hourly", "bucket", hourly)
+            _upsert_counters(db, "cdr_rollup_daily", "day", daily)
+            if per_dst:
+                db.execute(text(f"""
+                    INSERT INTO {STATS_SCHEMA}.cdr_rollup_dst_daily (day, dst, total_calls, answered_calls)
+                    VALUES (:day, :dst, :total_calls, :answered_calls)
+                    ON DUPLICATE KEY UPDATE
+                        total_calls = total_calls + VALUES(total_calls),
+                        answered_calls = answered_calls + VALUES(answered_calls)
+                """), [
+                    {"day": key[0], "dst": key[1], "total_calls": counts[0], "answered_calls": counts[1]}
+                    for key, counts in per_dst.items()
+                ])
+
+            set_watermark(db, WATERMARK_NAME, rows[-1][0], rows[-1][1])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        processed += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    return processed
+
+
+def _upsert_counters(db: Session, table: str, key_column: str, buckets: Dict) -> None:
+    if not buckets:
+        return
+    columns = ", ".join(COUNTER_FIELDS)
+    values = ", ".join(f":{field}" for field in COUNTER_FIELDS)
+    updates = ", ".join(f"{field} = {field} + VALUES({field})" for field in COUNTER_FIELDS)
+    db.execute(text(f"""
+        INSERT INTO {STATS_SCHEMA}.{table} ({key_column}, {columns})
+        VALUES (:bucket_key, {values})
+        ON DUPLICATE KEY UPDATE {updates}
+    """), [
+        {"bucket_key": key, **counters.as_params()}
+        for key, counters in buckets.items()
+    ])
+
+
+# ============================================
+# LECTURA (rollup + borde inicial + cola sin procesar)
+# ============================================
+
+def _ceil_hour(value: datetime) -> datetime:
+    floored = value.replace(minute=0, second=0, microsecond=0)
+    return floored if floored == value else floored + timedelta(hours=1)
+
+
+def _ceil_day(value: datetime) -> datetime:
+    floored = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return floored if floored == value else floored + timedelta(days=1)
+
+
+def collect_cdr_buckets(db: Session, start_date: datetime, end_date: datetime,
+                        granularity: str = "hour") -> Dict:
+    """
+    Devuelve {bucket: CDRCounters} para calldate entre start_date y end_date.
+    granularity: "hour" (llaves datetime) o "day" (llaves date)
+    """
+    last_id, _ = get_watermark(db, WATERMARK_NAME)
+
+    if granularity == "hour":
+        table, key_column = "cdr_rollup_hourly", "bucket"
+        rollup_start = _ceil_hour(start_date)
+        raw_key = "TIMESTAMP(DATE(calldate), MAKETIME(HOUR(calldate), 0, 0))"
+    else:
+        table, key_column = "cdr_rollup_daily", "day"
+        rollup_start = _ceil_day(start_date)
+        raw_key = "DATE(calldate)"
+
+    buckets: Dict = defaultdict(CDRCounters)
+
+    rollup_rows = db.execute(text(f"""
+        SELECT {key_column}, {", ".join(COUNTER_FIELDS)}
+        FROM {STATS_SCHEMA}.{table}
+        WHERE {key_column} >= :rollup_start AND {key_column} <= :end_date
+    """), {"rollup_start": rollup_start, "end_date": end_date}).fetchall()
+
+    for row in rollup_rows:
+        counters = buckets[row[0]]
+        for index, field in enumerate(COUNTER_FIELDS, start=1):
+            setattr(counters, field, getattr(counters, field) + int(row[index] or 0))
+
+    raw_rows = db.execute(text(f"""
+        SELECT
+            {raw_key} as bucket,
+            disposition,
+            COUNT(*) as calls,
+            SUM(duration) as duration_sum,
+            SUM(billsec) as billsec_sum
+        FROM asteriskcdrdb.cdr
+        WHERE calldate >= :start_date AND calldate <= :end_date
+            AND (calldate < :rollup_start OR id > :last_id)
+        GROUP BY bucket, disposition
+    """), {
+        "start_date": start_date,
+        "end_date": end_date,
+        "rollup_start": rollup_start,
+        "last_id": last_id
+    }).fetchall()
+
+    for row in raw_rows:
+        buckets[row[0]].add(row[1], row[2], row[3], row[4])
+
+    return buckets
+
+
+def collect_dst_counts(db: Session, start_date: datetime, end_date: datetime) -> Dict[str, List[int]]:
+    """Devuelve {dst: [total_calls, answered_calls]} para el rango"""
+    last_id, _ = get_watermark(db, WATERMARK_NAME)
+    rollup_start = _ceil_day(start_date)
+
+    counts: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+
+    rollup_rows = db.execute(text(f"""
+        SELECT dst, SUM(total_calls), SUM(answered_calls)
+        FROM {STATS_SCHEMA}.cdr_rollup_dst_daily
+        WHERE day >= :rollup_start AND day <= :end_date
+        GROUP BY dst
+    """), {"rollup_start": rollup_start.date(), "end_date": end_date}).fetchall()
+
+    raw_rows = db.execute(text("""
+        SELECT
+            dst,
+            COUNT(*) as total_calls,
+            SUM(CASE WHEN disposition = 'ANSWERED' THEN 1 ELSE 0 END) as answered_calls
+        FROM asteriskcdrdb.cdr
+        WHERE calldate >= :start_date AND calldate <= :end_date
+            AND (calldate < :rollup_start OR id > :last_id)
+        GROUP BY dst
+    """), {
+        "start_date": start_date,
+        "end_date": end_date,
+        "rollup_start": rollup_start,
+        "last_id": last_id
+    }).fetchall()
+
+    for row in list(rollup_rows) + list(raw_rows):
+        entry = counts[row[0] or ""]
+        entry[0] += int(row[1] or 0)
+        entry[1] += int(row[2] or 0)
+
+    return counts
@@ -0,0 +1,138 @@
+# services/ivr_stats.py
+"""
+Opciones de IVR con sus destinos ya interpretados y el número real de
+llamadas por opción, para /api/ivrs.
+
+- Las opciones salen del catálogo "ivr_entries" (una sola lectura de la tabla,
+  recargada solo cuando cambia su checksum). El resultado agrupado por IVR y con
+  los destinos parseados se guarda junto con la firma del catálogo y se
+  reconstruye únicamente cuando esa firma cambia.
+- Las llamadas por opción salen de una sola consulta agrupada sobre cdr para
+  todos los IVRs. El CDR no guarda la tecla marcada: registra dónde terminó la
+  llamada (p. ej. dcontext='ext-queues', dst='400' si la opción lleva a una
+  cola). Por eso se toma la última fila de cada llamada y se atribuye a la
+  opción cuyo destino es ese contexto/extensión, entre las llamadas que
+  entraron por un DID cuya ruta va a ese IVR. Las que cuelgan dentro del IVR
+  conservan dcontext='ivr-<id>' con dst 't' o 'i' (timeout / opción inválida)
+  y cuentan para esas opciones si existen. Si dos opciones llevan al mismo
+  destino, el CDR no distingue cuál se marcó y las dos muestran las mismas
+  llamadas. El resultado se guarda IVR_STATS_TTL segundos.
+
+El costo de la página ya no depende del número de IVRs.
+"""
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from services.catalogs import catalogs
+from services.response_cache import response_cache
+from utils.destinations import ivr_destination_target, parse_ivr_destination, route_ivr_id
+
+IVR_STATS_TTL = float(os.getenv("IVR_STATS_TTL", "300"))
+IVR_STATS_DAYS = 30
+
+_lock = threading.Lock()
+_parsed_version: Optional[Tuple[int, int]] = None
+_parsed_options: Dict[int, List[Dict[str, Any]]] = {}
+
+
+def ivr_options(db: Session) -> Dict[int, List[Dict[str, Any]]]:
+    """{ivr_id: [{option, dest_type, dest_label}, ...]} ordenado por selección (no modificar)"""
+    global _parsed_version, _parsed_options
+    entries, version = catalogs.versioned(db, "ivr_entries")
+
+    with _lock:
+        if version == _parsed_version:
+            return _parsed_options
+
+    options: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    for key, dest in entries.items():
+        ivr_id, selection = key.split('|', 1)
+        dest_type, dest_label = parse_ivr_destination(dest)
+        options[int(ivr_id)].append({
+            "option": selection,
+            "dest_type": dest_type,
+            "dest_label": dest_label
+        })
+    for ivr_entries in options.values():
+        ivr_entries.sort(key=lambda entry: entry["option"])
+
+    with _lock:
+        _parsed_version, _parsed_options = version, dict(options)
+        return _parsed_options
+
+
+def _option_targets(entries: Dict[str, str]) -> Dict[int, Dict[Tuple[str, str], List[str]]]:
+    """{ivr_id: {(contexto, extensión): [selecciones]}} a partir del catálogo ivr_entries"""
+    targets: Dict[int, Dict[Tuple[str, str], List[str]]] = defaultdict(lambda: defaultdict(list))
+    for key, dest in entries.items():
+        ivr_id, selection = key.split('|', 1)
+        target = ivr_destination_target(dest)
+        if target is not None:
+            targets[int(ivr_id)][target].append(selection)
+    return targets
+
+
+def _load_option_counts(db: Session, entries: Dict[str, str]) -> Dict[int, Dict[str, int]]:
+    # DID -> IVR; la ruta sin CID (cidnum vacío) se lee al final y manda sobre las
+    # específicas por CID
+    ivr_by_did: Dict[str, int] = {}
+    routes = db.execute(text("""
+        SELECT extension, destination
+        FROM asterisk.incoming
+        ORDER BY cidnum DESC
+    """)).fetchall()
+    for did, destination in routes:
+        ivr_id = route_ivr_id(destination)
+        if ivr_id is not None:
+            ivr_by_did[did] = ivr_id
+        else:
+            ivr_by_did.pop(did, None)
+
+    # Última fila de cada llamada que entró por un DID de IVR o que colgó dentro de uno
+    rows = db.execute(text("""
+        SELECT c.did, c.dcontext, c.dst, COUNT(*) as calls
+        FROM asteriskcdrdb.cdr c
+        JOIN (
+            SELECT MAX(id) AS id
+            FROM asteriskcdrdb.cdr
+            WHERE calldate >= :start_date
+              AND (dcontext LIKE 'ivr-%' OR did IN (
+                  SELECT extension FROM asterisk.incoming
+                  WHERE destination LIKE 'ivr-%' OR destination LIKE 'app-ivr/%'
+              ))
+            GROUP BY uniqueid
+        ) last_row ON last_row.id = c.id
+        GROUP BY c.did, c.dcontext, c.dst
+    """), {"start_date": datetime.now() - timedelta(days=IVR_STATS_DAYS)}).fetchall()
+
+    targets = _option_targets(entries)
+    counts: Dict[int, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for did, dcontext, dst, calls in rows:
+        calls = int(calls or 0)
+        if dcontext and dcontext.startswith("ivr-"):
+            # Colgó dentro del IVR: dst es 't', 'i' o 's' (antes de marcar)
+            ivr_id = dcontext[4:]
+            if ivr_id.isdigit() and dst is not None:
+                counts[int(ivr_id)][dst] += calls
+            continue
+        ivr_id = ivr_by_did.get(did)
+        if ivr_id is None:
+            continue
+        for selection in targets.get(ivr_id, {}).get((dcontext, dst), ()):
+            counts[ivr_id][selection] += calls
+    return {ivr_id: dict(by_option) for ivr_id, by_option in counts.items()}
+
+
+def ivr_option_counts(db: Session) -> Dict[int, Dict[str, int]]:
+    """{ivr_id: {selección: llamadas de los últimos 30 días}}, compartido entre peticiones"""
+    entries, version = catalogs.versioned(db, "ivr_entries")
+    return response_cache.get_or_load(
+        "ivr_option_counts", ("ivr_option_counts", version), IVR_STATS_TTL,
+        lambda: _load_option_counts(db, entries)
+    )
@@ -0,0 +1,385 @@
+# services/queue_facts.py
+"""
+Tabla de hechos beyondpbx.queue_calls: una fila por llamada (callid) y cola.
+
+Un proceso incremental lee asteriskcdrdb.queuelog por id (marca de agua
+"queue_calls") y aplica los eventos de cada llamada sobre su fila:
+
+    ENTERQUEUE      enter_time, caller_id, position
+    CONNECT         connect_time, agent, wait_seconds (data1), ring_seconds (data3)
+    COMPLETEAGENT / COMPLETECALLER   end_time, talk_seconds (data2)
+    TRANSFER        end_time, transferred, transfer_to (data1), talk_seconds (data4)
+    ABANDON / EXITWITHTIMEOUT / EXITWITHKEY / EXITEMPTY   end_time, outcome, wait_seconds
+
+Los tiempos quedan como enteros, así que los endpoints de colas hacen
+agregados simples por índice (enter_time, queuename) en lugar de
+COUNT(DISTINCT CASE ...) y REGEXP/CAST sobre el flujo de eventos.
+
+Mientras el proceso no alcanza el final de queuelog (p. ej. la primera carga
+histórica) queue_facts_ready() es False y los endpoints siguen usando queuelog.
+
+Lectura (queue_call_totals): a lo ya materializado se suman los eventos de
+queuelog posteriores a la marca de agua, aplicados en memoria con la misma
+lógica que el upsert, así las cifras de "hoy" no van atrasadas un intervalo.
+Si el proceso se atasca (el evento pendiente más antiguo supera
+QUEUE_CALLS_MAX_LAG segundos o hay más de QUEUE_CALLS_MAX_PENDING pendientes)
+devuelve None, los endpoints vuelven a queuelog y el retraso queda en el log
+y en /api/system/queue-calls.
+"""
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import QueueCallFact
+from services.background import PeriodicTask, register_task
+from services.watermarks import STATS_SCHEMA, ensure_tables, get_watermark, lock_watermark, set_watermark
+
+QUEUE_CALLS_ENABLED = os.getenv("QUEUE_CALLS_ENABLED", "true").lower() == "true"
+QUEUE_CALLS_INTERVAL = int(os.getenv("QUEUE_CALLS_INTERVAL", "10"))
+QUEUE_CALLS_BATCH_SIZE = int(os.getenv("QUEUE_CALLS_BATCH_SIZE", "20000"))
+QUEUE_CALLS_MAX_BATCHES = int(os.getenv("QUEUE_CALLS_MAX_BATCHES", "50"))
+QUEUE_CALLS_MAX_LAG = float(os.getenv("QUEUE_CALLS_MAX_LAG", "120"))
+QUEUE_CALLS_MAX_PENDING = int(os.getenv("QUEUE_CALLS_MAX_PENDING", "5000"))
+
+WATERMARK_NAME = "queue_calls"
+
+# Resultado de la llamada según el evento de salida
+EXIT_OUTCOMES = {
+    "ABANDON": "abandoned",
+    "EXITWITHTIMEOUT": "timeout",
+    "EXITWITHKEY": "exitkey",
+    "EXITEMPTY": "exitempty",
+}
+ANSWER_EVENTS = {"CONNECT", "COMPLETEAGENT", "COMPLETECALLER", "TRANSFER"}
+FACT_EVENTS = ["ENTERQUEUE"] + sorted(ANSWER_EVENTS) + sorted(EXIT_OUTCOMES)
+_FACT_EVENTS_SQL = ", ".join(f"'{event}'" for event in FACT_EVENTS)
+
+# Columnas que un evento posterior sobrescribe solo si trae valor
+_COALESCE_COLUMNS = (
+    "connect_time", "end_time", "agent", "outcome", "caller_id", "position",
+    "wait_seconds", "talk_seconds", "ring_seconds", "transfer_to"
+)
+_COLUMNS = ("callid", "queuename", "entered", "enter_time", "transferred", "last_event_id") + _COALESCE_COLUMNS
+
+_available = False
+_caught_up = False
+
+
+def queue_facts_ready() -> bool:
+    """True cuando la tabla existe y el proceso ya alcanzó el final de queuelog"""
+    return _available and _caught_up
+
+
+def init_queue_facts():
+    """Crea la tabla y registra el proceso incremental (se llama en el startup)"""
+    global _available
+    if not QUEUE_CALLS_ENABLED:
+        return
+    try:
+        ensure_tables([QueueCallFact])
+    except Exception as e:
+        print(f"Tabla queue_calls deshabilitada, no se pudo crear: {str(e)}")
+        return
+    _available = True
+    register_task(PeriodicTask("queue-calls", QUEUE_CALLS_INTERVAL, run_queue_facts_job))
+
+
+def run_queue_facts_job():
+    db = SessionLocal()
+    try:
+        processed = refresh_queue_facts(db)
+        if processed:
+            print(f"queue_calls: {processed} eventos nuevos aplicados")
+    finally:
+        db.close()
+
+
+def _seconds(value: Optional[str]) -> Optional[int]:
+    return int(value) if value and value.isdigit() else None
+
+
+def apply_event(calls: Dict[Tuple[str, str], Dict[str, Any]], row: Any) -> None:
+    """Aplica un evento de queuelog sobre la fila de su llamada (misma lógica que el upsert)"""
+    key = (row.callid, row.queuename)
+    call = calls.get(key)
+    if call is None:
+        call = calls[key] = dict.fromkeys(_COLUMNS)
+        call.update(callid=row.callid, queuename=row.queuename, entered=0,
+                    enter_time=row.time, transferred=0)
+
+    event = row.event
+    values: Dict[str, Any] = {}
+    if event == "ENTERQUEUE":
+        call["entered"] = 1
+        call["enter_time"] = row.time
+        values = {"caller_id": row.data2 or None, "position": _seconds(row.data3)}
+    elif event == "CONNECT":
+        values = {"connect_time": row.time, "agent": row.agent, "outcome": "answered",
+                  "wait_seconds": _seconds(row.data1), "ring_seconds": _seconds(row.data3)}
+    elif event in ("COMPLETEAGENT", "COMPLETECALLER"):
+        values = {"end_time": row.time, "agent": row.agent, "outcome": "answered",
+                  "wait_seconds": _seconds(row.data1), "talk_seconds": _seconds(row.data2)}
+    elif event == "TRANSFER":
+        call["transferred"] = 1
+        values = {"end_time": row.time, "agent": row.agent, "outcome": "answered",
+                  "transfer_to": row.data1 or None, "wait_seconds": _seconds(row.data3),
+                  "talk_seconds": _seconds(row.data4)}
+    elif event in EXIT_OUTCOMES:
+        # EXITWITHKEY: key|position|origposition|waittime; el resto: position|origposition|waittime
+        wait = row.data4 if event == "EXITWITHKEY" else row.data3
+        values = {"end_time": row.time, "outcome": EXIT_OUTCOMES[event], "wait_seconds": _seconds(wait)}
+
+    for column, value in values.items():
+        if value is not None:
+            call[column] = value
+    call["last_event_id"] = row.id
+
+
+_UPSERT_SQL = f"""
+    INSERT INTO {STATS_SCHEMA}.queue_calls ({", ".join(_COLUMNS)})
+    VALUES ({", ".join(":" + column for column in _COLUMNS)})
+    ON DUPLICATE KEY UPDATE
+        enter_time = IF(VALUES(entered) = 1, VALUES(enter_time), enter_time),
+        entered = GREATEST(entered, VALUES(entered)),
+        transferred = GREATEST(transferred, VALUES(transferred)),
+        last_event_id = VALUES(last_event_id),
+        {", ".join(f"{column} = COALESCE(VALUES({column}), {column})" for column in _COALESCE_COLUMNS)}
+"""
+
+
+def refresh_queue_facts(db: Session, batch_size: int = QUEUE_CALLS_BATCH_SIZE,
+                        max_batches: int = QUEUE_CALLS_MAX_BATCHES) -> int:
+    """Aplica lotes de queuelog por id, cada lote en la misma transacción que la marca de agua"""
+    global _caught_up
+    processed = 0
+    for _ in range(max_batches):
+        try:
+            last_id, _ = lock_watermark(db, WATERMARK_NAME)
+            rows = db.execute(text(f"""
+                SELECT id, time, callid, queuename, agent, event, data1, data2, data3, data4
+                FROM asteriskcdrdb.queuelog
+                WHERE id > :last_id AND event IN ({_FACT_EVENTS_SQL})
+                ORDER BY id
+                LIMIT :limit
+            """), {"last_id": last_id, "limit": batch_size}).fetchall()
+
+            if not rows:
+                db.rollback()
+                _caught_up = True
+                break
+
+            calls: Dict[Tuple[str, str], Dict[str, Any]] = {}
+            for row in rows:
+                if row.callid and row.queuename and row.queuename != 'NONE' and row.time is not None:
+                    apply_event(calls, row)
+
+            if calls:
+                db.execute(text(_UPSERT_SQL), list(calls.values()))
+
+            set_watermark(db, WATERMARK_NAME, rows[-1].id, rows[-1].time)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        processed += len(rows)
+        if len(rows) < batch_size:
+            _caught_up = True
+            break
+
+    return processed
+
+
+# ============================================
+# LECTURA
+# ============================================
+
+_pending_stats: Dict[str, Any] = {"pending_events": 0, "lag_seconds": 0.0, "stale": False, "checked_at": None}
+
+
+def queue_facts_stats() -> Dict[str, Any]:
+    """Eventos de queuelog sin aplicar y su antigüedad, vistos en la última lectura"""
+    return {"ready": queue_facts_ready(), "max_lag_seconds": QUEUE_CALLS_MAX_LAG, **_pending_stats}
+
+
+def _pending_calls(db: Session) -> Optional[Dict[Tuple[str, str], Dict[str, Any]]]:
+    """
+    Filas de queue_calls con los eventos posteriores a la marca de agua ya aplicados,
+    o None si el proceso está atrasado.
+    """
+    last_id, _ = get_watermark(db, WATERMARK_NAME)
+    rows = db.execute(text(f"""
+        SELECT id, time, callid, queuename, agent, event, data1, data2, data3, data4
+        FROM asteriskcdrdb.queuelog
+        WHERE id > :last_id AND event IN ({_FACT_EVENTS_SQL})
+        ORDER BY id
+        LIMIT :limit
+    """), {"last_id": last_id, "limit": QUEUE_CALLS_MAX_PENDING + 1}).fetchall()
+
+    lag = (datetime.now() - rows[0].time).total_seconds() if rows and rows[0].time else 0.0
+    stale = len(rows) > QUEUE_CALLS_MAX_PENDING or lag > QUEUE_CALLS_MAX_LAG
+    if stale and not _pending_stats["stale"]:
+        print(f"queue_calls atrasada ({len(rows)} eventos pendientes, {lag:.0f}s): se usa queuelog")
+    elif not stale and _pending_stats["stale"]:
+        print("queue_calls al día de nuevo")
+    _pending_stats.update(pending_events=len(rows), lag_seconds=round(max(lag, 0.0), 1),
+                          stale=stale, checked_at=time.time())
+    if stale:
+        return None
+
+    rows = [row for row in rows
+            if row.callid and row.queuename and row.queuename != 'NONE' and row.time is not None]
+    calls: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    if not rows:
+        return calls
+
+    existing = db.execute(
+        text(f"SELECT {', '.join(_COLUMNS)} FROM {STATS_SCHEMA}.queue_calls WHERE callid IN :callids")
+        .bindparams(bindparam("callids", expanding=True)),
+        {"callids": sorted({row.callid for row in rows})}
+    ).fetchall()
+    for row in existing:
+        calls[(row.callid, row.queuename)] = dict(row._mapping)
+    for row in rows:
+        apply_event(calls, row)
+    return calls
+
+
+class QueueCallTotals:
+    """
+    Agregados de queue_calls de una cola (o de todas): llamadas distintas por
+    resultado y sumas de espera/conversación. Las llamadas pendientes y las de
+    la tabla son conjuntos de callid disjuntos, así que los conteos se suman.
+    """
+    __slots__ = ("entered", "answered", "abandoned", "timeout", "exitkey", "within_sla",
+                 "wait_sum", "wait_count", "wait_max", "talk_sum", "talk_count", "_pending")
+
+    def __init__(self):
+        self.entered = self.answered = self.abandoned = self.timeout = self.exitkey = self.within_sla = 0
+        self.wait_sum = self.wait_count = self.talk_sum = self.talk_count = 0
+        self.wait_max: Optional[int] = None
+        self._pending: Dict[str, Set[str]] = {}
+
+    @property
+    def avg_wait(self) -> Optional[float]:
+        return self.wait_sum / self.wait_count if self.wait_count else None
+
+    @property
+    def avg_talk(self) -> Optional[float]:
+        """Conversación media de las llamadas completadas (sin las transferidas)"""
+        return self.talk_sum / self.talk_count if self.talk_count else None
+
+    def _max_wait(self, wait: Optional[int]):
+        if wait is not None and (self.wait_max is None or wait > self.wait_max):
+            self.wait_max = wait
+
+    def add_row(self, row: Any):
+        for column in ("entered", "answered", "abandoned", "timeout", "exitkey", "within_sla",
+                       "wait_sum", "wait_count", "talk_sum", "talk_count"):
+            setattr(self, column, getattr(self, column) + int(getattr(row, column) or 0))
+        self._max_wait(row.wait_max)
+
+    def add_call(self, call: Dict[str, Any], sla_threshold: Optional[int]):
+        callid = call["callid"]
+        outcome = call["outcome"]
+        counted = []
+        if call["entered"]:
+            counted.append("entered")
+        if outcome == "answered":
+            counted.append("answered")
+        elif outcome in ("abandoned", "timeout", "exitkey"):
+            counted.append(outcome)
+        wait = call["wait_seconds"] if call["connect_time"] is not None else None
+        if wait is not None and sla_threshold is not None and wait <= sla_threshold:
+            counted.append("within_sla")
+        # Una llamada que pasó por varias colas cuenta una vez en el total
+        for column in counted:
+            seen = self._pending.setdefault(column, set())
+            if callid not in seen:
+                seen.add(callid)
+                setattr(self, column, getattr(self, column) + 1)
+
+        if wait is not None:
+            self.wait_sum += wait
+            self.wait_count += 1
+            self._max_wait(wait)
+        if not call["transferred"] and call["talk_seconds"] is not None:
+            self.talk_sum += call["talk_seconds"]
+            self.talk_count += 1
+
+
+def _totals_sql(by_queue: bool, sla: bool) -> str:
+    # Por cola cada fila ya es una llamada distinta; en el total se cuentan callid distintos
+    def count(condition: str) -> str:
+        if by_queue:
+            return f"COUNT(CASE WHEN {condition} THEN 1 END)"
+        return f"COUNT(DISTINCT CASE WHEN {condition} THEN callid END)"
+
+    within_sla = count("connect_time IS NOT NULL AND wait_seconds <= :sla_threshold") if sla else "0"
+    return f"""
+        SELECT
+            {"queuename" if by_queue else "NULL"} as queuename,
+            {count("entered = 1")} as entered,
+            {count("outcome = 'answered'")} as answered,
+            {count("outcome = 'abandoned'")} as abandoned,
+            {count("outcome = 'timeout'")} as timeout,
+            {count("outcome = 'exitkey'")} as exitkey,
+            {within_sla} as within_sla,
+            SUM(CASE WHEN connect_time IS NOT NULL THEN wait_seconds END) as wait_sum,
+            COUNT(CASE WHEN connect_time IS NOT NULL THEN wait_seconds END) as wait_count,
+            MAX(CASE WHEN connect_time IS NOT NULL THEN wait_seconds END) as wait_max,
+            SUM(CASE WHEN transferred = 0 THEN talk_seconds END) as talk_sum,
+            COUNT(CASE WHEN transferred = 0 THEN talk_seconds END) as talk_count
+        FROM {STATS_SCHEMA}.queue_calls
+        WHERE enter_time >= :start_date AND callid NOT IN :pending
+        {"GROUP BY queuename" if by_queue else ""}
+    """
+
+
+def queue_call_totals(db: Session, start_date: datetime, sla_threshold: Optional[int] = None,
+                      overall: bool = False) -> Optional[Tuple[Dict[str, QueueCallTotals], QueueCallTotals]]:
+    """
+    ({cola: totales}, total) de las llamadas que entraron desde start_date,
+    incluidos los eventos de queuelog que el proceso todavía no aplicó.
+    El total (con callid distintos entre colas) solo se calcula con overall=True.
+    Retorna None si queue_calls no está disponible o va atrasada: usar queuelog.
+    """
+    if not queue_facts_ready():
+        return None
+    pending = _pending_calls(db)
+    if pending is None:
+        return None
+
+    params = {
+        "start_date": start_date,
+        "sla_threshold": sla_threshold,
+        # La lista nunca va vacía: NOT IN () no es SQL válido en MySQL
+        "pending": sorted({callid for callid, _ in pending}) or [""]
+    }
+    calls = [call for call in pending.values() if call["enter_time"] >= start_date]
+
+    by_queue: Dict[str, QueueCallTotals] = {}
+    rows = db.execute(
+        text(_totals_sql(True, sla_threshold is not None)).bindparams(bindparam("pending", expanding=True)),
+        params
+    ).fetchall()
+    for row in rows:
+        by_queue.setdefault(row.queuename, QueueCallTotals()).add_row(row)
+    for call in calls:
+        by_queue.setdefault(call["queuename"], QueueCallTotals()).add_call(call, sla_threshold)
+
+    total = QueueCallTotals()
+    if overall:
+        row = db.execute(
+            text(_totals_sql(False, sla_threshold is not None)).bindparams(bindparam("pending", expanding=True)),
+            params
+        ).fetchone()
+        total.add_row(row)
+        for call in calls:
+            total.add_call(call, sla_threshold)
+    return by_queue, total
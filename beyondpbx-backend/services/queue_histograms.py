@@ -0,0 +1,242 @@
+# services/queue_histograms.py
+"""
+Histogramas de tiempos de espera por cola y por hora, alimentados de queuelog.
+
+Por cada hora y cola se guardan:
+- enter:   llamadas que entraron (ENTERQUEUE), en wait_seconds = 0;
+- connect: espera antes de contestar (data1 de CONNECT);
+- abandon: espera antes de colgar (data3 de ABANDON);
+con buckets de 1 segundo hasta QUEUE_HISTOGRAM_MAX_SECONDS (el último bucket
+acumula todo lo que lo supera). wait_sum guarda la suma exacta de segundos para
+los promedios.
+
+Con el histograma de un período, el SLA a cualquier umbral es una suma de
+prefijo: mover el umbral ya no vuelve a recorrer queuelog con REGEXP y CAST.
+La lectura combina, igual que los rollups de cdr, las horas completas del
+histograma con las filas crudas del borde inicial y de la cola no procesada.
+"""
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import QueueWaitHistogram
+from services.background import PeriodicTask, register_task
+from services.watermarks import STATS_SCHEMA, ensure_tables, get_watermark, lock_watermark, set_watermark
+
+HISTOGRAM_ENABLED = os.getenv("QUEUE_HISTOGRAM_ENABLED", "true").lower() == "true"
+HISTOGRAM_INTERVAL = int(os.getenv("QUEUE_HISTOGRAM_INTERVAL", "60"))
+HISTOGRAM_BATCH_SIZE = int(os.getenv("QUEUE_HISTOGRAM_BATCH_SIZE", "20000"))
+HISTOGRAM_MAX_BATCHES = int(os.getenv("QUEUE_HISTOGRAM_MAX_BATCHES", "50"))
+HISTOGRAM_MAX_SECONDS = int(os.getenv("QUEUE_HISTOGRAM_MAX_SECONDS", "600"))
+HISTOGRAM_CACHE_TTL = float(os.getenv("QUEUE_HISTOGRAM_CACHE_TTL", "30"))
+
+WATERMARK_NAME = "queue_wait_histogram"
+
+# Evento de queuelog -> tipo de histograma
+EVENT_KINDS = {"ENTERQUEUE": "enter", "CONNECT": "connect", "ABANDON": "abandon"}
+
+_available = False
+
+
+def histograms_available() -> bool:
+    return _available
+
+
+def init_queue_histograms():
+    """Crea la tabla y registra el proceso incremental (se llama en el startup)"""
+    global _available
+    if not HISTOGRAM_ENABLED:
+        return
+    try:
+        ensure_tables([QueueWaitHistogram])
+    except Exception as e:
+        print(f"Histogramas de espera deshabilitados, no se pudo crear la tabla: {str(e)}")
+        return
+    _available = True
+    register_task(PeriodicTask("queue-wait-histogram", HISTOGRAM_INTERVAL, run_queue_histogram_job))
+
+
+def run_queue_histogram_job():
+    db = SessionLocal()
+    try:
+        processed = refresh_queue_histograms(db)
+        if processed:
+            print(f"Histogramas de espera: {processed} eventos nuevos agregados")
+    finally:
+        db.close()
+
+
+def event_wait(event: str, data1: Optional[str], data3: Optional[str]) -> Optional[int]:
+    """Segundos de espera del evento; None si el dato no es un entero (igual que el REGEXP original)"""
+    if event == "ENTERQUEUE":
+        return 0
+    raw = data1 if event == "CONNECT" else data3
+    if raw is None or not raw.isdigit():
+        return None
+    return int(raw)
+
+
+class WaitHistogram:
+    """Histogramas de una cola para un período"""
+    __slots__ = ("entered", "connect", "abandon", "connect_sum", "abandon_sum")
+
+    def __init__(self, max_seconds: int = HISTOGRAM_MAX_SECONDS):
+        self.entered = 0
+        self.connect = [0] * (max_seconds + 1)
+        self.abandon = [0] * (max_seconds + 1)
+        self.connect_sum = 0
+        self.abandon_sum = 0
+
+    def add(self, kind: str, wait_seconds: int, calls: int = 1, wait_sum: Optional[int] = None):
+        if kind == "enter":
+            self.entered += calls
+            return
+        if wait_sum is None:
+            wait_sum = wait_seconds * calls
+        index = min(wait_seconds, len(self.connect) - 1)
+        if kind == "connect":
+            self.connect[index] += calls
+            self.connect_sum += wait_sum
+        else:
+            self.abandon[index] += calls
+            self.abandon_sum += wait_sum
+
+    def merge(self, other: "WaitHistogram"):
+        self.entered += other.entered
+        self.connect = [a + b for a, b in zip(self.connect, other.connect)]
+        self.abandon = [a + b for a, b in zip(self.abandon, other.abandon)]
+        self.connect_sum += other.connect_sum
+        self.abandon_sum += other.abandon_sum
+
+    def nbytes(self) -> int:
+        """Memoria aproximada, para el límite de response_cache (no se serializa a JSON)"""
+        return sys.getsizeof(self) + sys.getsizeof(self.connect) + sys.getsizeof(self.abandon)
+
+    @property
+    def answered(self) -> int:
+        return sum(self.connect)
+
+    @property
+    def abandoned(self) -> int:
+        return sum(self.abandon)
+
+    def answered_within(self, threshold: int) -> int:
+        """Llamadas contestadas con espera <= threshold (threshold < tope del histograma)"""
+        return sum(self.connect[:threshold + 1])
+
+    def curve(self, kind: str, max_seconds: int, step: int) -> List[int]:
+        """Acumulado de llamadas con espera <= t para t = 0, step, 2*step ... max_seconds"""
+        prefix = list(accumulate(self.connect if kind == "connect" else self.abandon))
+        return [prefix[t] for t in range(0, max_seconds + 1, step)]
+
+
+def refresh_queue_histograms(db: Session, batch_size: int = HISTOGRAM_BATCH_SIZE,
+                             max_batches: int = HISTOGRAM_MAX_BATCHES) -> int:
+    """Agrega lotes de queuelog por id, cada lote en la misma transacción que la marca de agua"""
+    processed = 0
+    for _ in range(max_batches):
+        try:
+            last_id, _ = lock_watermark(db, WATERMARK_NAME)
+            rows = db.execute(text("""
+                SELECT id, time, queuename, event, data1, data3
+                FROM asteriskcdrdb.queuelog
+                WHERE id > :last_id
+                    AND event IN ('ENTERQUEUE', 'CONNECT', 'ABANDON')
+                ORDER BY id
+                LIMIT :limit
+            """), {"last_id": last_id, "limit": batch_size}).fetchall()
+
+            if not rows:
+                db.rollback()
+                break
+
+            cells: Dict[Tuple[datetime, str, str, int], List[int]] = defaultdict(lambda: [0, 0])
+            for row in rows:
+                if row[1] is None or not row[2] or row[2] == 'NONE':
+                    continue
+                wait = event_wait(row[3], row[4], row[5])
+                if wait is None:
+                    continue
+                bucket = row[1].replace(minute=0, second=0, microsecond=0)
+                cell = cells[(bucket, row[2], EVENT_KINDS[row[3]], min(wait, HISTOGRAM_MAX_SECONDS))]
+                cell[0] += 1
+                cell[1] += wait
+
+            if cells:
+                db.execute(text(f"""
+                    INSERT INTO {STATS_SCHEMA}.queue_wait_histogram
+                        (bucket, queuename, kind, wait_seconds, calls, wait_sum)
+                    VALUES (:bucket, :queuename, :kind, :wait_seconds, :calls, :wait_sum)
+                    ON DUPLICATE KEY UPDATE
+                        calls = calls + VALUES(calls),
+                        wait_sum = wait_sum + VALUES(wait_sum)
+                """), [
+                    {"bucket": key[0], "queuename": key[1], "kind": key[2], "wait_seconds": key[3],
+                     "calls": cell[0], "wait_sum": cell[1]}
+                    for key, cell in cells.items()
+                ])
+
+            set_watermark(db, WATERMARK_NAME, rows[-1][0], rows[-1][1])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        processed += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    return processed
+
+
+def histograms_nbytes(histograms: Dict[str, WaitHistogram]) -> int:
+    """Tamaño de {cola: WaitHistogram} para response_cache.get_or_load(size=...)"""
+    return sys.getsizeof(histograms) + sum(hist.nbytes() for hist in histograms.values())
+
+
+def collect_wait_histograms(db: Session, start_date: datetime,
+                            end_date: Optional[datetime] = None) -> Dict[str, WaitHistogram]:
+    """{cola: WaitHistogram} para los eventos entre start_date y end_date (por defecto ahora)"""
+    end_date = end_date or datetime.now()
+    last_id, _ = get_watermark(db, WATERMARK_NAME)
+    floored = start_date.replace(minute=0, second=0, microsecond=0)
+    rollup_start = floored if floored == start_date else floored + timedelta(hours=1)
+
+    histograms: Dict[str, WaitHistogram] = defaultdict(WaitHistogram)
+
+    rows = db.execute(text(f"""
+        SELECT queuename, kind, wait_seconds, SUM(calls), SUM(wait_sum)
+        FROM {STATS_SCHEMA}.queue_wait_histogram
+        WHERE bucket >= :rollup_start AND bucket <= :end_date
+        GROUP BY queuename, kind, wait_seconds
+    """), {"rollup_start": rollup_start, "end_date": end_date}).fetchall()
+    for row in rows:
+        histograms[row[0]].add(row[1], row[2], int(row[3] or 0), int(row[4] or 0))
+
+    # Borde inicial (hora parcial) y eventos que el proceso todavía no agregó
+    raw_rows = db.execute(text("""
+        SELECT queuename, event, data1, data3
+        FROM asteriskcdrdb.queuelog
+        WHERE time >= :start_date AND time <= :end_date
+            AND queuename != 'NONE'
+            AND event IN ('ENTERQUEUE', 'CONNECT', 'ABANDON')
+            AND (time < :rollup_start OR id > :last_id)
+    """), {
+        "start_date": start_date,
+        "end_date": end_date,
+        "rollup_start": rollup_start,
+        "last_id": last_id
+    }).fetchall()
+    for row in raw_rows:
+        wait = event_wait(row[1], row[2], row[3])
+        if wait is not None and row[0]:
+            histograms[row[0]].add(EVENT_KINDS[row[1]], wait)
+
+    return histograms
@@ -0,0 +1,249 @@
+# services/queue_sketches.py
+"""
+Percentiles (p50/p90/p99...) de espera, conversación y timbrado por cola.
+
+Por cada hora y cola se guarda un DDSketch (utils.ddsketch) de cada métrica,
+alimentado de queuelog de forma incremental:
+- wait: data1 de CONNECT (segundos en cola antes de contestar);
+- ring: data3 de CONNECT (segundos timbrando al agente que contestó);
+- talk: data2 de COMPLETEAGENT / COMPLETECALLER (segundos de conversación).
+
+Los sketches se mezclan al leer, así que cualquier período se resuelve con las
+horas guardadas más las filas crudas del borde inicial y de la cola que el
+proceso todavía no agregó, sin calcular percentiles exactos en MySQL.
+"""
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import QueueTimeSketch
+from services.background import PeriodicTask, register_task
+from services.watermarks import STATS_SCHEMA, ensure_tables, get_watermark, lock_watermark, set_watermark
+from utils.ddsketch import DDSketch
+
+SKETCH_ENABLED = os.getenv("QUEUE_SKETCH_ENABLED", "true").lower() == "true"
+SKETCH_INTERVAL = int(os.getenv("QUEUE_SKETCH_INTERVAL", "60"))
+SKETCH_BATCH_SIZE = int(os.getenv("QUEUE_SKETCH_BATCH_SIZE", "20000"))
+SKETCH_MAX_BATCHES = int(os.getenv("QUEUE_SKETCH_MAX_BATCHES", "50"))
+SKETCH_CACHE_TTL = float(os.getenv("QUEUE_SKETCH_CACHE_TTL", "30"))
+
+WATERMARK_NAME = "queue_time_sketch"
+METRICS = ("wait", "talk", "ring")
+
+_available = False
+
+
+def sketches_available() -> bool:
+    return _available
+
+
+def init_queue_sketches():
+    """Crea la tabla y registra el proceso incremental (se llama en el startup)"""
+    global _available
+    if not SKETCH_ENABLED:
+        return
+    try:
+        ensure_tables([QueueTimeSketch])
+    except Exception as e:
+        print(f"Percentiles de colas deshabilitados, no se pudo crear la tabla: {str(e)}")
+        return
+    _available = True
+    register_task(PeriodicTask("queue-time-sketch", SKETCH_INTERVAL, run_queue_sketch_job))
+
+
+def run_queue_sketch_job():
+    db = SessionLocal()
+    try:
+        processed = refresh_queue_sketches(db)
+        if processed:
+            print(f"Percentiles de colas: {processed} eventos nuevos agregados")
+    finally:
+        db.close()
+
+
+def event_samples(event: str, data1: Optional[str], data2: Optional[str],
+                  data3: Optional[str]) -> List[Tuple[str, int]]:
+    """[(métrica, segundos)] del evento; los datos que no son enteros se ignoran"""
+    if event == "CONNECT":
+        samples = []
+        if data1 and data1.isdigit():
+            samples.append(("wait", int(data1)))
+        if data3 and data3.isdigit():
+            samples.append(("ring", int(data3)))
+        return samples
+    if data2 and data2.isdigit():
+        return [("talk", int(data2))]
+    return []
+
+
+class TimeSummary:
+    """Sketch de una métrica más su suma y máximo exactos"""
+    __slots__ = ("sketch", "total", "max_value")
+
+    def __init__(self, sketch: Optional[DDSketch] = None, total: int = 0, max_value: int = 0):
+        self.sketch = sketch or DDSketch()
+        self.total = total
+        self.max_value = max_value
+
+    def add(self, seconds: int):
+        self.sketch.add(seconds)
+        self.total += seconds
+        self.max_value = max(self.max_value, seconds)
+
+    def merge(self, other: "TimeSummary"):
+        self.sketch.merge(other.sketch)
+        self.total += other.total
+        self.max_value = max(self.max_value, other.max_value)
+
+    def nbytes(self) -> int:
+        return sys.getsizeof(self) + self.sketch.nbytes()
+
+    @property
+    def samples(self) -> int:
+        return self.sketch.count
+
+    def percentiles(self, quantiles: List[float]) -> Dict[str, Optional[float]]:
+        """{"p50": 12.1, ...}; None si no hay muestras"""
+        result = {}
+        for q in quantiles:
+            value = self.sketch.quantile(q / 100)
+            result[f"p{q:g}"] = round(value, 1) if value is not None else None
+        return result
+
+    def describe(self, quantiles: List[float]) -> Dict[str, Optional[float]]:
+        return {
+            "samples": self.samples,
+            "avg": round(self.total / self.samples, 1) if self.samples else None,
+            "max": self.max_value if self.samples else None,
+            **self.percentiles(quantiles)
+        }
+
+
+_QUEUELOG_EVENTS = "('CONNECT', 'COMPLETEAGENT', 'COMPLETECALLER')"
+
+
+def refresh_queue_sketches(db: Session, batch_size: int = SKETCH_BATCH_SIZE,
+                           max_batches: int = SKETCH_MAX_BATCHES) -> int:
+    """
+    Agrega lotes de queuelog por id. Los sketches no se pueden sumar en SQL, así
+    que las horas tocadas se leen, se mezclan en Python y se reescriben, en la
+    misma transacción que la marca de agua (que serializa a los workers).
+    """
+    processed = 0
+    for _ in range(max_batches):
+        try:
+            last_id, _ = lock_watermark(db, WATERMARK_NAME)
+            rows = db.execute(text(f"""
+                SELECT id, time, queuename, event, data1, data2, data3
+                FROM asteriskcdrdb.queuelog
+                WHERE id > :last_id AND event IN {_QUEUELOG_EVENTS}
+                ORDER BY id
+                LIMIT :limit
+            """), {"last_id": last_id, "limit": batch_size}).fetchall()
+
+            if not rows:
+                db.rollback()
+                break
+
+            cells: Dict[Tuple[datetime, str, str], TimeSummary] = defaultdict(TimeSummary)
+            for row in rows:
+                if row[1] is None or not row[2] or row[2] == 'NONE':
+                    continue
+                bucket = row[1].replace(minute=0, second=0, microsecond=0)
+                for metric, seconds in event_samples(row[3], row[4], row[5], row[6]):
+                    cells[(bucket, row[2], metric)].add(seconds)
+
+            if cells:
+                buckets = [key[0] for key in cells]
+                existing = db.execute(text(f"""
+                    SELECT bucket, queuename, metric, total, max_value, sketch
+                    FROM {STATS_SCHEMA}.queue_time_sketch
+                    WHERE bucket BETWEEN :first AND :last
+                """), {"first": min(buckets), "last": max(buckets)}).fetchall()
+                for row in existing:
+                    cell = cells.get((row[0], row[1], row[2]))
+                    if cell is not None:
+                        cell.merge(TimeSummary(DDSketch.from_json(row[5]), int(row[3] or 0), int(row[4] or 0)))
+
+                db.execute(text(f"""
+                    INSERT INTO {STATS_SCHEMA}.queue_time_sketch
+                        (bucket, queuename, metric, samples, total, max_value, sketch)
+                    VALUES (:bucket, :queuename, :metric, :samples, :total, :max_value, :sketch)
+                    ON DUPLICATE KEY UPDATE
+                        samples = VALUES(samples),
+                        total = VALUES(total),
+                        max_value = VALUES(max_value),
+                        sketch = VALUES(sketch)
+                """), [
+                    {"bucket": key[0], "queuename": key[1], "metric": key[2], "samples": cell.samples,
+                     "total": cell.total, "max_value": cell.max_value, "sketch": cell.sketch.to_json()}
+                    for key, cell in cells.items()
+                ])
+
+            set_watermark(db, WATERMARK_NAME, rows[-1][0], rows[-1][1])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        processed += len(rows)
+        if len(rows) < batch_size:
+            break
+
+    return processed
+
+
+def sketches_nbytes(summaries: Dict[str, Dict[str, TimeSummary]]) -> int:
+    """Tamaño de {cola: {métrica: TimeSummary}} para response_cache.get_or_load(size=...)"""
+    return sys.getsizeof(summaries) + sum(
+        sys.getsizeof(metrics) + sum(summary.nbytes() for summary in metrics.values())
+        for metrics in summaries.values()
+    )
+
+
+def collect_time_sketches(db: Session, start_date: datetime,
+                          end_date: Optional[datetime] = None) -> Dict[str, Dict[str, TimeSummary]]:
+    """{cola: {métrica: TimeSummary}} para los eventos entre start_date y end_date (por defecto ahora)"""
+    end_date = end_date or datetime.now()
+    last_id, _ = get_watermark(db, WATERMARK_NAME)
+    floored = start_date.replace(minute=0, second=0, microsecond=0)
+    rollup_start = floored if floored == start_date else floored + timedelta(hours=1)
+
+    summaries: Dict[str, Dict[str, TimeSummary]] = defaultdict(lambda: defaultdict(TimeSummary))
+
+    rows = db.execute(text(f"""
+        SELECT queuename, metric, total, max_value, sketch
+        FROM {STATS_SCHEMA}.queue_time_sketch
+        WHERE bucket >= :rollup_start AND bucket <= :end_date
+    """), {"rollup_start": rollup_start, "end_date": end_date})
+    for row in rows:
+        summaries[row[0]][row[1]].merge(
+            TimeSummary(DDSketch.from_json(row[4]), int(row[2] or 0), int(row[3] or 0))
+        )
+
+    # Borde inicial (hora parcial) y eventos que el proceso todavía no agregó
+    raw_rows = db.execute(text(f"""
+        SELECT queuename, event, data1, data2, data3
+        FROM asteriskcdrdb.queuelog
+        WHERE time >= :start_date AND time <= :end_date
+            AND queuename != 'NONE'
+            AND event IN {_QUEUELOG_EVENTS}
+            AND (time < :rollup_start OR id > :last_id)
+    """), {
+        "start_date": start_date,
+        "end_date": end_date,
+        "rollup_start": rollup_start,
+        "last_id": last_id
+    })
+    for row in raw_rows:
+        if row[0]:
+            for metric, seconds in event_samples(row[1], row[2], row[3], row[4]):
+                summaries[row[0]][metric].add(seconds)
+
+    return summaries
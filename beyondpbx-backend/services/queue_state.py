@@ -0,0 +1,212 @@
+# services/queue_state.py
+"""
+Estado en memoria de las llamadas en cola, alimentado leyendo queuelog por id.
+
+Un hilo en segundo plano lee asteriskcdrdb.queuelog con `id > último_visto`
+y entrega cada evento a los suscriptores. El principal es QueueCallState,
+una máquina de estados por callid:
+
+    ENTERQUEUE -> (CONNECT) -> COMPLETEAGENT / COMPLETECALLER / TRANSFER
+                            -> ABANDON / EXITWITHTIMEOUT / EXITWITHKEY / EXITEMPTY
+
+Al arrancar se reconstruye el estado con los eventos de las últimas N horas;
+las llamadas que nunca reciben un evento de cierre expiran por antigüedad.
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from services.background import PeriodicTask, register_task
+
+TAIL_ENABLED = os.getenv("QUEUELOG_TAIL_ENABLED", "true").lower() == "true"
+TAIL_INTERVAL = float(os.getenv("QUEUELOG_TAIL_INTERVAL", "2"))
+TAIL_BATCH_SIZE = int(os.getenv("QUEUELOG_TAIL_BATCH_SIZE", "5000"))
+BOOTSTRAP_HOURS = int(os.getenv("QUEUELOG_BOOTSTRAP_HOURS", "4"))
+MAX_CALL_AGE_HOURS = int(os.getenv("QUEUELOG_MAX_CALL_AGE_HOURS", "2"))
+
+END_EVENTS = {
+    'COMPLETEAGENT', 'COMPLETECALLER', 'TRANSFER',
+    'ABANDON', 'EXITWITHTIMEOUT', 'EXITWITHKEY', 'EXITEMPTY'
+}
+
+QUEUELOG_COLUMNS = "id, time, callid, queuename, agent, event, data1, data2, data3, data4, data5"
+
+
+class QueueCall:
+    """Llamada en cola (esperando o conectada con un agente)"""
+    __slots__ = ("callid", "queuename", "enter_time", "agent", "connect_time", "caller_id", "position")
+
+    def __init__(self, callid: str, queuename: str, enter_time: datetime,
+                 caller_id: Optional[str] = None, position: Optional[str] = None):
+        self.callid = callid
+        self.queuename = queuename
+        self.enter_time = enter_time
+        self.agent: Optional[str] = None
+        self.connect_time: Optional[datetime] = None
+        self.caller_id = caller_id
+        self.position = position
+
+    @property
+    def status(self) -> str:
+        return "in_progress" if self.connect_time else "waiting"
+
+
+class QueueCallState:
+    """Máquina de estados por callid a partir de los eventos de queuelog"""
+
+    def __init__(self, max_age: timedelta = timedelta(hours=MAX_CALL_AGE_HOURS)):
+        self.max_age = max_age
+        self._calls: Dict[str, QueueCall] = {}
+        self._lock = threading.Lock()
+
+    def apply(self, rows: List[Any]):
+        with self._lock:
+            for row in rows:
+                event = row.event
+                if event == 'ENTERQUEUE':
+                    if row.queuename and row.queuename != 'NONE':
+                        # ENTERQUEUE: data2 = CallerID, data3 = posición
+                        self._calls[row.callid] = QueueCall(
+                            row.callid, row.queuename, row.time, row.data2, row.data3
+                        )
+                elif event == 'CONNECT':
+                    call = self._calls.get(row.callid)
+                    if call:
+                        call.agent = row.agent
+                        call.connect_time = row.time
+                elif event in END_EVENTS:
+                    self._calls.pop(row.callid, None)
+
+    def expire(self, now: datetime):
+        limit = now - self.max_age
+        with self._lock:
+            for callid in [c for c, call in self._calls.items() if call.enter_time and call.enter_time < limit]:
+                del self._calls[callid]
+
+    def clear(self):
+        with self._lock:
+            self._calls.clear()
+
+    def active_calls(self) -> List[QueueCall]:
+        """Llamadas activas, las más recientes primero"""
+        with self._lock:
+            calls = list(self._calls.values())
+        calls.sort(key=lambda call: call.enter_time or datetime.min, reverse=True)
+        return calls
+
+    def waiting_by_queue(self) -> Dict[str, int]:
+        waiting: Dict[str, int] = {}
+        with self._lock:
+            for call in self._calls.values():
+                if call.connect_time is None:
+                    waiting[call.queuename] = waiting.get(call.queuename, 0) + 1
+        return waiting
+
+
+class QueueLogTail:
+    """Lee queuelog por id incremental y reparte los eventos a los suscriptores"""
+
+    def __init__(self):
+        self.last_id = 0
+        self.ready = False
+        self.last_poll: Optional[datetime] = None
+        self._subscribers: List[Callable[[List[Any]], None]] = []
+        self._expirers: List[Callable[[datetime], None]] = []
+
+    def subscribe(self, on_rows: Callable[[List[Any]], None],
+                  on_expire: Optional[Callable[[datetime], None]] = None):
+        self._subscribers.append(on_rows)
+        if on_expire:
+            self._expirers.append(on_expire)
+
+    def _dispatch(self, rows: List[Any]):
+        for subscriber in self._subscribers:
+            subscriber(rows)
+
+    def bootstrap(self, db: Session, hours: int = BOOTSTRAP_HOURS):
+        """Reconstruye el estado a partir de los eventos de las últimas `hours` horas"""
+        max_id = db.execute(text("SELECT MAX(id) FROM asteriskcdrdb.queuelog")).scalar() or 0
+        since = datetime.now() - timedelta(hours=hours)
+
+        result = db.execute(
+            text(f"""
+                SELECT {QUEUELOG_COLUMNS}
+                FROM asteriskcdrdb.queuelog
+                WHERE time >= :since AND id <= :max_id
+                ORDER BY id
+            """),
+            {"since": since, "max_id": max_id},
+            execution_options={"stream_results": True, "yield_per": TAIL_BATCH_SIZE}
+        )
+        try:
+            for rows in result.partitions():
+                self._dispatch(rows)
+        finally:
+            result.close()
+
+        self.last_id = max_id
+        now = datetime.now()
+        for expire in self._expirers:
+            expire(now)
+        self.last_poll = now
+        self.ready = True
+
+    def poll(self, db: Session) -> int:
+        """Procesa los eventos nuevos (id > último visto); devuelve cuántos leyó"""
+        total = 0
+        while True:
+            rows = db.execute(
+                text(f"""
+                    SELECT {QUEUELOG_COLUMNS}
+                    FROM asteriskcdrdb.queuelog
+                    WHERE id > :last_id
+                    ORDER BY id
+                    LIMIT :limit
+                """),
+                {"last_id": self.last_id, "limit": TAIL_BATCH_SIZE}
+            ).fetchall()
+            if rows:
+                self._dispatch(rows)
+                self.last_id = rows[-1].id
+                total += len(rows)
+            if len(rows) < TAIL_BATCH_SIZE:
+                break
+
+        now = datetime.now()
+        for expire in self._expirers:
+            expire(now)
+        self.last_poll = now
+        return total
+
+    def run_once(self):
+        db = SessionLocal()
+        try:
+            if not self.ready:
+                self.bootstrap(db)
+            else:
+                self.poll(db)
+        finally:
+            db.close()
+
+
+queuelog_tail = QueueLogTail()
+queue_calls = QueueCallState()
+queuelog_tail.subscribe(queue_calls.apply, queue_calls.expire)
+
+
+def queue_state_ready() -> bool:
+    """True cuando el estado ya se reconstruyó y el tail sigue vivo"""
+    if not queuelog_tail.ready or queuelog_tail.last_poll is None:
+        return False
+    return datetime.now() - queuelog_tail.last_poll < timedelta(seconds=max(TAIL_INTERVAL * 10, 30))
+
+
+def init_queue_state():
+    """Registra el tail de queuelog (se llama en el startup)"""
+    if TAIL_ENABLED:
+        register_task(PeriodicTask("queuelog-tail", TAIL_INTERVAL, queuelog_tail.run_once))
@@ -0,0 +1,398 @@
+# services/request_metrics.py
+"""
+Métricas por ruta para /metrics (formato de texto de Prometheus).
+
+Un middleware ASGI mide cada petición y los eventos before/after_cursor_execute
+de los engines (database.instrument_engine) cuentan las consultas que se hacen
+dentro de ella; las filas de los cursores de servidor se cuentan al leerlas.
+Por ruta (la plantilla, p. ej. /api/queues/{queue_id}) y método:
+
+- latencia (histograma) y peticiones por código de respuesta;
+- consultas por petición (histograma), tiempo total en MySQL y filas devueltas;
+- bytes de respuesta;
+- peticiones con más de METRICS_QUERY_THRESHOLD consultas (patrones N+1),
+  que además se registran en el log.
+
+La petición en curso se guarda en un ContextVar: SQLAlchemy lo propaga a
+run_sync y Starlette a los handlers sync del threadpool, y las consultas de
+las tareas en segundo plano quedan fuera porque no tienen petición.
+
+Con varios workers cada proceso escribe su snapshot en METRICS_DIR y /metrics
+suma los snapshots recientes de todos, así el scrape ve el total aunque lo
+atienda un solo worker.
+"""
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.background import PeriodicTask, register_task
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_QUERY_THRESHOLD = int(os.getenv("METRICS_QUERY_THRESHOLD", "20"))
+METRICS_DIR = os.getenv("METRICS_DIR", "")  # Vacío = solo las métricas de este proceso
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+METRICS_STALE_SECONDS = float(os.getenv("METRICS_STALE_SECONDS", "300"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+UNMATCHED_ROUTE = "unmatched"
+_MAX_ROWCOUNT = 2 ** 63  # Por encima, rowcount es un -1 sin signo del driver
+PREFIX = "beyondpbx"
+
+
+class RequestStats:
+    """Consultas de la petición en curso"""
+    __slots__ = ("queries", "db_seconds", "rows")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+
+
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "request_metrics", default=None
+)
+
+
+# ============================================
+# HOOKS DE SQLALCHEMY
+# ============================================
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    started = conn.info.get("metrics_query_start")
+    if not started:
+        return
+    stats.queries += 1
+    stats.db_seconds += time.perf_counter() - started.pop()
+
+
+class _CountingFetch:
+    """Envuelve la estrategia de fetch de un CursorResult y cuenta las filas que entrega"""
+    __slots__ = ("strategy", "stats")
+
+    def __init__(self, strategy, stats: RequestStats):
+        self.strategy = strategy
+        self.stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self.strategy, name)
+
+    def fetchone(self, result, dbapi_cursor, hard_close=False):
+        row = self.strategy.fetchone(result, dbapi_cursor, hard_close)
+        if row is not None:
+            self.stats.rows += 1
+        return row
+
+    def fetchmany(self, result, dbapi_cursor, size=None):
+        rows = self.strategy.fetchmany(result, dbapi_cursor, size)
+        self.stats.rows += len(rows)
+        return rows
+
+    def fetchall(self, result, dbapi_cursor):
+        rows = self.strategy.fetchall(result, dbapi_cursor)
+        self.stats.rows += len(rows)
+        return rows
+
+    def yield_per(self, result, dbapi_cursor, num):
+        # yield_per() sustituye la estrategia del resultado; se vuelve a envolver la nueva
+        self.strategy.yield_per(result, dbapi_cursor, num)
+        result.cursor_strategy = _CountingFetch(result.cursor_strategy, self.stats)
+
+
+def _after_execute(conn, clauseelement, multiparams, params, execution_options, result):
+    stats = _current.get()
+    if stats is None or not getattr(result, "returns_rows", False):
+        return
+    context = result.context
+    # Con cursor de servidor (stream_results / yield_per) el rowcount no es el número de
+    # filas: pymysql deja 2**64 - 1 en un SSCursor. Ahí y cuando el driver no lo da
+    # (-1), las filas se cuentan según se leen.
+    rowcount = -1 if context._is_server_side else context.rowcount
+    if rowcount is not None and 0 <= rowcount < _MAX_ROWCOUNT:
+        stats.rows += rowcount
+    else:
+        result.cursor_strategy = _CountingFetch(result.cursor_strategy, stats)
+
+
+def instrument_engine(engine) -> None:
+    """Registra los hooks en un Engine sync (para uno async, pasar async_engine.sync_engine)"""
+    from sqlalchemy import event
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "after_execute", _after_execute)
+
+
+# ============================================
+# REGISTRO
+# ============================================
+
+class RouteMetrics:
+    """Acumulados de una ruta y método; los histogramas guardan conteos por bucket sin acumular (+Inf al final)"""
+    __slots__ = ("count", "latency", "latency_sum", "queries", "queries_sum",
+                 "db_seconds", "rows", "response_bytes", "flagged", "statuses")
+
+    def __init__(self):
+        self.count = 0
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.queries = [0] * (len(QUERY_BUCKETS) + 1)
+        self.queries_sum = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.response_bytes = 0
+        self.flagged = 0
+        self.statuses: Dict[str, int] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {slot: getattr(self, slot) for slot in self.__slots__}
+        data.update(latency=list(self.latency), queries=list(self.queries), statuses=dict(self.statuses))
+        return data
+
+    def merge(self, data: Dict[str, Any]):
+        self.count += data["count"]
+        self.latency = [a + b for a, b in zip(self.latency, data["latency"])]
+        self.latency_sum += data["latency_sum"]
+        self.queries = [a + b for a, b in zip(self.queries, data["queries"])]
+        self.queries_sum += data["queries_sum"]
+        self.db_seconds += data["db_seconds"]
+        self.rows += data["rows"]
+        self.response_bytes += data["response_bytes"]
+        self.flagged += data["flagged"]
+        for status, count in data["statuses"].items():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+
+
+def _bucket_index(buckets: Tuple[float, ...], value: float) -> int:
+    for index, upper in enumerate(buckets):
+        if value <= upper:
+            return index
+    return len(buckets)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], RouteMetrics] = {}
+
+    def observe(self, method: str, route: str, status: int, seconds: float,
+                stats: RequestStats, response_bytes: int, flagged: bool):
+        latency_index = _bucket_index(LATENCY_BUCKETS, seconds)
+        queries_index = _bucket_index(QUERY_BUCKETS, stats.queries)
+        with self._lock:
+            metrics = self._routes.get((method, route))
+            if metrics is None:
+                metrics = self._routes[(method, route)] = RouteMetrics()
+            metrics.count += 1
+            metrics.latency[latency_index] += 1
+            metrics.latency_sum += seconds
+            metrics.queries[queries_index] += 1
+            metrics.queries_sum += stats.queries
+            metrics.db_seconds += stats.db_seconds
+            metrics.rows += stats.rows
+            metrics.response_bytes += response_bytes
+            if flagged:
+                metrics.flagged += 1
+            key = str(status)
+            metrics.statuses[key] = metrics.statuses.get(key, 0) + 1
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {"method": method, "route": route, **metrics.to_dict()}
+                for (method, route), metrics in self._routes.items()
+            ]
+
+
+registry = MetricsRegistry()
+
+
+# ============================================
+# MIDDLEWARE
+# ============================================
+
+class MetricsMiddleware:
+    """Middleware ASGI puro: no envuelve el body en memoria y funciona con respuestas en streaming"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = 500
+        response_bytes = 0
+
+        async def send_wrapper(message):
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - started
+            route = getattr(scope.get("route"), "path", None) or UNMATCHED_ROUTE
+            method = scope.get("method", "")
+            flagged = stats.queries > METRICS_QUERY_THRESHOLD
+            if flagged:
+                print(f"Petición con {stats.queries} consultas (umbral {METRICS_QUERY_THRESHOLD}): "
+                      f"{method} {route}, {stats.db_seconds * 1000:.1f} ms en MySQL, {elapsed * 1000:.1f} ms total")
+            registry.observe(method, route, status, elapsed, stats, response_bytes, flagged)
+
+
+# ============================================
+# VARIOS WORKERS
+# ============================================
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"worker-{pid}.json")
+
+
+def flush_snapshot():
+    """Escribe el snapshot de este worker en METRICS_DIR (rename atómico)"""
+    path = _snapshot_path(os.getpid())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(registry.snapshot(), f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def init_request_metrics():
+    """Registra la escritura periódica del snapshot si hay METRICS_DIR (se llama en el startup)"""
+    if not METRICS_ENABLED or not METRICS_DIR:
+        return
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        flush_snapshot()
+    except Exception as e:
+        print(f"Métricas compartidas entre workers deshabilitadas: {str(e)}")
+        return
+    register_task(PeriodicTask("request-metrics-flush", METRICS_FLUSH_INTERVAL, flush_snapshot))
+
+
+def collect_metrics() -> Tuple[Dict[Tuple[str, str], RouteMetrics], int]:
+    """Métricas de este proceso más los snapshots recientes de los demás workers; (rutas, workers)"""
+    merged: Dict[Tuple[str, str], RouteMetrics] = {}
+    snapshots = [registry.snapshot()]
+
+    if METRICS_DIR:
+        own_path = _snapshot_path(os.getpid())
+        now = time.time()
+        for path in glob.glob(os.path.join(METRICS_DIR, "worker-*.json")):
+            if path == own_path:
+                continue
+            try:
+                # Un worker que ya no escribe (reiniciado o caído) deja de contar
+                if now - os.path.getmtime(path) > METRICS_STALE_SECONDS:
+                    continue
+                with open(path, encoding="utf-8") as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"Error leyendo métricas de {path}: {str(e)}")
+
+    for snapshot in snapshots:
+        for data in snapshot:
+            key = (data["method"], data["route"])
+            metrics = merged.get(key)
+            if metrics is None:
+                metrics = merged[key] = RouteMetrics()
+            metrics.merge(data)
+    return merged, len(snapshots)
+
+
+# ============================================
+# FORMATO DE TEXTO DE PROMETHEUS
+# ============================================
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return str(value) if isinstance(value, int) else repr(round(value, 6))
+
+
+def _labels(method: str, route: str, **extra: str) -> str:
+    labels = {"method": method, "route": route, **extra}
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _histogram(lines: List[str], name: str, buckets: Tuple[float, ...], counts: List[int],
+               total: float, method: str, route: str):
+    cumulative = 0
+    for upper, count in zip(buckets, counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(method, route, le=f'{upper:g}')} {cumulative}")
+    cumulative += counts[-1]
+    lines.append(f"{name}_bucket{_labels(method, route, le='+Inf')} {cumulative}")
+    lines.append(f"{name}_sum{_labels(method, route)} {_number(total)}")
+    lines.append(f"{name}_count{_labels(method, route)} {cumulative}")
+
+
+def render_metrics() -> str:
+    routes, workers = collect_metrics()
+    ordered = sorted(routes.items())
+    lines: List[str] = []
+
+    def header(name: str, kind: str, help_text: str):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    name = f"{PREFIX}_http_requests_total"
+    header(name, "counter", "Peticiones HTTP por ruta, método y código de respuesta")
+    for (method, route), metrics in ordered:
+        for status, count in sorted(metrics.statuses.items()):
+            lines.append(f"{name}{_labels(method, route, status=status)} {count}")
+
+    name = f"{PREFIX}_http_request_duration_seconds"
+    header(name, "histogram", "Latencia de las peticiones HTTP")
+    for (method, route), metrics in ordered:
+        _histogram(lines, name, LATENCY_BUCKETS, metrics.latency, metrics.latency_sum, method, route)
+
+    name = f"{PREFIX}_db_queries_per_request"
+    header(name, "histogram", "Consultas SQL por petición")
+    for (method, route), metrics in ordered:
+        _histogram(lines, name, QUERY_BUCKETS, metrics.queries, metrics.queries_sum, method, route)
+
+    counters = [
+        ("db_queries_total", "Consultas SQL ejecutadas por las peticiones", lambda m: m.queries_sum),
+        ("db_seconds_total", "Tiempo total de las peticiones dentro de MySQL", lambda m: m.db_seconds),
+        ("db_rows_total", "Filas devueltas por las consultas de las peticiones", lambda m: m.rows),
+        ("http_response_bytes_total", "Bytes de body enviados en las respuestas", lambda m: m.response_bytes),
+        ("http_requests_query_flagged_total",
+         f"Peticiones con más de {METRICS_QUERY_THRESHOLD} consultas SQL", lambda m: m.flagged),
+    ]
+    for suffix, help_text, value in counters:
+        name = f"{PREFIX}_{suffix}"
+        header(name, "counter", help_text)
+        for (method, route), metrics in ordered:
+            lines.append(f"{name}{_labels(method, route)} {_number(value(metrics))}")
+
+    name = f"{PREFIX}_metrics_workers"
+    header(name, "gauge", "Workers incluidos en estas métricas")
+    lines.append(f"{name} {workers}")
+
+    return "\n".join(lines) + "\n"
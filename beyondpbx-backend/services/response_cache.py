@@ -0,0 +1,253 @@
+# services/response_cache.py
+"""
+Caché de respuestas con TTL para los endpoints que el frontend consulta por polling.
+
+- TTL por endpoint, con expiración alineada a múltiplos del TTL: todos los
+  visores (y todos los workers) comparten los mismos límites de bucket, así
+  que los períodos relativos a "ahora" producen la misma llave dentro del bucket.
+- Desalojo LRU con límite de memoria (tamaño estimado de la respuesta en JSON,
+  o el que calcule `size` para objetos que no son JSON, como los histogramas).
+- Single-flight: N peticiones idénticas concurrentes ejecutan una sola consulta,
+  el resto espera el resultado del primero.
+
+Uso en un router:
+
+    @router.get("/active-calls")
+    @cached(ttl=3)
+    def get_active_calls(db: Session = Depends(get_db)):
+        ...
+"""
+import asyncio
+import functools
+import inspect
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi.params import Depends
+from starlette.background import BackgroundTasks
+from starlette.requests import HTTPConnection
+from starlette.responses import Response
+
+CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+CACHE_MAX_BYTES = int(float(os.getenv("RESPONSE_CACHE_MAX_MB", "64")) * 1024 * 1024)
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "size")
+
+    def __init__(self, value: Any, expires_at: float, size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+
+
+class ResponseCache:
+    """Caché LRU en memoria del proceso, segura entre hilos"""
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self.evictions = 0
+
+    def _count(self, namespace: str, counter: str):
+        stats = self._stats.setdefault(namespace, {"hits": 0, "misses": 0, "coalesced": 0})
+        stats[counter] += 1
+
+    def get_or_load(self, namespace: str, key: Hashable, ttl: float, loader: Callable[[], Any],
+                    size: Optional[Callable[[Any], int]] = None) -> Any:
+        """
+        Valor cacheado de `key` o el que devuelve `loader`. `size` calcula los
+        bytes del valor cuando no es JSON (por defecto se estima serializándolo).
+        """
+        now = time.time()
+        value, flight, is_leader = self._lookup(namespace, key, now)
+        if flight is None:
+            return value
+        if not is_leader:
+            return flight.result()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.set_exception(e)
+            raise
+
+        self._complete(key, flight, value, bucket_end(now, ttl), size)
+        return value
+
+    async def get_or_load_async(self, namespace: str, key: Hashable, ttl: float,
+                                loader: Callable[[], Awaitable[Any]],
+                                size: Optional[Callable[[Any], int]] = None) -> Any:
+        """Igual que get_or_load para handlers async def: los seguidores esperan sin bloquear el event loop"""
+        now = time.time()
+        value, flight, is_leader = self._lookup(namespace, key, now)
+        if flight is None:
+            return value
+        if not is_leader:
+            return await asyncio.wrap_future(flight)
+
+        try:
+            value = await loader()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.set_exception(e)
+            raise
+
+        self._complete(key, flight, value, bucket_end(now, ttl), size)
+        return value
+
+    def _lookup(self, namespace: str, key: Hashable, now: float) -> Tuple[Any, Optional[Future], bool]:
+        """
+        (valor, None, False) si hay acierto; si no (None, future en vuelo, True si
+        esta petición es la que ejecuta la carga)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self._count(namespace, "hits")
+                return entry.value, None, False
+
+            flight = self._inflight.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = Future()
+                self._inflight[key] = flight
+                self._count(namespace, "misses")
+            else:
+                self._count(namespace, "coalesced")
+            return None, flight, is_leader
+
+    def _complete(self, key: Hashable, flight: Future, value: Any, expires_at: float,
+                  size: Optional[Callable[[Any], int]] = None):
+        nbytes = size(value) if size else _estimate_size(value)
+        with self._lock:
+            self._store(key, value, expires_at, nbytes)
+            self._inflight.pop(key, None)
+        flight.set_result(value)
+
+    def _store(self, key: Hashable, value: Any, expires_at: float, size: int):
+        if size > self.max_bytes:
+            return
+
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.size
+
+        self._entries[key] = _Entry(value, expires_at, size)
+        self._bytes += size
+
+        # Primero se descartan las entradas vencidas, luego las menos usadas
+        if self._bytes > self.max_bytes:
+            now = time.time()
+            for stale_key in [k for k, e in self._entries.items() if e.expires_at <= now]:
+                self._bytes -= self._entries.pop(stale_key).size
+                self.evictions += 1
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.evictions += 1
+
+    def invalidate(self, namespace: Optional[str] = None):
+        """Elimina todas las entradas, o solo las de un namespace"""
+        with self._lock:
+            for key in list(self._entries):
+                if namespace is None or key[0] == namespace:
+                    self._bytes -= self._entries.pop(key).size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = sum(s["hits"] for s in self._stats.values())
+            misses = sum(s["misses"] for s in self._stats.values())
+            coalesced = sum(s["coalesced"] for s in self._stats.values())
+            requests = hits + misses + coalesced
+            return {
+                "enabled": CACHE_ENABLED,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "hits": hits,
+                "misses": misses,
+                "coalesced": coalesced,
+                "hit_rate": round((hits + coalesced) / requests * 100, 1) if requests else 0,
+                "endpoints": {name: dict(s) for name, s in sorted(self._stats.items())}
+            }
+
+
+def bucket_end(now: float, ttl: float) -> float:
+    """Fin del bucket de `ttl` segundos que contiene `now` (alineado a la época)"""
+    return (math.floor(now / ttl) + 1) * ttl
+
+
+def _estimate_size(value: Any) -> int:
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 1024
+
+
+def _make_key(namespace: str, params: Dict[str, Any], ttl: float, now: float) -> Tuple:
+    # El índice del bucket forma parte de la llave: "today"/"week" calculados
+    # con datetime.now() dentro del mismo bucket devuelven la misma respuesta
+    return (namespace, math.floor(now / ttl), tuple(sorted((k, repr(v)) for k, v in params.items())))
+
+
+response_cache = ResponseCache()
+
+
+def cached(ttl: float, namespace: Optional[str] = None):
+    """
+    Decorador para endpoints (def o async def). La llave se arma con todos los
+    parámetros de query/path, por su repr (fechas, listas y enums incluidos); se
+    ignoran las dependencias (Depends, como la sesión de BD) y los objetos que
+    inyecta FastAPI (Request, Response, BackgroundTasks).
+    """
+    def decorator(func: Callable):
+        name = namespace or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+        signature = inspect.signature(func)
+        dependencies = {
+            param.name for param in signature.parameters.values() if isinstance(param.default, Depends)
+        }
+
+        def make_key(args, kwargs) -> Tuple:
+            bound = signature.bind_partial(*args, **kwargs)
+            params = {
+                k: v for k, v in bound.arguments.items()
+                if k not in dependencies and not isinstance(v, (HTTPConnection, Response, BackgroundTasks))
+            }
+            return _make_key(name, params, ttl, time.time())
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not CACHE_ENABLED:
+                    return await func(*args, **kwargs)
+                key = make_key(args, kwargs)
+                return await response_cache.get_or_load_async(name, key, ttl, lambda: func(*args, **kwargs))
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not CACHE_ENABLED:
+                return func(*args, **kwargs)
+            key = make_key(args, kwargs)
+            return response_cache.get_or_load(name, key, ttl, lambda: func(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,216 @@
+# services/snapshot_broadcast.py
+"""
+Canal push (Server-Sent Events) para los monitores en tiempo real.
+
+En lugar de que cada pestaña abierta haga polling y ejecute todo el camino de
+consultas, un hilo en segundo plano calcula el snapshot una vez por tick y lo
+reparte a todos los suscriptores:
+
+- al conectarse, el cliente recibe un evento `snapshot` con el estado completo;
+- después solo recibe eventos `delta` con los elementos cuyo estado cambió
+  (más los eliminados y el resumen);
+- si no hay cambios se envía un comentario `: ping` cada cierto tiempo.
+
+El costo en servidor ya no depende del número de monitores abiertos, y si no hay
+ningún suscriptor el tick no consulta nada.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from services.background import PeriodicTask, register_task
+
+PUSH_ENABLED = os.getenv("PUSH_ENABLED", "true").lower() == "true"
+PUSH_HEARTBEAT = float(os.getenv("PUSH_HEARTBEAT", "15"))
+PUSH_QUEUE_SIZE = int(os.getenv("PUSH_QUEUE_SIZE", "20"))
+
+# (secuencia, delta o None si es un snapshot completo, snapshot completo)
+Message = Tuple[int, Optional[Dict[str, Any]], Dict[str, Any]]
+
+
+class _Subscriber:
+    __slots__ = ("loop", "queue")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue: "asyncio.Queue[Message]" = asyncio.Queue(maxsize=PUSH_QUEUE_SIZE)
+
+
+class SnapshotBroadcaster:
+    """
+    Calcula un snapshot por tick y publica las diferencias.
+    Los elementos de `list_field` se comparan por `key_field`, ignorando los
+    campos de `volatile_fields` (contadores que el cliente avanza por su cuenta).
+    """
+
+    def __init__(self, name: str, interval: float, compute: Callable[[], Dict[str, Any]],
+                 list_field: str, key_field: str, volatile_fields: Iterable[str] = (),
+                 summary_field: Optional[str] = "summary"):
+        self.name = name
+        self.interval = interval
+        self._compute = compute
+        self.list_field = list_field
+        self.key_field = key_field
+        self.volatile_fields = frozenset(volatile_fields)
+        self.summary_field = summary_field
+        self._subscribers: List[_Subscriber] = []
+        self._lock = threading.Lock()
+        self._compute_lock = threading.Lock()
+        self._last: Optional[Dict[str, Any]] = None
+        self._last_at = 0.0
+        self._seq = 0
+        self.deltas_sent = 0
+        _broadcasters.append(self)
+
+    # ----------------------------------------
+    # Suscriptores (lado asyncio)
+    # ----------------------------------------
+
+    def subscribe(self) -> _Subscriber:
+        subscriber = _Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: _Subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+            if not self._subscribers:
+                self._last = None
+
+    @staticmethod
+    def _offer(subscriber: _Subscriber, message: Message):
+        # Cliente lento: se descartan sus mensajes pendientes y se le manda el estado completo
+        if subscriber.queue.full():
+            while not subscriber.queue.empty():
+                subscriber.queue.get_nowait()
+            seq, _, full = message
+            message = (seq, None, full)
+        subscriber.queue.put_nowait(message)
+
+    # ----------------------------------------
+    # Tick (hilo en segundo plano)
+    # ----------------------------------------
+
+    def snapshot(self) -> Tuple[int, Dict[str, Any]]:
+        """Último snapshot si es reciente; si no, lo calcula (una sola vez aunque lo pidan varios)"""
+        with self._compute_lock:
+            if self._last is not None and time.time() - self._last_at < self.interval * 2:
+                return self._seq, self._last
+            snapshot = self._compute()
+            self._seq += 1
+            self._last, self._last_at = snapshot, time.time()
+            return self._seq, snapshot
+
+    def tick(self):
+        with self._lock:
+            if not self._subscribers:
+                return
+
+        with self._compute_lock:
+            current = self._compute()
+            delta = self._diff(self._last, current)
+            self._seq += 1
+            self._last, self._last_at = current, time.time()
+            seq = self._seq
+
+        if delta is None:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(self._offer, subscriber, (seq, delta, current))
+            except RuntimeError:
+                # El event loop del suscriptor ya se cerró
+                self.unsubscribe(subscriber)
+        self.deltas_sent += 1
+
+    def _signature(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in item.items() if k not in self.volatile_fields}
+
+    def _diff(self, previous: Optional[Dict[str, Any]], current: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if previous is None:
+            return {self.list_field: current.get(self.list_field, []), "removed": [],
+                    **self._extra(current)}
+
+        previous_items = {item[self.key_field]: item for item in previous.get(self.list_field, [])}
+        current_items = {item[self.key_field]: item for item in current.get(self.list_field, [])}
+
+        changed = [
+            item for key, item in current_items.items()
+            if key not in previous_items or self._signature(previous_items[key]) != self._signature(item)
+        ]
+        removed = [key for key in previous_items if key not in current_items]
+        summary_changed = (
+            self.summary_field is not None
+            and previous.get(self.summary_field) != current.get(self.summary_field)
+        )
+        if not changed and not removed and not summary_changed:
+            return None
+        return {self.list_field: changed, "removed": removed, **self._extra(current)}
+
+    def _extra(self, current: Dict[str, Any]) -> Dict[str, Any]:
+        extra = {"timestamp": current.get("timestamp")}
+        if self.summary_field is not None:
+            extra[self.summary_field] = current.get(self.summary_field)
+        return extra
+
+    # ----------------------------------------
+    # Stream SSE
+    # ----------------------------------------
+
+    async def stream(self) -> AsyncIterator[str]:
+        """Generador para StreamingResponse(media_type="text/event-stream")"""
+        subscriber = self.subscribe()
+        try:
+            seq, snapshot = await run_in_threadpool(self.snapshot)
+            yield format_sse("snapshot", snapshot, seq)
+            while True:
+                try:
+                    message_seq, delta, full = await asyncio.wait_for(subscriber.queue.get(), PUSH_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if delta is None:
+                    seq = message_seq
+                    yield format_sse("snapshot", full, message_seq)
+                elif message_seq > seq:
+                    # Los deltas anteriores al snapshot enviado ya están incluidos en él
+                    seq = message_seq
+                    yield format_sse("delta", delta, message_seq)
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            subscribers = len(self._subscribers)
+        return {"subscribers": subscribers, "sequence": self._seq, "deltas_sent": self.deltas_sent}
+
+
+def format_sse(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append("data: " + json.dumps(data, default=str, separators=(',', ':')))
+    return "\n".join(lines) + "\n\n"
+
+
+_broadcasters: List[SnapshotBroadcaster] = []
+
+
+def broadcaster_stats() -> Dict[str, Any]:
+    return {broadcaster.name: broadcaster.stats() for broadcaster in _broadcasters}
+
+
+def init_broadcasters():
+    """Registra un tick por canal push (se llama en el startup)"""
+    if PUSH_ENABLED:
+        for broadcaster in _broadcasters:
+            register_task(PeriodicTask(f"push-{broadcaster.name}", broadcaster.interval, broadcaster.tick))
@@ -0,0 +1,148 @@
+# services/sqlrealtime_snapshot.py
+"""
+Snapshot en memoria de qstats.sqlrealtime para /api/queues/stats/realtime.
+
+Antes cada petición leía todas las filas y volvía a parsear todos los blobs PHP.
+Aquí se guarda el resultado parseado por `user` junto con su `lastupdate`:
+
+- en cada refresco solo se leen las filas con `lastupdate >= marca_de_agua`;
+  las que traen el mismo (user, lastupdate) que ya tenemos se descartan sin parsear;
+- los totales globales se mantienen sumando la fila nueva y restando la anterior;
+- las filas borradas (sesiones que terminan) se detectan comparando COUNT(*) con
+  las filas en memoria; solo si no cuadra se leen las llaves para eliminarlas.
+
+Se usa `>=` y no `>` porque lastupdate tiene resolución de segundos: una fila
+actualizada en el mismo segundo que la última lectura quedaría fuera.
+"""
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from utils.php_parser import parse_sqlrealtime_data
+
+SUM_FIELDS = ("received", "answered", "abandoned", "unanswered", "answered_sla")
+
+
+def metric_sums(metrics: Dict[str, Any]) -> Dict[str, int]:
+    """Contadores de una cola que entran en los totales globales"""
+    calls = metrics.get("calls", {})
+    return {field: calls.get(field, 0) for field in SUM_FIELDS}
+
+
+def totals_from_sums(sums: Dict[str, int]) -> Dict[str, Any]:
+    """Totales globales con la misma forma que ha devuelto siempre el endpoint"""
+    totals = {
+        "calls": {
+            "received": sums["received"],
+            "answered": sums["answered"],
+            "abandoned": sums["abandoned"],
+            "unanswered": sums["unanswered"]
+        },
+        "times": {
+            "avg_wait": 0,
+            "avg_talk": 0
+        },
+        "sla": {
+            "percentage": 0
+        }
+    }
+    if sums["received"] > 0:
+        totals["sla"]["percentage"] = round((sums["answered_sla"] / sums["received"]) * 100, 2)
+    return totals
+
+
+class SQLRealtimeSnapshot:
+    """Filas parseadas de sqlrealtime por user, con totales incrementales"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # user -> (lastupdate, entrada del endpoint o None si el blob no trae métricas)
+        self._rows: Dict[str, Tuple[Optional[datetime], Optional[Dict[str, Any]]]] = {}
+        self._sums = {field: 0 for field in SUM_FIELDS}
+        self._watermark: Optional[datetime] = None
+        self._loaded = False
+        self.rows_parsed = 0
+        self.sweeps = 0
+
+    def _apply_sums(self, entry: Optional[Dict[str, Any]], sign: int):
+        if entry is None:
+            return
+        for field, value in metric_sums(entry["metrics"]).items():
+            self._sums[field] += sign * value
+
+    def _upsert(self, user: str, lastupdate: Optional[datetime], data: Optional[str]):
+        previous = self._rows.get(user)
+        if previous is not None and previous[0] == lastupdate:
+            return
+
+        metrics = parse_sqlrealtime_data(data)
+        self.rows_parsed += 1
+        entry = None
+        if metrics:
+            entry = {
+                "session_id": user,
+                "last_update": lastupdate.isoformat() if lastupdate else None,
+                "metrics": metrics
+            }
+
+        if previous is not None:
+            self._apply_sums(previous[1], -1)
+        self._apply_sums(entry, 1)
+        self._rows[user] = (lastupdate, entry)
+
+        if lastupdate is not None and (self._watermark is None or lastupdate > self._watermark):
+            self._watermark = lastupdate
+
+    def _remove(self, user: str):
+        previous = self._rows.pop(user, None)
+        if previous is not None:
+            self._apply_sums(previous[1], -1)
+
+    def refresh(self, db: Session):
+        with self._lock:
+            if not self._loaded or self._watermark is None:
+                rows = db.execute(text("""
+                    SELECT `user`, lastupdate, data FROM qstats.sqlrealtime
+                """)).fetchall()
+                self._rows.clear()
+                self._sums = {field: 0 for field in SUM_FIELDS}
+                for row in rows:
+                    self._upsert(row[0], row[1], row[2])
+                self._loaded = True
+                return
+
+            rows = db.execute(text("""
+                SELECT `user`, lastupdate, data FROM qstats.sqlrealtime
+                WHERE lastupdate >= :watermark
+            """), {"watermark": self._watermark}).fetchall()
+            for row in rows:
+                self._upsert(row[0], row[1], row[2])
+
+            # Borrados: solo se leen las llaves si el conteo ya no cuadra
+            count = db.execute(text("SELECT COUNT(*) FROM qstats.sqlrealtime")).scalar() or 0
+            if count != len(self._rows):
+                users = {row[0] for row in db.execute(text("SELECT `user` FROM qstats.sqlrealtime")).fetchall()}
+                for user in [user for user in self._rows if user not in users]:
+                    self._remove(user)
+                self.sweeps += 1
+
+    def current(self) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """(colas ordenadas por user, totales globales) tomados en el mismo instante"""
+        with self._lock:
+            queues = [entry for _, (_, entry) in sorted(self._rows.items()) if entry is not None]
+            return queues, totals_from_sums(self._sums)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rows": len(self._rows),
+                "watermark": self._watermark.isoformat() if self._watermark else None,
+                "rows_parsed": self.rows_parsed,
+                "sweeps": self.sweeps
+            }
+
+
+sqlrealtime_snapshot = SQLRealtimeSnapshot()
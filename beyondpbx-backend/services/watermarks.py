@@ -0,0 +1,63 @@
+# services/watermarks.py
+"""
+Marcas de agua (watermarks) para los procesos incrementales.
+Cada proceso guarda el último id procesado de su tabla origen en
+beyondpbx.processing_watermarks, y lo bloquea con SELECT ... FOR UPDATE
+mientras procesa un lote para que varios workers no dupliquen trabajo.
+"""
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from database import Base, engine
+from models import ProcessingWatermark
+
+STATS_SCHEMA = "beyondpbx"
+
+
+def ensure_tables(models: Iterable) -> None:
+    """Crea el esquema propio y las tablas indicadas si no existen"""
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE DATABASE IF NOT EXISTS {STATS_SCHEMA}"))
+    tables = [ProcessingWatermark.__table__] + [m.__table__ for m in models]
+    Base.metadata.create_all(bind=engine, tables=tables)
+
+
+def get_watermark(db: Session, name: str) -> Tuple[int, Optional[datetime]]:
+    """Lee la marca de agua sin bloquearla (para las consultas de lectura)"""
+    row = db.execute(
+        text(f"SELECT last_id, last_time FROM {STATS_SCHEMA}.processing_watermarks WHERE name = :name"),
+        {"name": name}
+    ).fetchone()
+    if not row:
+        return 0, None
+    return row[0] or 0, row[1]
+
+
+def lock_watermark(db: Session, name: str) -> Tuple[int, Optional[datetime]]:
+    """
+    Lee la marca de agua bloqueando su fila hasta el commit/rollback.
+    Un segundo worker queda esperando y al continuar ve el valor ya avanzado.
+    """
+    db.execute(
+        text(f"INSERT IGNORE INTO {STATS_SCHEMA}.processing_watermarks (name, last_id) VALUES (:name, 0)"),
+        {"name": name}
+    )
+    row = db.execute(
+        text(f"SELECT last_id, last_time FROM {STATS_SCHEMA}.processing_watermarks WHERE name = :name FOR UPDATE"),
+        {"name": name}
+    ).fetchone()
+    return row[0] or 0, row[1]
+
+
+def set_watermark(db: Session, name: str, last_id: int, last_time: Optional[datetime]) -> None:
+    db.execute(
+        text(f"""
+            UPDATE {STATS_SCHEMA}.processing_watermarks
+            SET last_id = :last_id, last_time = :last_time, updated_at = NOW()
+            WHERE name = :name
+        """),
+        {"name": name, "last_id": last_id, "last_time": last_time}
+    )
@@ -0,0 +1,213 @@
+# tests/test_asternic_client.py
+"""
+Cliente de Asternic contra el servidor local de benchmarks/asternic_standin.py,
+arrancado en un puerto libre para cada test.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+
+import pytest
+
+from benchmarks.asternic_standin import AGENTS, QUEUES, start_server
+from services import asternic_client
+from services.asternic_client import AsternicError, CircuitBreaker
+
+
+@pytest.fixture
+def standin(monkeypatch):
+    server, handler = start_server()
+    monkeypatch.setattr(asternic_client, "ASTERNIC_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(asternic_client, "ASTERNIC_USER", "adminbeyond")
+    monkeypatch.setattr(asternic_client, "ASTERNIC_PASS", "adminbeyond")
+    monkeypatch.setattr(asternic_client, "breaker", CircuitBreaker(failures=3, reset_after=30))
+    monkeypatch.setattr(asternic_client, "_cache", OrderedDict())
+    monkeypatch.setattr(asternic_client, "_inflight", {})
+    monkeypatch.setattr(asternic_client, "_background", set())
+    yield handler
+    server.shutdown()
+    server.server_close()
+
+
+def run(scenario):
+    """Ejecuta el escenario en un event loop propio y cierra el cliente compartido al final"""
+    async def main():
+        try:
+            return await scenario()
+        finally:
+            await asternic_client.close_asternic_client()
+    return asyncio.run(main())
+
+
+def test_basic_auth(standin, monkeypatch):
+    assert run(lambda: asternic_client.get_json("/api/queues")) == {"queues": QUEUES}
+
+    monkeypatch.setattr(asternic_client, "ASTERNIC_PASS", "incorrecta")
+    with pytest.raises(AsternicError) as error:
+        run(lambda: asternic_client.get_json("/api/queues"))
+    assert error.value.status_code == 401
+    # Un 4xx no cuenta como caída de Asternic
+    assert asternic_client.breaker.failures == 0
+
+
+def test_per_call_timeout_has_no_status(standin):
+    started = time.perf_counter()
+    with pytest.raises(AsternicError) as error:
+        run(lambda: asternic_client.get_json("/api/agents", params={"delay": 1}, timeout=0.1))
+    assert error.value.status_code is None
+    assert time.perf_counter() - started < 0.8
+    assert asternic_client.breaker.failures == 1
+
+
+def test_fetch_many_runs_concurrently(standin):
+    delays = (0.2, 0.3, 0.4)
+
+    async def scenario():
+        started = time.perf_counter()
+        results = await asternic_client.fetch_many(
+            f"/api/agents?delay={delays[0]}",
+            f"/api/queues?delay={delays[1]}",
+            f"/api/agents?delay={delays[2]}&status=404",
+        )
+        return results, time.perf_counter() - started
+
+    (agents, queues, missing), elapsed = run(scenario)
+    assert agents == {"agents": AGENTS}
+    assert queues == {"queues": QUEUES}
+    # Un fallo parcial llega en su posición, sin tumbar las demás llamadas
+    assert isinstance(missing, AsternicError) and missing.status_code == 404
+    assert max(delays) <= elapsed < sum(delays)
+
+
+def test_connections_are_reused(standin):
+    async def scenario():
+        for _ in range(5):
+            await asternic_client.get_json("/api/agents")
+
+    run(scenario)
+    assert standin.requests == 5
+    assert len(standin.connections) == 1
+
+
+# ============================================
+# CIRCUIT BREAKER
+# ============================================
+
+def test_breaker_opens_after_consecutive_failures(standin):
+    standin.fail_status = 503
+
+    async def scenario():
+        for _ in range(3):
+            with pytest.raises(AsternicError) as error:
+                await asternic_client.get_json("/api/queues")
+            assert error.value.status_code == 503 and not error.value.circuit_open
+        # Abierto: falla sin llegar al servidor
+        with pytest.raises(AsternicError) as error:
+            await asternic_client.get_json("/api/queues")
+        return error.value
+
+    error = run(scenario)
+    assert error.circuit_open and error.status_code is None
+    assert asternic_client.breaker.state == "open"
+    assert standin.requests == 3
+    assert asternic_client.breaker.rejected == 1
+
+
+def test_breaker_half_open_allows_one_trial(standin, monkeypatch):
+    breaker = CircuitBreaker(failures=1, reset_after=0.2)
+    monkeypatch.setattr(asternic_client, "breaker", breaker)
+    standin.fail_status = 503
+
+    async def scenario():
+        with pytest.raises(AsternicError):
+            await asternic_client.get_json("/api/queues")
+        assert breaker.state == "open"
+
+        # Pasado reset_after: una prueba fallida vuelve a abrir el circuito
+        await asyncio.sleep(0.25)
+        with pytest.raises(AsternicError) as error:
+            await asternic_client.get_json("/api/queues")
+        assert error.value.status_code == 503 and breaker.state == "open"
+
+        # Otra vez en half-open: mientras la prueba está en curso las demás se rechazan
+        await asyncio.sleep(0.25)
+        standin.fail_status = None
+        trial, rejected = await asyncio.gather(
+            asternic_client.get_json("/api/queues", params={"delay": 0.1}),
+            asternic_client.get_json("/api/queues"),
+            return_exceptions=True,
+        )
+        return trial, rejected
+
+    trial, rejected = run(scenario)
+    assert trial == {"queues": QUEUES}
+    assert isinstance(rejected, AsternicError) and rejected.circuit_open
+    assert breaker.state == "closed" and breaker.failures == 0
+    assert standin.requests == 3
+
+
+# ============================================
+# STALE-WHILE-REVALIDATE
+# ============================================
+
+async def _drain_background():
+    await asyncio.gather(*list(asternic_client._background), return_exceptions=True)
+
+
+def test_cached_get_serves_fresh_then_stale(standin):
+    async def scenario():
+        first = await asternic_client.cached_get("/api/queues", fresh_for=0.2)
+        cached = await asternic_client.cached_get("/api/queues", fresh_for=0.2)
+        assert not first.stale and not cached.stale and standin.requests == 1
+
+        # Pasado el presupuesto de frescura responde al instante con la copia y refresca detrás
+        await asyncio.sleep(0.25)
+        started = time.perf_counter()
+        stale = await asternic_client.cached_get("/api/queues", fresh_for=0.2)
+        assert time.perf_counter() - started < 0.05
+        assert stale.stale and stale.age >= 0.2 and stale.data == {"queues": QUEUES}
+        await _drain_background()
+        assert standin.requests == 2
+
+        refreshed = await asternic_client.cached_get("/api/queues", fresh_for=0.2)
+        assert not refreshed.stale and refreshed.age < 0.2
+
+    run(scenario)
+
+
+def test_cached_get_keeps_serving_stale_while_asternic_is_down(standin):
+    async def scenario():
+        await asternic_client.cached_get("/api/agents", fresh_for=0.1, max_stale=0.6)
+        standin.fail_status = 503
+
+        await asyncio.sleep(0.15)
+        stale = await asternic_client.cached_get("/api/agents", fresh_for=0.1, max_stale=0.6)
+        assert stale.stale and stale.data == {"agents": AGENTS}
+        await _drain_background()
+
+        # El refresco fallido no borra la última respuesta buena
+        again = await asternic_client.cached_get("/api/agents", fresh_for=0.1, max_stale=0.6)
+        assert again.stale and again.data == {"agents": AGENTS}
+        await _drain_background()
+
+        # Más allá de max_stale ya no hay copia utilizable y se propaga el error
+        await asyncio.sleep(0.5)
+        with pytest.raises(AsternicError) as error:
+            await asternic_client.cached_get("/api/agents", fresh_for=0.1, max_stale=0.6)
+        return error.value
+
+    error = run(scenario)
+    assert error.status_code == 503
+    assert asternic_client.breaker.state == "open"
+
+
+def test_cached_get_single_flight(standin):
+    async def scenario():
+        return await asyncio.gather(*(
+            asternic_client.cached_get("/api/agent-stats", params={"agent": "1001", "delay": 0.1})
+            for _ in range(5)
+        ))
+
+    results = run(scenario)
+    assert all(result.data["agent"] == "1001" for result in results)
+    assert standin.requests == 1
@@ -0,0 +1,135 @@
+# tests/test_ivr_stats.py
+"""
+Llamadas por opción de IVR sobre datos de benchmarks/pbx_datagen.py, que deja
+una sola fila de cdr por llamada con su destino final (como FreePBX).
+
+Se usa SQLite con asteriskcdrdb y asterisk adjuntos como esquemas; el
+generador anota la opción marcada en cada llamada para comparar.
+"""
+import random
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from benchmarks.pbx_datagen import CDR_COLUMNS, CallGenerator, PBXModel
+from services.ivr_stats import _load_option_counts
+from utils.destinations import ivr_destination_target, route_ivr_id
+
+CALLS = 6000
+
+
+class RecordingRandom(random.Random):
+    """Anota el DID y la opción de IVR que elige el generador en cada llamada"""
+
+    def __init__(self, seed: int, pbx: PBXModel):
+        super().__init__(seed)
+        self.pbx = pbx
+        self.option_keys = {tuple(options) for options in pbx.ivr_options.values()}
+        self.did = None
+        self.selection = None
+
+    def choice(self, seq):
+        value = super().choice(seq)
+        if seq is self.pbx.did_list:
+            self.did, self.selection = value, None
+        elif isinstance(seq, list) and tuple(seq) in self.option_keys:
+            self.selection = value
+        return value
+
+
+@pytest.fixture
+def generated():
+    pbx = PBXModel(random.Random(11), queues=8, agents=40, ivrs=3, dids=12)
+    rng = RecordingRandom(5, pbx)
+    generator = CallGenerator(pbx, rng, mean_wait=30, mean_talk=180, abandon_rate=0.08)
+
+    dialed = defaultdict(Counter)
+    start = datetime.now() - timedelta(days=2)
+    for i in range(CALLS):
+        generator.inbound(start + timedelta(seconds=20 * i))
+        if rng.selection is not None:
+            dialed[route_ivr_id(pbx.dids[rng.did])][rng.selection] += 1
+    rows = [row for table, row in generator.drain() if table == "asteriskcdrdb.cdr"]
+    return pbx, rows, dialed
+
+
+@pytest.fixture
+def db(generated):
+    pbx, rows, _ = generated
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+
+    @event.listens_for(engine, "connect")
+    def attach(dbapi_connection, _):
+        dbapi_connection.execute("ATTACH DATABASE ':memory:' AS asteriskcdrdb")
+        dbapi_connection.execute("ATTACH DATABASE ':memory:' AS asterisk")
+
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE TABLE asteriskcdrdb.cdr (id INTEGER PRIMARY KEY, {', '.join(CDR_COLUMNS)})"))
+        conn.execute(text("CREATE TABLE asterisk.incoming (cidnum TEXT, extension TEXT, destination TEXT)"))
+        conn.execute(
+            text(f"INSERT INTO asteriskcdrdb.cdr ({', '.join(CDR_COLUMNS)}) "
+                 f"VALUES ({', '.join(':' + column for column in CDR_COLUMNS)})"),
+            [dict(zip(CDR_COLUMNS, row)) for row in rows]
+        )
+        conn.execute(
+            text("INSERT INTO asterisk.incoming VALUES ('', :did, :destination)"),
+            [{"did": did, "destination": destination} for did, destination in pbx.dids.items()]
+        )
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def test_generator_writes_one_cdr_row_per_call(generated):
+    _, rows, _ = generated
+    calls = Counter(row[CDR_COLUMNS.index("uniqueid")] for row in rows)
+    assert len(calls) == CALLS
+    assert set(calls.values()) == {1}
+    # Solo las que cuelgan sin marcar conservan el contexto del IVR
+    ivr_rows = [row for row in rows if row[CDR_COLUMNS.index("dcontext")].startswith("ivr-")]
+    assert ivr_rows and {row[CDR_COLUMNS.index("dst")] for row in ivr_rows} == {"s"}
+
+
+def test_option_counts_follow_final_destination(generated, db):
+    pbx, _, dialed = generated
+    entries = {f"{ivr_id}|{selection}": dest
+               for ivr_id, options in pbx.ivr_options.items() for selection, dest in options.items()}
+    counts = _load_option_counts(db, entries)
+
+    assert set(dialed) == set(pbx.ivrs)
+    for ivr_id, options in pbx.ivr_options.items():
+        for selection, dest in options.items():
+            # Las opciones con el mismo destino no se distinguen en el CDR y comparten el total
+            expected = sum(dialed[ivr_id][other] for other, other_dest in options.items()
+                           if ivr_destination_target(other_dest) == ivr_destination_target(dest))
+            assert expected > 0
+            assert counts[ivr_id][selection] == expected, (ivr_id, selection)
+
+
+@pytest.mark.parametrize("dest, target", [
+    ("ext-queues,400,1", ("ext-queues", "400")),
+    ("from-did-direct,1001,1", ("from-did-direct", "1001")),
+    ("app-blackhole,hangup,1", ("app-blackhole", "hangup")),
+    ('["queue","401"]', ("ext-queues", "401")),
+    ('["ivr","2"]', ("ivr-2", "s")),
+    ('["hangup",""]', ("app-blackhole", "hangup")),
+    ("texto libre", None),
+    (None, None),
+])
+def test_ivr_destination_target(dest, target):
+    assert ivr_destination_target(dest) == target
+
+
+@pytest.mark.parametrize("destination, ivr_id", [
+    ("ivr-3,s,1", 3),
+    ("app-ivr/4", 4),
+    ("ext-queues,400,1", None),
+    ("ivr-x,s,1", None),
+    (None, None),
+])
+def test_route_ivr_id(destination, ivr_id):
+    assert route_ivr_id(destination) == ivr_id
@@ -0,0 +1,63 @@
+# tests/test_php_parser.py
+"""
+El camino rápido de arrays planos (str) y el parser por offsets deben dar el
+mismo resultado para la misma entrada, esté bien formada o no.
+"""
+import random
+
+import pytest
+
+from benchmarks.php_parser_bench import nested_row, php_serialize, sample_row
+from utils.php_parser import unserialize_php, unserialize_php_offsets
+
+
+def _same_everywhere(payload: str):
+    expected = unserialize_php_offsets(payload.encode("utf-8"))
+    assert unserialize_php(payload) == expected
+    assert unserialize_php(payload.encode("utf-8")) == expected
+    return expected
+
+
+def test_sqlrealtime_row():
+    row = sample_row(3)
+    assert _same_everywhere(php_serialize(row)) == row
+
+
+def test_nested_row():
+    row = nested_row(1)
+    assert _same_everywhere(php_serialize(row)) == row
+
+
+@pytest.mark.parametrize("payload", [
+    'a:1:{s:5:"a";i:1;}',                # llave más corta que su prefijo
+    'a:1:{s:1:"a";s:3:"bcde";}',         # valor más largo que su prefijo
+    'a:1:{s:1:"a";s:1:"ñ";}',            # la longitud es en bytes, no en caracteres
+    'a:1:{s:1:"a";s:2:"ñ";}',
+    'a:2:{s:1:"a";i:1;}',                # menos pares de los declarados
+    'a:1:{s:1:"a";s:3:"x;y";}',          # ';' dentro de un texto
+    'a:1:{s:1:"a";a:1:{i:0;b:1;}}',      # array anidado
+    'a:3:{s:1:"a";d:0.5;s:1:"b";N;s:1:"c";b:0;}',
+    'a:2:{s:1:"a";d:INF;s:1:"b";i:-3;}',
+    'a:1:{s:1:"a";d:;}',                 # dobles mal formados
+    'a:1:{s:1:"a";d:abc;}',
+    'a:1:{Ns:1:"a";i:0;}',               # bytes sobrantes entre pares
+    'a:1:{s:1:"a";i:0;}x}',
+    'a:1:{s:1:"a";s:3:"a{b";}',
+])
+def test_edge_cases_match(payload):
+    _same_everywhere(payload)
+
+
+def test_corrupted_payloads_match():
+    rng = random.Random(7)
+    for _ in range(500):
+        row = {f"K{i}": rng.choice([i, f"texto {i}", "año", 1.5, None, True]) for i in range(rng.randint(1, 8))}
+        payload = php_serialize(row)
+        # Cambia un dígito de un prefijo s:<len>: al azar
+        prefixes = [i for i in range(len(payload) - 2) if payload[i:i + 2] == "s:"]
+        pos = rng.choice(prefixes) + 2
+        _same_everywhere(payload[:pos] + str(rng.randint(0, 9)) + payload[pos + 1:])
+        # Inserta o borra un carácter en cualquier posición
+        pos = rng.randrange(len(payload))
+        _same_everywhere(payload[:pos] + rng.choice('sidbN:;"{}0-') + payload[pos:])
+        _same_everywhere(payload[:pos] + payload[pos + 1:])
@@ -0,0 +1,156 @@
+# tests/test_queue_facts.py
+"""
+Lectura de queue_calls con los eventos de queuelog posteriores a la marca de
+agua: el resultado no depende de hasta dónde llegó el proceso incremental, y
+si este va atrasado queue_call_totals() devuelve None (se usa queuelog).
+
+SQLite con asteriskcdrdb y beyondpbx adjuntos; la parte "ya procesada" se
+escribe con apply_event, como haría el upsert.
+"""
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from services import queue_facts
+from services.queue_facts import _COLUMNS, apply_event, queue_call_totals, queue_facts_stats
+
+# id, callid, cola, agente, evento, data1..data4
+EVENTS = [
+    (1, "A", "400", "NONE", "ENTERQUEUE", "", "555001", "1", ""),
+    (2, "A", "400", "SIP/101", "CONNECT", "10", "A.1", "2", ""),
+    (3, "A", "400", "SIP/101", "COMPLETECALLER", "10", "100", "1", ""),
+    (4, "B", "400", "NONE", "ENTERQUEUE", "", "555002", "1", ""),
+    (5, "B", "400", "SIP/102", "CONNECT", "20", "B.1", "3", ""),
+    (6, "B", "400", "SIP/102", "TRANSFER", "200", "from-internal", "20", "300"),
+    (7, "C", "400", "NONE", "ENTERQUEUE", "", "555003", "2", ""),
+    (8, "C", "400", "NONE", "EXITWITHTIMEOUT", "2", "2", "30", ""),
+    (9, "C", "401", "NONE", "ENTERQUEUE", "", "555003", "1", ""),
+    (10, "C", "401", "SIP/103", "CONNECT", "5", "C.1", "1", ""),
+    (11, "C", "401", "SIP/103", "COMPLETEAGENT", "5", "60", "1", ""),
+    (12, "D", "401", "NONE", "ENTERQUEUE", "", "555004", "2", ""),
+    (13, "D", "401", "NONE", "ABANDON", "2", "2", "40", ""),
+    (14, "E", "400", "NONE", "ENTERQUEUE", "", "555005", "3", ""),
+    (15, "E", "400", "SIP/101", "CONNECT", "50", "E.1", "2", ""),
+]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    engine = create_engine("sqlite://", poolclass=StaticPool,
+                           connect_args={"detect_types": sqlite3.PARSE_DECLTYPES})
+
+    @event.listens_for(engine, "connect")
+    def attach(dbapi_connection, _):
+        dbapi_connection.execute("ATTACH DATABASE ':memory:' AS asteriskcdrdb")
+        dbapi_connection.execute("ATTACH DATABASE ':memory:' AS beyondpbx")
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE asteriskcdrdb.queuelog (
+                id INTEGER PRIMARY KEY, time TIMESTAMP, callid TEXT, queuename TEXT, agent TEXT,
+                event TEXT, data1 TEXT, data2 TEXT, data3 TEXT, data4 TEXT
+            )
+        """))
+        conn.execute(text("""
+            CREATE TABLE beyondpbx.processing_watermarks (
+                name TEXT PRIMARY KEY, last_id INTEGER, last_time TIMESTAMP, updated_at TIMESTAMP
+            )
+        """))
+        conn.execute(text("""
+            CREATE TABLE beyondpbx.queue_calls (
+                callid TEXT, queuename TEXT, entered INTEGER, enter_time TIMESTAMP,
+                connect_time TIMESTAMP, end_time TIMESTAMP, agent TEXT, outcome TEXT,
+                caller_id TEXT, position INTEGER, wait_seconds INTEGER, talk_seconds INTEGER,
+                ring_seconds INTEGER, transferred INTEGER, transfer_to TEXT, last_event_id INTEGER,
+                PRIMARY KEY (callid, queuename)
+            )
+        """))
+
+    monkeypatch.setattr(queue_facts, "_available", True)
+    monkeypatch.setattr(queue_facts, "_caught_up", True)
+    monkeypatch.setattr(queue_facts, "QUEUE_CALLS_MAX_LAG", 3600)
+    monkeypatch.setattr(queue_facts, "_pending_stats", dict(queue_facts._pending_stats, stale=False))
+    with Session(engine) as session:
+        yield session
+
+
+def load_events(db: Session, watermark: int, start: datetime):
+    """Inserta EVENTS en queuelog y materializa los que no pasan de la marca de agua"""
+    rows = [
+        dict(zip(("id", "callid", "queuename", "agent", "event", "data1", "data2", "data3", "data4"), values),
+             time=start + timedelta(seconds=values[0]))
+        for values in EVENTS
+    ]
+    db.execute(text("""
+        INSERT INTO asteriskcdrdb.queuelog (id, time, callid, queuename, agent, event, data1, data2, data3, data4)
+        VALUES (:id, :time, :callid, :queuename, :agent, :event, :data1, :data2, :data3, :data4)
+    """), rows)
+
+    calls = {}
+    for row in db.execute(text("SELECT * FROM asteriskcdrdb.queuelog WHERE id <= :id ORDER BY id"),
+                          {"id": watermark}).fetchall():
+        apply_event(calls, row)
+    if calls:
+        db.execute(text(f"INSERT INTO beyondpbx.queue_calls ({', '.join(_COLUMNS)}) "
+                        f"VALUES ({', '.join(':' + column for column in _COLUMNS)})"), list(calls.values()))
+    db.execute(text("INSERT INTO beyondpbx.processing_watermarks (name, last_id) VALUES ('queue_calls', :id)"),
+               {"id": watermark})
+
+
+@pytest.mark.parametrize("watermark", [0, 5, 8, 13, 15])
+def test_totals_include_events_past_the_watermark(db, watermark):
+    start = datetime.now() - timedelta(minutes=5)
+    load_events(db, watermark, start)
+
+    by_queue, total = queue_call_totals(db, start - timedelta(minutes=1), sla_threshold=15, overall=True)
+
+    assert sorted(by_queue) == ["400", "401"]
+    q400, q401 = by_queue["400"], by_queue["401"]
+    assert (q400.entered, q400.answered, q400.abandoned, q400.timeout, q400.within_sla) == (4, 3, 0, 1, 1)
+    assert (q401.entered, q401.answered, q401.abandoned, q401.timeout, q401.within_sla) == (2, 1, 1, 0, 1)
+    assert q400.avg_wait == pytest.approx(80 / 3) and q400.wait_max == 50
+    # La conversación de la llamada transferida (B, 300s) no entra en la media
+    assert q400.avg_talk == 100 and q401.avg_talk == 60
+
+    # C pasó por las dos colas: cuenta una vez en el total
+    assert (total.entered, total.answered, total.abandoned, total.timeout, total.within_sla) == (5, 4, 1, 1, 2)
+    assert total.avg_wait == pytest.approx(85 / 4)
+    assert total.avg_talk == 80
+    assert queue_facts_stats()["pending_events"] == len(EVENTS) - watermark
+
+
+def test_start_date_filters_pending_calls(db):
+    start = datetime.now() - timedelta(minutes=5)
+    load_events(db, 8, start)
+
+    by_queue, _ = queue_call_totals(db, start + timedelta(seconds=12))
+
+    # Solo D y E entraron después del corte
+    assert {queue: calls.entered for queue, calls in by_queue.items()} == {"400": 1, "401": 1}
+
+
+def test_stale_job_falls_back_to_queuelog(db, monkeypatch):
+    start = datetime.now() - timedelta(minutes=5)
+    load_events(db, 5, start)
+
+    monkeypatch.setattr(queue_facts, "QUEUE_CALLS_MAX_LAG", 60)
+    assert queue_call_totals(db, start) is None
+    stats = queue_facts_stats()
+    assert stats["stale"] and stats["lag_seconds"] >= 290
+
+    monkeypatch.setattr(queue_facts, "QUEUE_CALLS_MAX_LAG", 3600)
+    monkeypatch.setattr(queue_facts, "QUEUE_CALLS_MAX_PENDING", 5)
+    assert queue_call_totals(db, start) is None
+
+    monkeypatch.setattr(queue_facts, "QUEUE_CALLS_MAX_PENDING", 10)
+    assert queue_call_totals(db, start) is not None
+    assert not queue_facts_stats()["stale"]
+
+
+def test_not_ready_uses_queuelog(db, monkeypatch):
+    monkeypatch.setattr(queue_facts, "_caught_up", False)
+    assert queue_call_totals(db, datetime.now()) is None
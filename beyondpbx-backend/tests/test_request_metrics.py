@@ -0,0 +1,123 @@
+# tests/test_request_metrics.py
+"""
+Filas contadas por el middleware de métricas con consultas en streaming.
+
+pymysql deja rowcount = 2**64 - 1 en los cursores sin buffer (SSCursor); aquí
+se reproduce con una conexión SQLite cuyo cursor informa ese mismo valor.
+"""
+import sqlite3
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from services import request_metrics
+from services.request_metrics import MetricsMiddleware, MetricsRegistry, instrument_engine
+
+ROWS = 250
+UNBUFFERED_ROWCOUNT = 2 ** 64 - 1
+
+
+class UnbufferedCursor(sqlite3.Cursor):
+    """Cursor que informa el rowcount de un SSCursor de pymysql en los SELECT"""
+
+    @property
+    def rowcount(self):
+        return UNBUFFERED_ROWCOUNT if self.description is not None else super().rowcount
+
+
+class UnbufferedConnection(sqlite3.Connection):
+    def cursor(self, factory=UnbufferedCursor):
+        return super().cursor(factory)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine(
+        "sqlite://",
+        creator=lambda: sqlite3.connect(":memory:", factory=UnbufferedConnection, check_same_thread=False),
+        poolclass=StaticPool,
+    )
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE cdr (id INTEGER PRIMARY KEY, src TEXT)"))
+        conn.execute(text("INSERT INTO cdr (src) VALUES (:src)"), [{"src": str(i)} for i in range(ROWS)])
+    instrument_engine(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(request_metrics, "registry", registry)
+    return registry
+
+
+def _route_metrics(registry, path):
+    return next(data for data in registry.snapshot() if data["route"] == path)
+
+
+def test_streamed_select_counts_fetched_rows(engine, registry):
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/export")
+    def export():
+        def rows():
+            # Igual que /api/calls/export: stream_results y lectura por bloques
+            with engine.connect() as conn:
+                result = conn.execution_options(stream_results=True, max_row_buffer=50).execute(
+                    text("SELECT id, src FROM cdr ORDER BY id")
+                )
+                for partition in result.partitions(40):
+                    yield "".join(f"{row.id},{row.src}\n" for row in partition)
+        return StreamingResponse(rows(), media_type="text/csv")
+
+    response = TestClient(app).get("/export")
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == ROWS
+
+    data = _route_metrics(registry, "/export")
+    assert data["queries_sum"] == 1
+    assert data["rows"] == ROWS
+
+
+def test_orm_yield_per_counts_fetched_rows(engine, registry):
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/yield-per")
+    def yield_per():
+        with Session(engine) as db:
+            result = db.execute(text("SELECT id FROM cdr"), execution_options={"yield_per": 30})
+            return {"total": sum(1 for _ in result)}
+
+    response = TestClient(app).get("/yield-per")
+    assert response.json() == {"total": ROWS}
+    assert _route_metrics(registry, "/yield-per")["rows"] == ROWS
+
+
+def test_partial_fetch_counts_only_read_rows(engine, registry):
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/first")
+    def first():
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(text("SELECT id FROM cdr"))
+            rows = result.fetchmany(10)
+            result.close()
+            return {"ids": [row.id for row in rows]}
+
+    assert len(TestClient(app).get("/first").json()["ids"]) == 10
+    assert _route_metrics(registry, "/first")["rows"] == 10
+
+
+def test_queries_outside_requests_are_ignored(engine, registry):
+    with engine.connect() as conn:
+        assert len(conn.execute(text("SELECT id FROM cdr")).fetchall()) == ROWS
+    assert registry.snapshot() == []
@@ -0,0 +1,71 @@
+# tests/test_response_cache.py
+"""
+Límite de memoria de response_cache con valores que no son JSON: el tamaño
+de los histogramas y sketches se toma de `size`, no de su repr serializado.
+"""
+from collections import defaultdict
+
+from services.queue_histograms import WaitHistogram, histograms_nbytes
+from services.queue_sketches import METRICS, TimeSummary, sketches_nbytes
+from services.response_cache import ResponseCache, _estimate_size
+
+
+def histograms(queues: int):
+    return {str(400 + i): WaitHistogram() for i in range(queues)}
+
+
+def test_histograms_count_their_memory():
+    cache = ResponseCache(max_bytes=10 * 1024 * 1024)
+    value = histograms(5)
+
+    cache.get_or_load("hist", ("hist", "today"), 60, lambda: value, size=histograms_nbytes)
+
+    assert cache.stats()["bytes"] == histograms_nbytes(value)
+    assert cache.stats()["bytes"] > 5 * 2 * 8 * len(WaitHistogram().connect)
+
+
+def test_histograms_are_evicted_by_the_cap():
+    one_period = histograms_nbytes(histograms(5))
+    cache = ResponseCache(max_bytes=int(one_period * 2.5))
+
+    for period in ("today", "week", "month"):
+        cache.get_or_load("hist", ("hist", period), 60, lambda: histograms(5), size=histograms_nbytes)
+
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 1
+    assert stats["bytes"] <= cache.max_bytes
+
+
+def test_value_over_the_cap_is_not_stored():
+    cache = ResponseCache(max_bytes=histograms_nbytes(histograms(5)) - 1)
+    calls = []
+
+    def load():
+        calls.append(1)
+        return histograms(5)
+
+    for _ in range(2):
+        cache.get_or_load("hist", ("hist", "month"), 60, load, size=histograms_nbytes)
+
+    assert len(calls) == 2 and cache.stats()["entries"] == 0
+
+
+def test_json_values_keep_the_estimate():
+    cache = ResponseCache()
+    cache.get_or_load("json", ("json",), 60, lambda: {"queues": [1, 2, 3]})
+    assert cache.stats()["bytes"] == len('{"queues": [1, 2, 3]}')
+
+
+def test_sketches_count_their_memory():
+    summaries = defaultdict(lambda: defaultdict(TimeSummary))
+    for queue in ("400", "401", "402"):
+        for metric in METRICS:
+            for seconds in range(1, 2000, 3):
+                summaries[queue][metric].add(seconds)
+
+    cache = ResponseCache()
+    cache.get_or_load("sketch", ("sketch", "month"), 60, lambda: summaries, size=sketches_nbytes)
+
+    # Cientos de bins por sketch: el repr serializado apenas cuenta unos bytes por métrica
+    assert cache.stats()["bytes"] == sketches_nbytes(summaries)
+    assert cache.stats()["bytes"] > 20 * _estimate_size(summaries)
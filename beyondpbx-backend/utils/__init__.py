@@ -1,4 +1,9 @@
 # utils/__init__.py
-from .php_parser import unserialize_php, parse_sqlrealtime_data, calculate_sla_percentage
+from .php_parser import unserialize_php, unserialize_php_offsets, parse_sqlrealtime_data, calculate_sla_percentage
+from .cdr_utils import classify_destination, encode_cdr_cursor, decode_cdr_cursor
+from .destinations import ivr_destination_target, parse_ivr_destination, parse_route_destination, route_ivr_id
+from .ddsketch import DDSketch
 
-__all__ = ['unserialize_php', 'parse_sqlrealtime_data', 'calculate_sla_percentage']
+__all__ = ['unserialize_php', 'unserialize_php_offsets', 'parse_sqlrealtime_data', 'calculate_sla_percentage',
+           'classify_destination', 'encode_cdr_cursor', 'decode_cdr_cursor', 'parse_ivr_destination',
+           'parse_route_destination', 'ivr_destination_target', 'route_ivr_id', 'DDSketch']
@@ -0,0 +1,56 @@
+# utils/cdr_utils.py
+"""
+Utilidades para clasificar y resumir registros de asteriskcdrdb.cdr
+"""
+import base64
+import binascii
+import json
+import re
+from datetime import datetime
+from typing import Optional, Tuple
+
+_EXTENSION_PATTERN = re.compile(r'[0-9]{3,4}')
+
+
+def classify_destination(dst: Optional[str]) -> str:
+    """
+    Clasifica el destino de una llamada igual que el CASE del dashboard:
+    extensión de 3-4 dígitos, cola, IVR, entrada ('s') u otro.
+    LIKE en MySQL no distingue mayúsculas, por eso se compara en minúsculas.
+    """
+    if not dst:
+        return 'Otro'
+    
+    if _EXTENSION_PATTERN.fullmatch(dst):
+        return 'Extensión'
+    
+    dst_lower = dst.lower()
+    if 'queue' in dst_lower:
+        return 'Cola'
+    if 'ivr' in dst_lower:
+        return 'IVR'
+    if 's' in dst_lower:
+        return 'Entrada'
+    return 'Otro'
+
+
+def encode_cdr_cursor(calldate: datetime, cdr_id: int, direction: str = 'next') -> str:
+    """
+    Cursor opaco para paginar cdr por (calldate, id).
+    direction: 'next' (filas más antiguas) o 'prev' (filas más recientes)
+    """
+    payload = json.dumps({"t": calldate.isoformat(), "id": cdr_id, "d": direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cdr_cursor(cursor: str) -> Tuple[datetime, int, str]:
+    """Inverso de encode_cdr_cursor; lanza ValueError si el cursor no es válido"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        direction = payload.get("d", "next")
+        if direction not in ('next', 'prev'):
+            raise ValueError(direction)
+        return datetime.fromisoformat(payload["t"]), int(payload["id"]), direction
+    except (KeyError, TypeError, ValueError, UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
@@ -0,0 +1,84 @@
+# utils/ddsketch.py
+"""
+DDSketch: cuantiles aproximados con error relativo garantizado y mezclables.
+
+Cada valor positivo x cae en el bin k = ceil(log(x) / log(gamma)), con
+gamma = (1 + alpha) / (1 - alpha); cualquier cuantil se devuelve con un error
+relativo menor que alpha. Dos sketches se mezclan sumando sus bins, así que los
+sketches por cola y hora se combinan para cualquier período sin perder la
+garantía. Los valores <= 0 (esperas de 0 segundos) van a un contador aparte.
+
+    sketch = DDSketch()
+    sketch.add(12)
+    sketch.merge(DDSketch.from_json(texto_guardado))
+    sketch.quantile(0.9)
+"""
+import json
+import math
+import sys
+from typing import Dict, Optional
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+
+class DDSketch:
+    __slots__ = ("relative_accuracy", "gamma_log", "bins", "zero_count", "count")
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma_log = math.log((1 + relative_accuracy) / (1 - relative_accuracy))
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float, count: int = 1):
+        if value <= 0:
+            self.zero_count += count
+        else:
+            key = math.ceil(math.log(value) / self.gamma_log)
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.count += count
+
+    def merge(self, other: "DDSketch"):
+        """Suma los bins de otro sketch (debe tener la misma precisión)"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Solo se pueden mezclar sketches con la misma precisión")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Valor del cuantil q (0..1); None si el sketch está vacío"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                # Punto medio (en error relativo) del bin (gamma^(k-1), gamma^k]
+                return 2 * math.exp(key * self.gamma_log) / (1 + math.exp(self.gamma_log))
+        if not self.bins:
+            return 0.0
+        return 2 * math.exp(max(self.bins) * self.gamma_log) / (1 + math.exp(self.gamma_log))
+
+    def nbytes(self) -> int:
+        """Memoria aproximada del sketch (objeto, diccionario de bins y sus contadores)"""
+        return (sys.getsizeof(self) + sys.getsizeof(self.bins)
+                + sum(sys.getsizeof(count) for count in self.bins.values()))
+
+    def to_json(self) -> str:
+        return json.dumps({"a": self.relative_accuracy, "z": self.zero_count, "b": self.bins},
+                          separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, raw: str) -> "DDSketch":
+        data = json.loads(raw)
+        sketch = cls(data.get("a", DEFAULT_RELATIVE_ACCURACY))
+        sketch.zero_count = int(data.get("z", 0))
+        sketch.bins = {int(key): int(count) for key, count in data.get("b", {}).items()}
+        sketch.count = sketch.zero_count + sum(sketch.bins.values())
+        return sketch
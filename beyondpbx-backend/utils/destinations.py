@@ -0,0 +1,110 @@
+# utils/destinations.py
+"""
+Utilidades para interpretar los destinos que FreePBX guarda como texto
+(opciones de IVR, rutas entrantes)
+"""
+from typing import Optional, Tuple
+
+# Contexto del dialplan al que lleva cada tipo de destino ["tipo","dato"]
+IVR_DEST_CONTEXTS = {
+    "extension": "from-did-direct",
+    "queue": "ext-queues",
+}
+
+# Tipos de destino de las opciones de IVR: tipo -> etiqueta
+IVR_DEST_LABELS = {
+    "extension": "Extensión",
+    "queue": "Cola",
+    "ivr": "IVR",
+}
+
+
+def parse_ivr_destination(dest: Optional[str]) -> Tuple[str, str]:
+    """
+    Interpreta el destino de una opción de IVR.
+    FreePBX lo guarda con formato ["tipo","dato"]; cualquier otro texto se
+    muestra tal cual.
+    
+    Retorna (dest_type, dest_label)
+    """
+    if not dest:
+        return "unknown", "Desconocido"
+    
+    if not (dest.startswith('["') and dest.endswith('"]')):
+        return "unknown", dest
+    
+    parts = dest.strip('[]').replace('"', '').split(',', 1)
+    if len(parts) != 2:
+        return "unknown", dest
+    
+    dest_type, dest_data = parts
+    if dest_type == "hangup":
+        return "hangup", "Colgar"
+    label = IVR_DEST_LABELS.get(dest_type, dest_type)
+    return dest_type, f"{label} → {dest_data}"
+
+
+def ivr_destination_target(dest: Optional[str]) -> Optional[Tuple[str, str]]:
+    """
+    (contexto, extensión) del dialplan al que lleva una opción de IVR, que es
+    lo que queda en dcontext/dst del CDR de la llamada.
+    Acepta el formato de FreePBX "contexto,extensión,prioridad" y ["tipo","dato"].
+    Retorna None si el destino no se puede interpretar.
+    """
+    if not dest:
+        return None
+    if dest.startswith('["') and dest.endswith('"]'):
+        parts = dest.strip('[]').replace('"', '').split(',', 1)
+        if len(parts) != 2:
+            return None
+        dest_type, dest_data = parts
+        if dest_type == "hangup":
+            return "app-blackhole", "hangup"
+        if dest_type == "ivr":
+            return f"ivr-{dest_data}", "s"
+        context = IVR_DEST_CONTEXTS.get(dest_type)
+        return (context, dest_data) if context else None
+
+    parts = dest.split(',')
+    if len(parts) != 3 or not parts[0]:
+        return None
+    return parts[0], parts[1]
+
+
+def route_ivr_id(destination: Optional[str]) -> Optional[int]:
+    """
+    ID del IVR al que va una ruta entrante ("ivr-3,s,1" en FreePBX o "app-ivr/3"),
+    o None si la ruta va a otro destino.
+    """
+    destination = destination or ""
+    if destination.startswith("ivr-"):
+        ivr_id = destination[4:].split(',', 1)[0]
+    elif destination.startswith("app-ivr/"):
+        ivr_id = destination[8:]
+    else:
+        return None
+    return int(ivr_id) if ivr_id.isdigit() else None
+
+
+# Contextos de destino de las rutas entrantes: contexto -> etiqueta
+ROUTE_DEST_LABELS = {
+    "from-did-direct": "Extensión",
+    "app-ivr": "IVR",
+    "app-queue": "Cola",
+}
+
+
+def parse_route_destination(destination: Optional[str]) -> Tuple[str, str, str]:
+    """
+    Interpreta el destino de una ruta entrante (formato contexto/dato).
+    
+    Retorna (dest_type, dest_data, dest_label)
+    """
+    destination = destination or ""
+    parts = destination.split('/', 1)
+    if len(parts) != 2:
+        return "desconocido", destination, destination
+    
+    dest_type, dest_data = parts
+    label = ROUTE_DEST_LABELS.get(dest_type, dest_type)
+    return dest_type, dest_data, f"{label} → {dest_data}"
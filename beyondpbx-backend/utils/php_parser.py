@@ -1,52 +1,218 @@
 # utils/php_parser.py
 """
 Utilidades para parsear datos serializados de PHP
+
+Dos caminos:
+- Arrays planos con llaves string (la forma de las filas de qstats.sqlrealtime):
+  un solo findall de una regex precompilada, que corre en C, y una comprobación
+  de la longitud declarada de cada string. Cubre s:, i:, d:, b: y N; como valores.
+- Todo lo demás (arrays anidados, llaves enteras, objetos O:, strings con ';' o
+  '{'): un parser por offsets sobre los bytes que sigue las longitudes que PHP
+  escribe antes de cada string (s:N:"..."). Se puede usar directamente con
+  unserialize_php_offsets().
+
+Los dos caminos dan el mismo resultado para la misma entrada, sea str o bytes.
 """
 import re
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple, Union
+
+# Códigos de tipo como enteros (data[pos] sobre bytes)
+_STRING, _INT, _DOUBLE, _BOOL, _NULL, _ARRAY, _OBJECT = b"sidbNaO"
+_COLON, _SEMICOLON, _QUOTE, _OPEN, _CLOSE = b":;\"{}"
+
+
+def _read_value(data: bytes, pos: int) -> Tuple[Any, int]:
+    """Lee un valor que empieza en pos; devuelve (valor, offset siguiente)"""
+    kind = data[pos]
+
+    if kind == _NULL:
+        if data[pos + 1] != _SEMICOLON:
+            raise ValueError(f"Se esperaba ';' en {pos + 1}")
+        return None, pos + 2
+
+    if data[pos + 1] != _COLON:
+        raise ValueError(f"Se esperaba ':' en {pos + 1}")
+
+    if kind == _STRING:
+        # s:<bytes>:"<texto>";  la longitud es en bytes, no en caracteres
+        colon = data.index(b":", pos + 2)
+        start = colon + 2
+        end = start + int(data[pos + 2:colon])
+        if data[colon + 1] != _QUOTE or data[end] != _QUOTE or data[end + 1] != _SEMICOLON:
+            raise ValueError(f"String mal formado en {pos}")
+        return data[start:end].decode(), end + 2
+
+    if kind == _INT:
+        end = data.index(b";", pos + 2)
+        return int(data[pos + 2:end]), end + 1
+
+    if kind == _DOUBLE:
+        # float() acepta también INF, -INF y NAN tal como los escribe PHP
+        end = data.index(b";", pos + 2)
+        return float(data[pos + 2:end]), end + 1
+
+    if kind == _BOOL:
+        if data[pos + 3] != _SEMICOLON:
+            raise ValueError(f"Booleano mal formado en {pos}")
+        return data[pos + 2] == 49, pos + 4  # b"1"
+
+    if kind == _OBJECT:
+        # O:<len>:"<clase>":<n>:{...}  -> se devuelven solo las propiedades
+        colon = data.index(b":", pos + 2)
+        pos = colon + 2 + int(data[pos + 2:colon]) + 1
+        if data[pos] != _COLON:
+            raise ValueError(f"Objeto mal formado en {pos}")
+        return _read_array(data, pos + 1)
+
+    if kind == _ARRAY:
+        return _read_array(data, pos + 2)
+
+    raise ValueError(f"Tipo PHP no soportado '{chr(kind)}' en {pos}")
+
+
+def _read_array(data: bytes, pos: int) -> Tuple[Dict[Any, Any], int]:
+    """Lee <n>:{llave;valor;...} desde pos"""
+    index = data.index
+    colon = index(b":", pos)
+    count = int(data[pos:colon])
+    if data[colon + 1] != _OPEN:
+        raise ValueError(f"Se esperaba '{{' en {colon + 1}")
+    pos = colon + 2
+
+    result: Dict[Any, Any] = {}
+    for _ in range(count):
+        # Camino rápido para llaves s:/i: y valores s:/i:, que son casi todo el payload
+        kind = data[pos]
+        if kind == _STRING and data[pos + 1] == _COLON:
+            colon = index(b":", pos + 2)
+            end = colon + 2 + int(data[pos + 2:colon])
+            if data[colon + 1] != _QUOTE or data[end] != _QUOTE or data[end + 1] != _SEMICOLON:
+                raise ValueError(f"String mal formado en {pos}")
+            key = data[colon + 2:end].decode()
+            pos = end + 2
+        elif kind == _INT and data[pos + 1] == _COLON:
+            end = index(b";", pos + 2)
+            key = int(data[pos + 2:end])
+            pos = end + 1
+        else:
+            raise ValueError(f"Llave de array inválida en {pos}")
+
+        kind = data[pos]
+        if kind == _INT and data[pos + 1] == _COLON:
+            end = index(b";", pos + 2)
+            result[key] = int(data[pos + 2:end])
+            pos = end + 1
+        elif kind == _STRING and data[pos + 1] == _COLON:
+            colon = index(b":", pos + 2)
+            end = colon + 2 + int(data[pos + 2:colon])
+            if data[colon + 1] != _QUOTE or data[end] != _QUOTE or data[end + 1] != _SEMICOLON:
+                raise ValueError(f"String mal formado en {pos}")
+            result[key] = data[colon + 2:end].decode()
+            pos = end + 2
+        else:
+            result[key], pos = _read_value(data, pos)
 
+    if data[pos] != _CLOSE:
+        raise ValueError(f"Se esperaba '}}' en {pos}")
+    return result, pos + 1
 
-def unserialize_php(data: str) -> Dict[str, Any]:
+
+_FLAT_HEAD = re.compile(r'a:(\d+):\{')
+# El primer grupo es el par completo, para comprobar que los pares cubren todo el array
+_FLAT_PAIR = re.compile(
+    r'(s:(\d+):"([^"]*)";(?:i:(-?\d+);|s:(\d+):"([^"]*)";|d:([^;"]+);|b:([01]);|(N);))'
+)
+_LENGTHS = {length: str(length) for length in range(1024)}
+
+
+def _unserialize_flat(data: str) -> Optional[Dict[str, Any]]:
+    """
+    Array plano con llaves string, o None si el payload no tiene esa forma.
+
+    Las strings se delimitan por comillas y después se comprueba que midan lo
+    que declara su prefijo s:<bytes>:, y los pares encontrados tienen que ir
+    seguidos y cubrir el array entero hasta la '}' final. Con eso se lee
+    exactamente lo mismo que el parser por offsets; si algo no cuadra (un par
+    que la regex no reconoce, un array anidado, un texto con comillas, una
+    longitud distinta, bytes sobrantes, una '{' dentro de un texto) se devuelve
+    None y decide ese parser.
+    """
+    head = _FLAT_HEAD.match(data)
+    # Un array anidado tiene más de una '{': se descarta sin recorrerlo con la regex
+    if head is None or data[-1] != "}" or data.count("{") != 1:
+        return None
+    pairs = _FLAT_PAIR.findall(data, head.end())
+    if len(pairs) != int(head.group(1)):
+        return None
+
+    # En ASCII la longitud en caracteres ya es la longitud en bytes. Se compara
+    # contra el texto del prefijo para no llamar a int() en cada string; las
+    # longitudes fuera de la tabla (o con ceros a la izquierda) van al parser
+    # por offsets.
+    ascii_only = data.isascii()
+    lengths = _LENGTHS
+    span = head.end() + 1  # cabecera y '}'
+    result: Dict[str, Any] = {}
+    for pair, key_len, key, int_value, str_len, str_value, double_value, bool_value, null in pairs:
+        span += len(pair)
+        if lengths.get(len(key) if ascii_only else len(key.encode())) != key_len:
+            return None
+        if int_value:
+            result[key] = int(int_value)
+        elif str_len:
+            if lengths.get(len(str_value) if ascii_only else len(str_value.encode())) != str_len:
+                return None
+            result[key] = str_value
+        elif double_value:
+            try:
+                result[key] = float(double_value)
+            except ValueError:
+                return None
+        elif bool_value:
+            result[key] = bool_value == "1"
+        else:
+            result[key] = None
+    if span != len(data):
+        return None
+    return result
+
+
+def unserialize_php(data: Union[str, bytes]) -> Dict[Any, Any]:
     """
-    Parsea datos serializados en formato PHP
-    Soporta arrays asociativos básicos
+    Parsea datos serializados en formato PHP (equivalente a unserialize())
     
     Ejemplo de entrada PHP serializada:
     a:3:{s:14:"TOTAL_RECEIVED";i:11;s:14:"TOTAL_ANSWERED";i:11;s:15:"TOTAL_ABANDONED";i:0;}
     
-    Retorna un diccionario Python
+    Retorna un diccionario Python (los arrays anidados también son diccionarios,
+    con llaves int o str como en PHP). Si el dato está mal formado o no es un
+    array, retorna {}.
     """
-    if not data or not isinstance(data, str):
+    if isinstance(data, str) and data:
+        flat = _unserialize_flat(data)
+        if flat is not None:
+            return flat
+    return unserialize_php_offsets(data)
+
+
+def unserialize_php_offsets(data: Union[str, bytes]) -> Dict[Any, Any]:
+    """
+    Igual que unserialize_php pero siempre con el parser por offsets, sin el
+    camino rápido de arrays planos.
+    """
+    if not data:
+        return {}
+    if isinstance(data, str):
+        # Las longitudes de PHP son en bytes: se trabaja sobre la versión UTF-8
+        data = data.encode("utf-8")
+    elif not isinstance(data, (bytes, bytearray)):
         return {}
-    
-    result = {}
     
     try:
-        # Patrón para encontrar pares clave-valor
-        # s:longitud:"clave";i:valor;
-        # s:longitud:"clave";s:longitud:"valor";
-        pattern = r's:(\d+):"([^"]+)";(?:i:(\d+)|s:(\d+):"([^"]*)")'
-        
-        matches = re.findall(pattern, data)
-        
-        for match in matches:
-            key_len, key, int_val, str_len, str_val = match
-            
-            # Validar longitud de clave
-            if len(key) != int(key_len):
-                continue
-            
-            # Determinar si es entero o string
-            if int_val:
-                result[key] = int(int_val)
-            elif str_val is not None:
-                if str_len and len(str_val) != int(str_len):
-                    continue
-                result[key] = str_val
-        
-        return result
+        value, _ = _read_value(data, 0)
+        return value if isinstance(value, dict) else {}
         
-    except Exception as e:
+    except (ValueError, IndexError) as e:  # UnicodeDecodeError es un ValueError
         print(f"Error parseando datos PHP: {str(e)}")
         return {}
 
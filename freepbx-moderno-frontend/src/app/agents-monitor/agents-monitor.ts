@@ -312,29 +312,42 @@ export class AgentsMonitorComponent implements OnInit, OnDestroy, AfterViewInit
   }
 
   /**
-   * Auto-refresh cada 10 segundos
+   * Actualización en vivo por el canal push (SSE); si no está disponible,
+   * auto-refresh cada 10 segundos
    */
   startAutoRefresh(): void {
+    this.updateSubscription = this.api.streamAgentsRealtimeStatus().subscribe({
+      next: (data) => this.applyRealtimeStatus(data),
+      error: (err) => {
+        console.warn('Canal push no disponible, usando polling:', err);
+        this.startPolling();
+      }
+    });
+  }
+
+  private startPolling(): void {
     this.updateSubscription = interval(this.refreshInterval * 1000)
       .pipe(
         switchMap(() => this.api.getAgentsRealtimeStatus())
       )
       .subscribe({
-        next: (data) => {
-          if (data) {
-            this.agents = data.agents || [];
-            this.agentsByQueues = data.queues || [];
-            this.summary = data.summary || this.summary;
-            this.lastUpdate = new Date();
-            this.cdr.detectChanges();
-          }
-        },
+        next: (data) => this.applyRealtimeStatus(data),
         error: (err) => {
           console.error('Error en auto-refresh:', err);
         }
       });
   }
 
+  private applyRealtimeStatus(data: any): void {
+    if (data) {
+      this.agents = data.agents || [];
+      this.agentsByQueues = data.queues || [];
+      this.summary = data.summary || this.summary;
+      this.lastUpdate = new Date();
+      this.cdr.detectChanges();
+    }
+  }
+
   stopAutoRefresh(): void {
     if (this.updateSubscription) {
       this.updateSubscription.unsubscribe();
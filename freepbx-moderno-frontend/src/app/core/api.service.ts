@@ -24,6 +24,23 @@ export class ApiService {
     return this.http.get<any>(`${this.baseUrl}/calls/detailed?period=${period}&page=${page}&size=${size}`);
   }
 
+  // URL de descarga directa: el backend envía el archivo en streaming
+  getCallsExportUrl(
+    startDate: string,
+    endDate?: string,
+    format: 'csv' | 'ndjson' = 'csv',
+    gzip: boolean = false
+  ): string {
+    let params = new HttpParams()
+      .set('start_date', startDate)
+      .set('format', format)
+      .set('gzip', String(gzip));
+    if (endDate) {
+      params = params.set('end_date', endDate);
+    }
+    return `${this.baseUrl}/calls/export?${params.toString()}`;
+  }
+
   getCallsByPeriod(
     period: 'today' | 'week' | 'month' | 'year' = 'month',
     page: number = 1,
@@ -77,6 +94,34 @@ export class ApiService {
     return this.http.get<any>(`${this.baseUrl}/dashboard/advanced-charts`, { params });
   }
 
+  getCallsHeatmap(filters?: {
+    startDate?: string,
+    endDate?: string,
+    queue?: string,
+    did?: string,
+    disposition?: string
+  }): Observable<any> {
+    let params = new HttpParams();
+
+    if (filters?.startDate) {
+      params = params.set('start_date', filters.startDate);
+    }
+    if (filters?.endDate) {
+      params = params.set('end_date', filters.endDate);
+    }
+    if (filters?.queue) {
+      params = params.set('queue', filters.queue);
+    }
+    if (filters?.did) {
+      params = params.set('did', filters.did);
+    }
+    if (filters?.disposition) {
+      params = params.set('disposition', filters.disposition);
+    }
+
+    return this.http.get<any>(`${this.baseUrl}/dashboard/heatmap`, { params });
+  }
+
   getIvrs(): Observable<any[]> {
     return this.http.get<any[]>(`${this.baseUrl}/ivrs`);
   }
@@ -85,6 +130,13 @@ export class ApiService {
     return this.http.get<any[]>(`${this.baseUrl}/incoming-routes`);
   }
 
+  getIncomingRoutesStats(days: number = 30, dailyDays: number = 7): Observable<any> {
+    const params = new HttpParams()
+      .set('days', String(days))
+      .set('daily_days', String(dailyDays));
+    return this.http.get<any>(`${this.baseUrl}/incoming-routes/stats`, { params });
+  }
+
   getRouteDetail(routeNumber: string): Observable<any> {
     return this.http.get<any>(`${this.baseUrl}/incoming-routes/${routeNumber}`);
   }
@@ -106,6 +158,25 @@ export class ApiService {
     return this.http.get<any>(`${this.baseUrl}/dashboard/queue-sla?period=${backendPeriod}&sla_threshold=${slaThreshold}`);
   }
 
+  // Curva de SLA y abandono por umbral (0, step, ... maxSeconds) sobre los histogramas de espera
+  getQueueSLACurve(period: 'today' | 'week' | 'month' | 'year' = 'today', maxSeconds: number = 120, step: number = 5): Observable<any> {
+    const backendPeriod = period === 'year' ? 'month' : period;
+    const params = new HttpParams()
+      .set('period', backendPeriod)
+      .set('max_seconds', String(maxSeconds))
+      .set('step', String(step));
+    return this.http.get<any>(`${this.baseUrl}/dashboard/queue-sla/curve`, { params });
+  }
+
+  // Percentiles de espera, conversación y timbrado por cola (p. ej. [50, 90, 99])
+  getQueuePercentiles(period: 'today' | 'week' | 'month' | 'year' = 'today', percentiles: number[] = [50, 90, 99]): Observable<any> {
+    const backendPeriod = period === 'year' ? 'month' : period;
+    const params = new HttpParams()
+      .set('period', backendPeriod)
+      .set('percentiles', percentiles.join(','));
+    return this.http.get<any>(`${this.baseUrl}/dashboard/queue-percentiles`, { params });
+  }
+
   getActiveCalls(): Observable<any> {
     return this.http.get<any>(`${this.baseUrl}/dashboard/active-calls`);
   }
@@ -118,6 +189,64 @@ export class ApiService {
     return this.http.get<any>(`${this.baseUrl}/asternic/agents/realtime-status`);
   }
 
+  /**
+   * Canal push (Server-Sent Events) del monitor de agentes.
+   * Emite el estado completo (misma forma que getAgentsRealtimeStatus) combinando
+   * el snapshot inicial con los deltas que envía el servidor.
+   */
+  streamAgentsRealtimeStatus(): Observable<any> {
+    return new Observable<any>(observer => {
+      const source = new EventSource(`${this.baseUrl}/asternic/agents/realtime-stream`);
+      let state: any = null;
+
+      source.addEventListener('snapshot', (event: MessageEvent) => {
+        state = JSON.parse(event.data);
+        observer.next(state);
+      });
+
+      source.addEventListener('delta', (event: MessageEvent) => {
+        if (!state) {
+          return;
+        }
+        const delta = JSON.parse(event.data);
+        const agents = new Map<string, any>(state.agents.map((a: any) => [a.extension, a]));
+        (delta.removed || []).forEach((extension: string) => agents.delete(extension));
+        (delta.agents || []).forEach((agent: any) => agents.set(agent.extension, agent));
+
+        const merged = Array.from(agents.values())
+          .sort((a, b) => String(a.extension).localeCompare(String(b.extension)));
+        state = {
+          ...state,
+          agents: merged,
+          queues: this.groupAgentsByQueue(merged),
+          summary: delta.summary ?? state.summary,
+          timestamp: delta.timestamp
+        };
+        observer.next(state);
+      });
+
+      source.onerror = () => {
+        // EventSource reintenta solo; si se cerró definitivamente se avisa para volver al polling
+        if (source.readyState === EventSource.CLOSED) {
+          observer.error(new Error('Canal push cerrado'));
+        }
+      };
+
+      return () => source.close();
+    });
+  }
+
+  private groupAgentsByQueue(agents: any[]): any[] {
+    const queues = new Map<string, any>();
+    agents.forEach(agent => {
+      if (!queues.has(agent.queue)) {
+        queues.set(agent.queue, { queue: agent.queue, queueName: agent.queueName, agents: [] });
+      }
+      queues.get(agent.queue).agents.push(agent);
+    });
+    return Array.from(queues.values());
+  }
+
   getAgentDetails(extension: string): Observable<any> {
     return this.http.get<any>(`${this.baseUrl}/asternic/agents/${extension}/details`);
   }